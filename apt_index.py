@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import os
+import gzip
+import lzma
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+from email.utils import formatdate
+from debpkg import parse_control, version_key
+
+INDEX_FILES = ("Packages", "Packages.gz", "Packages.xz")
+# Index generations kept under by-hash/ for clients that fetched an older Release
+BY_HASH_KEEP = 3
+
+def stanza(control, filename, size, md5, sha256):
+    """Packages stanza: the control fields plus where to fetch the file and its hashes."""
+    lines = [line.rstrip() for line in control.strip("\n").splitlines() if line.strip()]
+    location = [f"Filename: {filename}", f"Size: {size}", f"MD5sum: {md5}", f"SHA256: {sha256}"]
+    # dpkg-scanpackages puts these right before the Description
+    at = next((i for i, line in enumerate(lines) if line.startswith("Description:")), len(lines))
+    return "\n".join(lines[:at] + location + lines[at:])
+
+def parse_packages(text):
+    """{Filename: stanza} of a Packages file"""
+    stanzas = {}
+    for block in text.split("\n\n"):
+        block = block.strip("\n")
+        if block:
+            stanzas[parse_control(block).get("Filename", "")] = block
+    return stanzas
+
+def _sort_key(block):
+    fields = parse_control(block)
+    return fields.get("Package", ""), version_key(fields.get("Version", "0")), fields.get("Filename", "")
+
+def _write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+class AptIndex:
+    """
+    Flat APT repository index (Packages, Packages.gz/.xz, Release) in
+    index_dir for the packages in pool_dir.
+
+    Publishing or removing a package only adds or drops its stanza; the
+    .deb hashes come from the catalog, so no package is re-read. New index
+    files are also written under by-hash/SHA256/ before Release is swapped
+    in, so a client always finds the exact files its Release lists.
+    """
+
+    def __init__(self, index_dir, pool_dir, catalog, location="published"):
+        self.index_dir = index_dir
+        self.pool_dir = pool_dir
+        self.catalog = catalog
+        self.location = location
+
+    def _stanza_for(self, filename):
+        row = self.catalog.get(self.location, filename)
+        if row is None or row["error"]:
+            raise ValueError(f"Cannot index {filename}: {row['error'] if row else 'not in the catalog'}")
+        md5, sha256 = self.catalog.hashes(self.location, filename, self.pool_dir)
+        relpath = os.path.relpath(os.path.join(self.pool_dir, filename), self.index_dir)
+        return relpath, stanza(row["control"], relpath, row["size"], md5, sha256)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.index_dir, "Packages")) as f:
+                return parse_packages(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def update(self, added=(), removed=()):
+        """Add/replace the stanzas of added and drop those of removed (file names in the pool)."""
+        with self._lock():
+            stanzas = self._load()
+            for filename in removed:
+                stanzas.pop(os.path.relpath(os.path.join(self.pool_dir, filename), self.index_dir), None)
+            for filename in added:
+                relpath, block = self._stanza_for(filename)
+                stanzas[relpath] = block
+            self._publish(stanzas)
+        logging.info(f"APT index updated: +{len(added)} -{len(removed)}, {len(stanzas)} package(s)")
+
+    def rebuild(self):
+        """Regenerate the index from every package in the catalog (hashes are still cached)."""
+        with self._lock():
+            stanzas = dict(self._stanza_for(row["filename"]) for row in self.catalog.packages(self.location)
+                           if not row["error"])
+            self._publish(stanzas)
+        logging.info(f"APT index rebuilt with {len(stanzas)} package(s)")
+        return len(stanzas)
+
+    @contextmanager
+    def _lock(self):
+        """flock held while the index is rewritten, so concurrent repoctl runs do not lose stanzas"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, ".index.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _publish(self, stanzas):
+        text = "\n\n".join(sorted(stanzas.values(), key=_sort_key))
+        packages = (text + "\n").encode() if text else b""
+        contents = {
+            "Packages": packages,
+            "Packages.gz": gzip.compress(packages, compresslevel=9, mtime=0),
+            "Packages.xz": lzma.compress(packages, preset=6),
+        }
+        sums = {name: (len(data), hashlib.md5(data).hexdigest(), hashlib.sha256(data).hexdigest())
+                for name, data in contents.items()}
+
+        by_hash = os.path.join(self.index_dir, "by-hash", "SHA256")
+        os.makedirs(by_hash, exist_ok=True)
+        for name, data in contents.items():
+            target = os.path.join(by_hash, sums[name][2])
+            if not os.path.exists(target):
+                os.replace(_write(target, data), target)
+
+        release = [f"Date: {formatdate(usegmt=True)}", "Acquire-By-Hash: yes", "MD5Sum:"]
+        release += [f" {md5} {size:>16} {name}" for name, (size, md5, _) in sums.items()]
+        release.append("SHA256:")
+        release += [f" {sha256} {size:>16} {name}" for name, (size, _, sha256) in sums.items()]
+
+        # Index files first, Release last: until then clients see the old generation
+        pending = [(_write(os.path.join(self.index_dir, name), data), name) for name, data in contents.items()]
+        pending.append((_write(os.path.join(self.index_dir, "Release"), ("\n".join(release) + "\n").encode()),
+                        "Release"))
+        for tmp_path, name in pending:
+            os.replace(tmp_path, os.path.join(self.index_dir, name))
+        self._prune_by_hash(by_hash, {sha256 for _, _, sha256 in sums.values()})
+
+    def _prune_by_hash(self, by_hash, current):
+        """Keep the files of the last BY_HASH_KEEP generations."""
+        entries = sorted(((os.path.getmtime(os.path.join(by_hash, name)), name) for name in os.listdir(by_hash)
+                          if not name.endswith(".tmp")), reverse=True)
+        for _, name in entries[BY_HASH_KEEP * len(INDEX_FILES):]:
+            if name not in current:
+                os.remove(os.path.join(by_hash, name))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from debpkg import restamp as restamp_control
+
+ARTIFACT_DIR = "/opt/repo-watcher/artifacts"
+ARTIFACT_INDEX = "/opt/repo-watcher/state/artifacts.json"
+
+def control_version(version):
+    """Same mapping control.j2 applies: versions not starting with a digit become 1.0.0"""
+    return re.sub(r"^([^0-9].*)", "1.0.0", version)
+
+def hash_role_inputs(pipeline_dir, exporter, extravars, playbook):
+    """
+    Digest of everything besides the source tree that shapes the package:
+    the playbook the runner runs (its path under project_dir), the roles it
+    runs for this exporter and the extravars (minus the per-build version
+    and paths).
+    """
+    h = hashlib.sha256()
+    paths = [("playbook", playbook)]
+    for role in ("common", exporter, "package-builder"):
+        role_dir = os.path.join(pipeline_dir, "roles", role)
+        for root, dirs, files in os.walk(role_dir):
+            dirs.sort()
+            paths.extend((os.path.relpath(os.path.join(root, name), pipeline_dir), os.path.join(root, name))
+                         for name in sorted(files))
+    for name, path in paths:
+        h.update(name.encode())
+        try:
+            with open(path, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        except FileNotFoundError:
+            h.update(b"missing")
+    ignored = {"version", "git_ref", "build_root", "staging_dir", "source_prepared", "build_date", "build_time"}
+    h.update(json.dumps({k: v for k, v in extravars.items() if k not in ignored}, sort_keys=True).encode())
+    return h.hexdigest()
+
+def artifact_key(tree, exporter, inputs_digest):
+    return hashlib.sha256(f"{exporter}\0{tree}\0{inputs_digest}".encode()).hexdigest()
+
+class ArtifactCache:
+    """
+    Packages already built, keyed by source tree + pipeline inputs.
+
+    Every successful build is hardlinked into ARTIFACT_DIR so it survives
+    repoctl removing or publishing the staged copy.
+    """
+
+    def __init__(self, index_path=ARTIFACT_INDEX, artifact_dir=ARTIFACT_DIR):
+        self.index_path = index_path
+        self.artifact_dir = artifact_dir
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable artifact index {self.index_path}: {e}")
+            return {}
+
+    def _save(self, index):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self._load().get(key)
+        if entry and os.path.exists(entry["path"]):
+            return entry
+        return None
+
+    def store(self, key, package_path, version, commit):
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        cached_path = os.path.join(self.artifact_dir, f"{key}.deb")
+        tmp_path = f"{cached_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(package_path, tmp_path)
+        except OSError:
+            shutil.copy2(package_path, tmp_path)
+        os.replace(tmp_path, cached_path)
+        with self.lock:
+            index = self._load()
+            index[key] = {"path": cached_path, "version": version, "commit": commit, "created": time.time()}
+            self._save(index)
+
+def restamp(cached_path, dest_path, version, git_ref):
+    """
+    Write cached_path to dest_path with the control Version (and the
+    Version/Commit line of the description) set for the new build.
+    Only the control member is rewritten, the payload is copied as is.
+    """
+    def edit(control):
+        control = re.sub(r"^Version: .*$", f"Version: {control_version(version)}", control, flags=re.M)
+        return re.sub(r"^ Version/Commit: .*$", f" Version/Commit: {git_ref}", control, flags=re.M)
+
+    restamp_control(cached_path, dest_path, edit)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from github_api import API_URL, GITHUB_TOKEN, REQUEST_TIMEOUT, ValidatorCache, validator_file_for
+from monitor import TAG_PAGE, get_repo_logger, handle_check_result, latest_tag, load_state
+from scheduler import get_scheduler
+from metrics import API_REQUESTS, record_poll
+
+DEFAULT_INTERVAL = 120
+MAX_CONCURRENT_REQUESTS = 20
+PIPELINE_WORKERS = 4
+
+class AsyncEngine:
+    """
+    Runs every repo watcher as a task on one event loop.
+
+    HTTP goes through a single aiohttp session with at most
+    MAX_CONCURRENT_REQUESTS requests in flight. Detected changes are queued
+    for the build workers from a thread pool, so the SQLite and state file
+    writes never stall the event loop. Validator caches are saved from the
+    same pool.
+    """
+
+    def __init__(self, configs, builds, max_concurrency=MAX_CONCURRENT_REQUESTS, pipeline_workers=PIPELINE_WORKERS):
+        self.configs = configs
+        self.builds = builds
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=pipeline_workers, thread_name_prefix="pipeline")
+        self.session = None
+        self.semaphore = None
+
+    async def read_result(self, r, url, cache, parse):
+        get_scheduler().update_rate_limit(r.headers)
+        API_REQUESTS.inc("rest", str(r.status))
+        r.raise_for_status()
+        result = parse(await r.json())
+        cache.store(url, r.headers, result)
+        return result
+
+    async def conditional_get(self, url, cache, parse):
+        """Async counterpart of github_api.conditional_get."""
+        async with self.semaphore:
+            async with self.session.get(url, headers=cache.headers_for(url)) as r:
+                if r.status != 304:
+                    return await self.read_result(r, url, cache, parse)
+                get_scheduler().update_rate_limit(r.headers)
+                API_REQUESTS.inc("rest", "304")
+                cached = cache.result_for(url)
+                if cached is not None:
+                    return cached
+            # Validators without a result should not happen, refetch unconditionally
+            async with self.session.get(url) as r:
+                return await self.read_result(r, url, cache, parse)
+
+    async def check_release(self, owner, repo, validators, logger):
+        try:
+            releases_url = f"{API_URL}/repos/{owner}/{repo}/releases/latest"
+            return tuple(await self.conditional_get(releases_url, validators,
+                                                    lambda data: [data["tag_name"], data.get("published_at", "unknown"), "release"]))
+        except aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                logger.info(f"[{owner}/{repo}] No releases found, checking tags instead")
+                try:
+                    tags_url = f"{API_URL}/repos/{owner}/{repo}/tags?per_page={TAG_PAGE}"
+                    tag = await self.conditional_get(
+                        tags_url, validators,
+                        lambda data: [latest_tag([t["name"] for t in data]), "unknown", "tag"] if data else None)
+                    if tag:
+                        return tuple(tag)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"[{owner}/{repo}] GitHub API Error: {e}")
+            else:
+                logger.error(f"[{owner}/{repo}] GitHub API Error: {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"[{owner}/{repo}] GitHub API Request Exception: {e}")
+        return None, None, None
+
+    async def check_commit(self, owner, repo, branch, validators, logger):
+        commits_url = f"{API_URL}/repos/{owner}/{repo}/commits?sha={branch}&per_page=1"
+        try:
+            return tuple(await self.conditional_get(commits_url, validators,
+                                                    lambda data: [data[0]["sha"], data[0]["commit"]["committer"]["date"]]))
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"[{owner}/{repo}] GitHub API HTTP Error (commit): {e}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"[{owner}/{repo}] GitHub API Request Exception (commit): {e}")
+        return None, None
+
+    async def watch(self, config):
+        owner = config["owner"]
+        repo = config["repo"]
+        branch = config.get("branch", "main")
+        interval = config.get("check_interval", DEFAULT_INTERVAL)
+        owner_repo_name = f"{owner}/{repo}"
+
+        loop = asyncio.get_running_loop()
+        logger = get_repo_logger(config)
+        scheduler = get_scheduler()
+        validators = ValidatorCache(validator_file_for(config["state_file"]))
+        state = load_state(config)
+        logger.info(f"[{owner_repo_name}] Starting async monitoring with check interval: {interval}s")
+
+        await asyncio.sleep(scheduler.register(owner_repo_name, interval))
+        while True:
+            outcome = "error"
+            started = loop.time()
+            try:
+                release, commit = await asyncio.gather(
+                    self.check_release(owner, repo, validators, logger),
+                    self.check_commit(owner, repo, branch, validators, logger),
+                )
+                if validators.dirty:
+                    # Writing the cache is file I/O too, only needed after a 200
+                    await loop.run_in_executor(self.executor, validators.save)
+                if release[0] == state["latest_release"] and commit[0] == state["latest_commit"]:
+                    outcome = handle_check_result(config, state, release, commit, self.builds, logger)
+                else:
+                    # Queueing the build writes to disk, keep it off the event loop
+                    outcome = await loop.run_in_executor(self.executor, handle_check_result,
+                                                         config, state, release, commit, self.builds, logger)
+            except Exception as e:
+                logger.error(f"[{owner_repo_name}] Error occurred: {e}")
+            record_poll(owner_repo_name, outcome, loop.time() - started)
+            scheduler.record_result(owner_repo_name, outcome)
+            await asyncio.sleep(scheduler.next_delay(owner_repo_name))
+
+    async def run(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        headers = {"Accept": "application/vnd.github+json"}
+        if GITHUB_TOKEN:
+            headers["Authorization"] = f"token {GITHUB_TOKEN}"
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+        async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+            self.session = session
+            logging.info(f"[Async] Watching {len(self.configs)} repos, max {self.max_concurrency} concurrent requests")
+            try:
+                await asyncio.gather(*(self.watch(config) for config in self.configs))
+            finally:
+                self.executor.shutdown(wait=False)
+
+def run_async(configs, builds):
+    asyncio.run(AsyncEngine(configs, builds).run())
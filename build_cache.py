@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import stat
+import shutil
+import logging
+import argparse
+import subprocess
+
+CACHE_ROOT = "/opt/repo-watcher/cache"
+
+# Size budgets per exporter, in bytes
+BUDGETS = {
+    "go-build": 4 * 1024 ** 3,
+    "go-mod": 2 * 1024 ** 3,
+    "ccache": 2 * 1024 ** 3,
+}
+
+def cache_dirs(exporter, cache_root=CACHE_ROOT):
+    return {name: os.path.join(cache_root, exporter, name) for name in BUDGETS}
+
+def _units(name, path):
+    """
+    What gets evicted as one piece: single files for the go build cache,
+    whole module@version directories (and download entries) for the module
+    cache. ccache evicts itself through CCACHE_MAXSIZE.
+    """
+    if name == "go-build":
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                if f not in ("README", "trim.txt"):
+                    yield os.path.join(root, f)
+    elif name == "go-mod":
+        for root, dirs, files in os.walk(path):
+            for d in list(dirs):
+                if "@" in d:
+                    dirs.remove(d)
+                    yield os.path.join(root, d)
+            if os.path.basename(root) == "@v":
+                for f in files:
+                    yield os.path.join(root, f)
+
+def _size_and_mtime(path):
+    if os.path.isdir(path):
+        total, newest = 0, os.path.getmtime(path)
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                st = os.lstat(os.path.join(root, f))
+                total += st.st_size
+                newest = max(newest, st.st_mtime)
+        return total, newest
+    st = os.lstat(path)
+    return st.st_size, st.st_mtime
+
+def _make_writable(func, path, exc_info):
+    # The module cache is read-only on purpose
+    os.chmod(os.path.dirname(path), stat.S_IRWXU)
+    os.chmod(path, stat.S_IRWXU)
+    func(path)
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, onerror=_make_writable)
+    else:
+        os.chmod(os.path.dirname(path), stat.S_IRWXU)
+        os.remove(path)
+
+def evict_lru(name, path, budget):
+    """Remove least recently used units until the cache fits its budget. Returns bytes freed."""
+    if not os.path.isdir(path):
+        return 0
+    units = []
+    for unit in _units(name, path):
+        try:
+            size, mtime = _size_and_mtime(unit)
+        except OSError:
+            continue
+        units.append((mtime, size, unit))
+    total = sum(size for _, size, _ in units)
+    if total <= budget:
+        return 0
+
+    freed = 0
+    for mtime, size, unit in sorted(units):
+        if total - freed <= budget:
+            break
+        try:
+            _remove(unit)
+            freed += size
+        except OSError as e:
+            logging.warning(f"Could not evict {unit}: {e}")
+    logging.info(f"Evicted {freed // 1024 ** 2} MiB from {path} (budget {budget // 1024 ** 2} MiB)")
+    return freed
+
+def enforce_budgets(exporter, cache_root=CACHE_ROOT):
+    for name, path in cache_dirs(exporter, cache_root).items():
+        if name != "ccache":
+            evict_lru(name, path, BUDGETS[name])
+
+def snapshot(exporter, cache_root=CACHE_ROOT):
+    """Go cache entries with their mtimes; zeroes the ccache counters."""
+    dirs = cache_dirs(exporter, cache_root)
+    entries = {}
+    for unit in _units("go-build", dirs["go-build"]):
+        try:
+            entries[unit] = os.path.getmtime(unit)
+        except OSError:
+            pass
+    if shutil.which("ccache") and os.path.isdir(dirs["ccache"]):
+        subprocess.run(["ccache", "--zero-stats"], env={**os.environ, "CCACHE_DIR": dirs["ccache"]},
+                       check=False, stdout=subprocess.DEVNULL)
+    return {"go-build": entries}
+
+def _ccache_stats(path):
+    if not shutil.which("ccache") or not os.path.isdir(path):
+        return None
+    result = subprocess.run(["ccache", "--print-stats"], env={**os.environ, "CCACHE_DIR": path},
+                            text=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    counters = {}
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition("\t")
+        if value.strip().isdigit():
+            counters[key] = int(value)
+    hits = counters.get("direct_cache_hit", 0) + counters.get("preprocessed_cache_hit", 0)
+    return {"hits": hits, "misses": counters.get("cache_miss", 0), "bytes": _size_and_mtime(path)[0]}
+
+def report(exporter, before, cache_root=CACHE_ROOT):
+    """
+    Hit/miss counts since snapshot(). For the Go build cache a miss is a new
+    entry and a hit an existing entry whose mtime moved; go only refreshes
+    mtimes once an hour, so Go hits are a lower bound.
+    """
+    dirs = cache_dirs(exporter, cache_root)
+    old = before.get("go-build", {})
+    hits = misses = 0
+    for unit in _units("go-build", dirs["go-build"]):
+        try:
+            mtime = os.path.getmtime(unit)
+        except OSError:
+            continue
+        if unit not in old:
+            misses += 1
+        elif mtime > old[unit]:
+            hits += 1
+
+    stats = {"go-build": {"hits": hits, "misses": misses, "entries": len(old) + misses}}
+    for name in ("go-build", "go-mod"):
+        stats.setdefault(name, {})["bytes"] = _size_and_mtime(dirs[name])[0] if os.path.isdir(dirs[name]) else 0
+    ccache = _ccache_stats(dirs["ccache"])
+    if ccache:
+        stats["ccache"] = ccache
+    return stats
+
+# ───────── CLI ENTRY POINT ─────────
+# Called by the build-cache role around each build
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage per-exporter build caches")
+    parser.add_argument("action", choices=["snapshot", "report", "evict"])
+    parser.add_argument("--exporter", required=True)
+    parser.add_argument("--cache-root", default=CACHE_ROOT)
+    parser.add_argument("--state", help="Snapshot file written by 'snapshot' and read by 'report'")
+    args = parser.parse_args()
+
+    if args.action == "evict":
+        enforce_budgets(args.exporter, args.cache_root)
+    elif args.action == "snapshot":
+        with open(args.state, "w") as f:
+            json.dump(snapshot(args.exporter, args.cache_root), f)
+    else:
+        with open(args.state) as f:
+            before = json.load(f)
+        print(json.dumps(report(args.exporter, before, args.cache_root)))
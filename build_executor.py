@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import atexit
+import shutil
+import logging
+import threading
+from job_queue import LEASE_SECONDS, JobQueue, worker_id
+from state_store import get_state_store
+from pipeline_timings import TaskTimer
+from metrics import BUILD_DURATION, BUILD_QUEUE_WAIT, BUILDS
+
+BUILD_ROOT = "/tmp/build"
+RUNS_DIR = "/opt/repo-watcher/runs"
+DEFAULT_BUILD_WORKERS = 4
+IDLE_POLL = 5
+HEARTBEAT_INTERVAL = LEASE_SECONDS / 5
+
+class BuildJob:
+    """A job claimed from the queue, with its isolated build directories."""
+
+    def __init__(self, row, owner):
+        self.id = row["id"]
+        self.event_type = row["event_type"]
+        self.value = row["value"]
+        self.config = row["config"]
+        self.exporter = row["exporter"]
+        self.name = row["repo"]
+        self.attempt = row["attempts"]
+        self.created = row["created"]
+        self.owner = owner
+        self.started = time.time()
+        self.result = None
+
+    @property
+    def build_root(self):
+        return os.path.join(BUILD_ROOT, f"{self.exporter}-{self.id}")
+
+    @property
+    def private_data_dir(self):
+        return os.path.join(RUNS_DIR, f"{self.exporter}-{self.id}")
+
+class BuildExecutor:
+    """
+    Worker threads that drain the durable job queue.
+
+    Every job gets its own build_root and ansible_runner private_data_dir.
+    Jobs for the same exporter still run one at a time, because the
+    exporter roles install into shared paths like /usr/bin; the queue only
+    hands out a job whose exporter has no live lease. Leases are renewed
+    by a heartbeat thread while a build runs.
+
+    Commit builds get at most commit_workers of the workers (all but one
+    by default), the rest stay free for release and tag builds.
+
+    A process with workers registers in the queue with the exporter globs
+    it builds, so several of them (build_worker.py, on any host sharing
+    the queue) can drain it together. With workers=0 it only enqueues.
+    """
+
+    def __init__(self, pipeline, workers=DEFAULT_BUILD_WORKERS, queue=None, store=None, commit_workers=None,
+                 exporters=("*", )):
+        self.pipeline = pipeline
+        self.workers = workers
+        self.commit_workers = commit_workers or max(1, workers - 1)
+        self.exporters = list(exporters)
+        self.queue = queue or JobQueue()
+        self.store = store or get_state_store()
+        self.cond = threading.Condition()
+        self.running = {}
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        recovered = self.queue.recover()
+        if recovered:
+            logging.info(f"Requeued {recovered} build(s) interrupted by the last shutdown")
+
+        self.threads = []
+        if not workers:
+            return
+        self.queue.register_worker(worker_id(), self.exporters, workers)
+        atexit.register(self.queue.unregister_worker, worker_id())
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, args=(worker_id(f"build-{i}"),), name=f"build-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        threading.Thread(target=self._heartbeat, name="build-heartbeat", daemon=True).start()
+
+    def submit(self, event_type, value, config):
+        """Queue a build for an event. Never blocks on the build itself."""
+        name = f"{config['owner'].lower()}/{config['repo'].lower()}"
+        job_id = self.queue.enqueue(event_type, value, config)
+        if job_id is None:
+            logging.info(f"[{name}] Build for {event_type} {value} is already queued")
+            return None
+        logging.info(f"[{name}] Queued build {job_id} for {event_type} {value}")
+        exporter = config["repo"].lower().replace('_', '-')
+        if not self.workers and not self.queue.can_build(exporter):
+            logging.warning(f"[{name}] No build worker for {exporter} is running, build {job_id} waits for one")
+        with self.cond:
+            self.cond.notify()
+        return job_id
+
+    def _worker(self, owner):
+        while True:
+            row = self.queue.claim(owner, commit_slots=self.commit_workers, exporters=self.exporters)
+            if row is None:
+                # Also wakes up for retries coming due and jobs enqueued by other processes
+                with self.cond:
+                    self.cond.wait(timeout=IDLE_POLL)
+                continue
+
+            job = BuildJob(row, owner)
+            wait = job.started - job.created
+            with self.cond:
+                self.running[job.id] = job
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            BUILD_QUEUE_WAIT.observe(wait, job.exporter)
+
+            logging.info(f"[{job.name}] Starting build {job.id} (attempt {job.attempt}) after waiting {wait:.1f}s")
+            error = None
+            timer = TaskTimer()
+            try:
+                job.result = self.pipeline(job.event_type, job.value, job.config, build_root=job.build_root,
+                                           private_data_dir=job.private_data_dir, timer=timer)
+            except Exception as e:
+                logging.error(f"[{job.name}] Build {job.id} crashed: {e}")
+                job.result = False
+                error = str(e)
+            finally:
+                self._cleanup(job)
+                status = self.queue.complete(job.id, owner, bool(job.result),
+                                             error=error or (None if job.result else "pipeline failed"))
+                duration = time.time() - job.started
+                logging.info(f"[{job.name}] Build {job.id} finished: {status}",
+                             extra={"repo": job.name, "event": "build", "status": status, "job_id": job.id,
+                                    "duration": round(duration, 3)})
+                self._record(job, error, timer.results())
+                result = "succeeded" if job.result else "failed"
+                BUILD_DURATION.observe(duration, job.exporter, result)
+                BUILDS.inc(job.exporter, result)
+                with self.cond:
+                    del self.running[job.id]
+                    self.completed += 1
+                    if not job.result:
+                        self.failed += 1
+                    # A finished exporter may unblock a queued job for it
+                    self.cond.notify_all()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            if not self.queue.worker_heartbeat(worker_id()):
+                # Dropped while this process was stalled, announce it again
+                self.queue.register_worker(worker_id(), self.exporters, self.workers)
+            with self.cond:
+                jobs = list(self.running.values())
+            for job in jobs:
+                if not self.queue.heartbeat(job.id, job.owner):
+                    logging.warning(f"[{job.name}] Lost the lease on build {job.id}")
+
+    def _record(self, job, error, tasks=()):
+        """Keep the outcome and task timings of every attempt in the state store."""
+        try:
+            self.store.record_build(job.id, job.attempt, job.name, job.event_type, job.value,
+                                    "succeeded" if job.result else "failed", job.started, worker=job.owner,
+                                    error=error or (None if job.result else "pipeline failed"),
+                                    exporter=job.exporter, tasks=tasks)
+        except Exception as e:
+            logging.warning(f"[{job.name}] Could not record build {job.id}: {e}")
+
+    def _cleanup(self, job):
+        shutil.rmtree(job.build_root, ignore_errors=True)
+        if job.result:
+            # Keep runner artifacts of failed builds for debugging
+            shutil.rmtree(job.private_data_dir, ignore_errors=True)
+
+    def stats(self):
+        now = time.time()
+        with self.cond:
+            started = self.completed + len(self.running)
+            stats = {
+                "workers": self.workers,
+                "running": {str(job.id): {"repo": job.name, "event": job.event_type, "value": job.value,
+                                          "running_for": round(now - job.started, 1)}
+                            for job in self.running.values()},
+                "avg_wait": round(self.total_wait / started, 1) if started else 0,
+                "max_wait": round(self.max_wait, 1),
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+        if not self.workers:
+            # Coordinator: the builds run in build_worker.py processes
+            stats["running"] = {str(job["id"]): {"repo": job["repo"], "event": job["event_type"], "value": job["value"],
+                                                 "running_for": round(now - job["started"], 1),
+                                                 "worker": job["lease_owner"]}
+                                for job in self.queue.running()}
+            stats["build_hosts"] = self.queue.workers()
+            stats["workers"] = sum(worker["slots"] for worker in stats["build_hosts"])
+        queue = self.queue.stats()
+        stats["queue_depth"] = queue["queued"]
+        stats["oldest_queued_wait"] = queue["oldest_queued_wait"]
+        stats["queue"] = queue
+        return stats
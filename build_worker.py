@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import glob
+import time
+import logging
+import argparse
+from monitor import STAGING_DIR, trigger_pipeline
+from job_queue import JOBS_DB, JobQueue
+from state_store import STATE_DB, StateStore
+from build_executor import DEFAULT_BUILD_WORKERS, BuildExecutor
+from promote import transfer
+from metrics import start_metrics_server, watch_builds
+from structured_log import setup_logging
+
+def upload(output_dir, staging_dir):
+    """Put the packages of output_dir into staging_dir, each through a temporary name and a rename."""
+    uploaded = []
+    for path in sorted(glob.glob(os.path.join(output_dir, "*.deb"))):
+        dest = os.path.join(staging_dir, os.path.basename(path))
+        method, copied = transfer(path, dest)
+        logging.info(f"Uploaded {os.path.basename(path)} to {staging_dir} ({method}, {copied // 1024} KiB copied)")
+        uploaded.append(dest)
+    return uploaded
+
+def remote_pipeline(staging_dir, cold=False):
+    """
+    trigger_pipeline for a build host: the package is built into the job's
+    own build root and only appears in the shared staging_dir complete.
+    """
+    def pipeline(event_type, value, config, build_root, private_data_dir, timer=None):
+        output_dir = os.path.join(build_root, "staging")
+        os.makedirs(output_dir, exist_ok=True)
+        if not trigger_pipeline(event_type, value, config, build_root=build_root,
+                                private_data_dir=private_data_dir, timer=timer, staging_dir=output_dir, cold=cold):
+            return False
+        if not upload(output_dir, staging_dir):
+            logging.warning(f"[{config['owner']}/{config['repo']}] Pipeline succeeded without producing a package")
+        return True
+    return pipeline
+
+# ───────── CLI ENTRY POINT ─────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build jobs queued by monitor.py/multi_monitor.py on this host")
+    parser.add_argument("--queue", default=JOBS_DB, help="Job queue database shared with the watcher")
+    parser.add_argument("--state-db", default=STATE_DB, help="State store the build history is recorded in")
+    parser.add_argument("--staging-dir", default=STAGING_DIR, help="Shared directory finished packages are uploaded to")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BUILD_WORKERS, help="Number of jobs built at once")
+    parser.add_argument("--exporters", nargs="+", default=["*"], metavar="GLOB",
+                        help="Exporters this host can build, e.g. node-exporter 'dcgm*'")
+    parser.add_argument("--cold", action="store_true", help="Gather facts and run every setup task on each build")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    setup_logging()
+    os.makedirs(args.staging_dir, exist_ok=True)
+    builds = BuildExecutor(remote_pipeline(args.staging_dir, args.cold), workers=args.workers, queue=JobQueue(args.queue),
+                           store=StateStore(args.state_db), exporters=args.exporters)
+    if args.metrics_port:
+        watch_builds(builds)
+        start_metrics_server(args.metrics_port)
+    logging.info(f"Building {', '.join(args.exporters)} with {args.workers} worker(s) from {args.queue}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
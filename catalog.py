@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import fnmatch
+import hashlib
+import sqlite3
+import logging
+from debpkg import DebError, read_control_member, parse_control, version_key
+
+CATALOG_DB = "/opt/repo-watcher/state/catalog.db"
+SORT_KEYS = ("name", "package", "version", "date")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    location TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    package TEXT,
+    version TEXT,
+    architecture TEXT,
+    control TEXT,
+    error TEXT,
+    indexed REAL NOT NULL,
+    md5 TEXT,
+    sha256 TEXT,
+    PRIMARY KEY (location, filename)
+);
+"""
+
+# Columns added after the first release of the catalog
+MIGRATIONS = {"md5": "ALTER TABLE packages ADD COLUMN md5 TEXT",
+              "sha256": "ALTER TABLE packages ADD COLUMN sha256 TEXT"}
+
+class Catalog:
+    """
+    Index of the .deb files in the staging and published dirs.
+
+    Control fields are parsed once per file version, straight from the
+    ar/tar members, and cached in SQLite keyed by (inode, size, mtime).
+    A refresh only stats the directory and re-parses what changed.
+    """
+
+    def __init__(self, path=CATALOG_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        columns = {row["name"] for row in self.db.execute("PRAGMA table_info(packages)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self.db.execute(statement)
+
+    def refresh(self, location, directory):
+        """Bring the rows for one directory up to date. Returns (parsed, removed)."""
+        known = {row["filename"]: (row["inode"], row["size"], row["mtime_ns"])
+                 for row in self.db.execute("SELECT filename, inode, size, mtime_ns FROM packages WHERE location = ?",
+                                            (location,))}
+        seen = set()
+        changed = []
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not entry.name.endswith(".deb") or not entry.is_file():
+                continue
+            seen.add(entry.name)
+            st = entry.stat()
+            if known.get(entry.name) != (st.st_ino, st.st_size, st.st_mtime_ns):
+                changed.append((entry, st))
+        removed = [name for name in known if name not in seen]
+        if not changed and not removed:
+            return 0, 0
+
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            for entry, st in changed:
+                self.db.execute("INSERT OR REPLACE INTO packages (location, filename, inode, size, mtime_ns, package, "
+                                "version, architecture, control, error, indexed) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (location, entry.name, st.st_ino, st.st_size, st.st_mtime_ns,
+                                 *_parse(entry.path), time.time()))
+            self.db.executemany("DELETE FROM packages WHERE location = ? AND filename = ?",
+                                [(location, name) for name in removed])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        logging.info(f"Catalog {location}: indexed {len(changed)}, dropped {len(removed)}")
+        return len(changed), len(removed)
+
+    def get(self, location, filename):
+        return self.db.execute("SELECT * FROM packages WHERE location = ? AND filename = ?",
+                               (location, filename)).fetchone()
+
+    def hashes(self, location, filename, directory):
+        """
+        (md5, sha256) of a cataloged file, computed once per file version.
+        A hardlinked copy in another location (same inode, size and mtime)
+        reuses the hashes of the original.
+        """
+        row = self.get(location, filename)
+        if row is None:
+            raise KeyError(f"{filename} is not in the {location} catalog")
+        if row["sha256"]:
+            return row["md5"], row["sha256"]
+        twin = self.db.execute("SELECT md5, sha256 FROM packages WHERE inode = ? AND size = ? AND mtime_ns = ? "
+                               "AND sha256 IS NOT NULL", (row["inode"], row["size"], row["mtime_ns"])).fetchone()
+        if twin:
+            md5, sha256 = twin["md5"], twin["sha256"]
+        else:
+            md5, sha256 = file_hashes(os.path.join(directory, filename))
+        self.db.execute("UPDATE packages SET md5 = ?, sha256 = ? WHERE location = ? AND filename = ? "
+                        "AND inode = ? AND size = ? AND mtime_ns = ?",
+                        (md5, sha256, location, filename, row["inode"], row["size"], row["mtime_ns"]))
+        return md5, sha256
+
+    def packages(self, location, package=None, version=None, sort="name", reverse=False):
+        """
+        Rows for a location. package and version are glob patterns
+        (e.g. 'dcgm*', '4.2.*'); sort is one of SORT_KEYS, versions sort
+        in Debian order.
+        """
+        rows = self.db.execute("SELECT filename, size, mtime_ns, package, version, architecture, error "
+                               "FROM packages WHERE location = ?", (location,)).fetchall()
+        if package:
+            rows = [r for r in rows if fnmatch.fnmatch(r["package"] or "", package)]
+        if version:
+            rows = [r for r in rows if fnmatch.fnmatch(r["version"] or "", version)]
+        if sort == "version":
+            rows.sort(key=lambda r: (version_key(r["version"] or "0"), r["filename"]))
+        elif sort == "package":
+            rows.sort(key=lambda r: (r["package"] or "", r["filename"]))
+        elif sort == "date":
+            rows.sort(key=lambda r: (r["mtime_ns"], r["filename"]))
+        else:
+            rows.sort(key=lambda r: r["filename"])
+        if reverse:
+            rows.reverse()
+        return rows
+
+def file_hashes(path):
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            md5.update(chunk)
+            sha256.update(chunk)
+    return md5.hexdigest(), sha256.hexdigest()
+
+def _parse(path):
+    """(package, version, architecture, control text, error) of a .deb"""
+    try:
+        name, files = read_control_member(path)
+        control = files["control"][0].decode("utf-8", "replace")
+    except (DebError, OSError) as e:
+        return None, None, None, None, str(e)
+    fields = parse_control(control)
+    return fields.get("Package"), fields.get("Version"), fields.get("Architecture"), control, None
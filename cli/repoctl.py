@@ -1,20 +1,24 @@
 import argparse
+import fnmatch
 import os
-import shutil
 import logging
 import json
-import subprocess
 import sys
 from datetime import datetime
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 from tools.reset_state import reset_state
+from catalog import SORT_KEYS, Catalog
+from apt_index import AptIndex
+from promote import DEFAULT_JOBS, plan, transfer_all
+from state_store import StateStore
+from pipeline_timings import flame, overhead, regressions, slowest_tasks
 
 # Resource: https://docs.python.org/3.11/howto/argparse.html#argparse-tutorial
 
-# Load config file 
-CONFIG_FILE = Path(__file__).resolve().parent.parent / "cli-config.json"
+# Load config file, REPOCTL_CONFIG points elsewhere (tests, a second repo)
+CONFIG_FILE = Path(os.environ.get("REPOCTL_CONFIG") or Path(__file__).resolve().parent.parent / "cli-config.json")
 if CONFIG_FILE.exists():
     with open(CONFIG_FILE) as f:
         cfg = json.load(f)
@@ -25,6 +29,12 @@ else:
 STAGING_DIR = cfg.get("staging_dir", "/opt/staging")
 REPO_DIR = cfg.get("repo_dir", "/opt/published")
 LOG_FILE = cfg.get("log_file", "/opt/repo-watcher/log/repoctl.log")
+# Package index, kept in the state dir next to the log dir
+CATALOG_DB = cfg.get("catalog_db", str(Path(LOG_FILE).parent.parent / "state" / "catalog.db"))
+# Watcher cursors, event history and build outcomes written by monitor.py
+STATE_DB = cfg.get("state_db", str(Path(LOG_FILE).parent.parent / "state" / "state.db"))
+# Packages/Release live one level above the pool, e.g. /var/www/html/airepo-dev
+INDEX_DIR = cfg.get("index_dir", str(Path(REPO_DIR).parent))
 
 # Ensure log directory and file exist
 log_path = Path(LOG_FILE)
@@ -38,61 +48,125 @@ logging.basicConfig(
     format='%(asctime)s [%(levelname)s] %(message)s'
 )
 
+# Package catalog, refreshed from a stat of both dirs on every call
+def get_catalog():
+    catalog = Catalog(CATALOG_DB)
+    catalog.refresh("staging", STAGING_DIR)
+    catalog.refresh("published", REPO_DIR)
+    return catalog
+
+def get_index(catalog):
+    return AptIndex(INDEX_DIR, REPO_DIR, catalog)
+
+def format_mtime(row):
+    return datetime.fromtimestamp(row["mtime_ns"] / 1e9).strftime("%Y-%m-%d %H:%M")
+
+def matching(catalog, location, pattern):
+    """Catalog rows whose file name is pattern, or matches it as a glob"""
+    row = catalog.get(location, pattern)
+    if row:
+        return [row]
+    return [r for r in catalog.packages(location) if fnmatch.fnmatch(r["filename"], pattern)]
+
 # List packages
-def list_package():
-    packages = [f for f in os.listdir(STAGING_DIR) if f.endswith(".deb")]
-    logging.info(f"Listed staged packages: {packages if packages else 'None'}")
+def list_package(package=None, version=None, sort="name", reverse=False):
+    rows = get_catalog().packages("staging", package=package, version=version, sort=sort, reverse=reverse)
+    logging.info(f"Listed staged packages: {len(rows)} found")
     print("Available .deb package(s) in staging:")
-    for f in packages:
-        print(f" - {f}")
+    for row in rows:
+        print(f" - {row['filename']:<50} {row['package'] or '?':<22} {row['version'] or '?':<30} {format_mtime(row)}")
 
 # View metadata of the packages
 def view_metadata(package_name):
-    pkg_path = os.path.join(STAGING_DIR, package_name)
-    if not os.path.exists(pkg_path):
+    rows = matching(get_catalog(), "staging", package_name)
+    if not rows:
         print(f"[ERROR] Package not found in staging: {package_name}")
         return
 
-    try:
-        output = subprocess.check_output(["dpkg-deb", "-I", pkg_path], text=True)
-        print(f"\nMetadata for {package_name}:\n")
-        print(output)
-        logging.info(f"Viewed metadata for {package_name}")
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] Failed to extract metadata: {e}")
-
-# Publish the package onto the repo
-def publish_package(package_name, check_mode=False):
-    src_path = os.path.join(STAGING_DIR, package_name)
-    dest_path = os.path.join(REPO_DIR, package_name)
-
-    if not os.path.exists(src_path):
-        print(f"[ERROR] Package not found in staging: {package_name}")
+    for row in rows:
+        if row["error"]:
+            print(f"[ERROR] Failed to extract metadata from {row['filename']}: {row['error']}")
+            continue
+        print(f"\nMetadata for {row['filename']}:\n")
+        print(f" size {row['size']} bytes, built {format_mtime(row)}")
+        for line in row["control"].splitlines():
+            print(f" {line}")
+        logging.info(f"Viewed metadata for {row['filename']}")
+
+# Select staged packages by file name/glob and catalog package/version globs
+def select_packages(catalog, patterns=(), package=None, version=None, latest=False):
+    rows = catalog.packages("staging", package=package, version=version, sort="version")
+    if patterns:
+        rows = [r for r in rows if any(fnmatch.fnmatch(r["filename"], p) for p in patterns)]
+    if latest:
+        # Highest version of each package; rows are sorted by version already
+        rows = list({r["package"] or r["filename"]: r for r in rows}.values())
+    return rows
+
+# Publish the package(s) onto the repo
+def publish_package(patterns, check_mode=False, package=None, version=None, latest=False, yes=False, jobs=DEFAULT_JOBS):
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    catalog = get_catalog()
+    rows = select_packages(catalog, patterns, package=package, version=version, latest=latest)
+    if not rows:
+        print(f"[ERROR] Package not found in staging: {' '.join(patterns) or 'no package matches the selection'}")
         return
-    
+
+    os.makedirs(REPO_DIR, exist_ok=True)
+    steps = []
+    for row in rows:
+        method, size = plan(os.path.join(STAGING_DIR, row["filename"]), os.path.join(REPO_DIR, row["filename"]))
+        steps.append((row["filename"], method, size))
+    total = sum(size for _, _, size in steps)
+
     if check_mode:
-        print(f"[CHECK] would publish {package_name} to {REPO_DIR}")
-        logging.info(f"[CHECK] would publish {package_name} to {REPO_DIR}")
-        return
-    
-    confirm = input(f"Are you sure you want to publish {package_name} to the repo? (y/N): ").strip().lower()
-    if confirm != "y":
-        print("[CANCELLED] No changes made.")
-        logging.info(f"Publish cancelled for {package_name}")
+        for name, method, size in steps:
+            print(f"[CHECK] would publish {name} to {REPO_DIR} ({method}, {size} bytes to copy)")
+            logging.info(f"[CHECK] would publish {name} to {REPO_DIR} ({method})")
+        print(f"[CHECK] {len(steps)} package(s), {total} bytes would be copied")
         return
-           
-    os.makedirs(REPO_DIR, exist_ok=True)
-    shutil.copy2(src_path, dest_path)
-    print(f"[OK] Published {package_name} to {REPO_DIR}")
-    logging.info(f"Published {package_name} to {REPO_DIR}")
+
+    if not yes:
+        for name, method, size in steps:
+            print(f" - {name} ({method})")
+        confirm = input(f"Are you sure you want to publish {len(steps)} package(s) to the repo? (y/N): ").strip().lower()
+        if confirm != "y":
+            print("[CANCELLED] No changes made.")
+            logging.info(f"Publish cancelled for {', '.join(name for name, _, _ in steps)}")
+            return
+
+    results = transfer_all([(os.path.join(STAGING_DIR, name), os.path.join(REPO_DIR, name)) for name, _, _ in steps],
+                           jobs=jobs)
+    published = []
+    copied = 0
+    for name, _, _ in steps:
+        result = results[os.path.join(REPO_DIR, name)]
+        if isinstance(result, Exception):
+            print(f"[ERROR] Failed to publish {name}: {result}")
+            continue
+        method, size = result
+        copied += size
+        published.append(name)
+        print(f"[OK] Published {name} to {REPO_DIR} ({method})")
+        logging.info(f"Published {name} to {REPO_DIR} ({method}, {size} bytes copied)")
+    if len(published) > 1:
+        print(f"[OK] Published {len(published)} package(s), {copied} bytes copied")
+    if published:
+        update_index(added=published)
 
 # Show status of the package
 def show_status(package_name):
-    dest_path = os.path.join(REPO_DIR, package_name)
-    if os.path.exists(dest_path):
-        print(f"[INFO] Package is already published: {package_name}")
-    else:
+    catalog = get_catalog()
+    rows = matching(catalog, "staging", package_name) or matching(catalog, "published", package_name)
+    if not rows:
         print(f"[INFO] Package is NOT published yet: {package_name}")
+    for row in rows:
+        published = catalog.get("published", row["filename"])
+        if published:
+            print(f"[INFO] Package is already published: {row['filename']} (published {format_mtime(published)})")
+        else:
+            print(f"[INFO] Package is NOT published yet: {row['filename']}")
     logging.info(f"Checked status of {package_name}")
 
 # Remove the package from staged or published dir
@@ -118,28 +192,138 @@ def remove_package(package_name, from_published=False, check_mode=False):
     os.remove(pkg_path)
     print(f"[OK] Removed {package_name} from {target_dir}")
     logging.info(f"Removed {package_name} from {target_dir}")
+    if from_published:
+        update_index(removed=[package_name])
+
+# Keep Packages/Release in step with the pool
+def update_index(added=(), removed=(), rebuild=False):
+    catalog = get_catalog()
+    index = get_index(catalog)
+    try:
+        if rebuild:
+            count = index.rebuild()
+            print(f"[OK] Rebuilt APT index in {INDEX_DIR} with {count} package(s)")
+        else:
+            index.update(added=added, removed=removed)
+            print(f"[OK] Updated APT index in {INDEX_DIR}")
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Failed to update APT index: {e}")
+        logging.error(f"Failed to update APT index: {e}")
+
+# Detected events with the outcome of the build they queued
+def show_history(repo=None, limit=20):
+    store = StateStore(STATE_DB)
+    events = store.events(repo=repo, limit=limit)
+    if not events:
+        print("[INFO] No events recorded")
+    for event in events:
+        detected = datetime.fromtimestamp(event["detected"]).strftime("%Y-%m-%d %H:%M")
+        build = event["build_status"] or ("queued" if event["job_id"] else "not queued")
+        if event["build_duration"] is not None:
+            build += f" in {event['build_duration']:.0f}s"
+        print(f" - {detected} {event['repo']:<35} {event['event_type']:<8} {event['value'][:40]:<40} {build}")
+    logging.info(f"Viewed event history ({len(events)} events)")
+
+# Build attempts and per-repo summary
+def show_builds(repo=None, status=None, limit=20):
+    store = StateStore(STATE_DB)
+    for row in store.build_summary(repo=repo):
+        avg = f"{row['avg_duration']:.0f}s" if row["avg_duration"] is not None else "-"
+        longest = f"{row['max_duration']:.0f}s" if row["max_duration"] is not None else "-"
+        print(f"[INFO] {row['repo']}: {row['builds']} build(s), {row['failed']} failed, avg {avg}, max {longest}")
+    for build in store.builds(repo=repo, status=status, limit=limit):
+        finished = datetime.fromtimestamp(build["finished"]).strftime("%Y-%m-%d %H:%M")
+        duration = f"{build['duration']:.0f}s" if build["duration"] is not None else "-"
+        print(f" - {finished} job {build['job_id']} #{build['attempt']} {build['repo']:<35} {build['event_type']:<8} "
+              f"{build['value'][:40]:<40} {build['status']:<9} {duration}{'  ' + build['error'] if build['error'] else ''}")
+    logging.info("Viewed build history")
+
+def show_timings(exporter=None, job=None, runs=20, top=15):
+    store = StateStore(STATE_DB)
+    if job is not None:
+        rows = store.task_timings(job_id=job)
+        if not rows:
+            print(f"[ERROR] No task timings recorded for job {job}")
+            return
+        for attempt in sorted({row["attempt"] for row in rows}):
+            tasks = [row for row in rows if row["attempt"] == attempt]
+            total = sum(row["duration"] for row in tasks)
+            print(f"[INFO] Job {job} #{attempt} ({tasks[0]['exporter']}): {len(tasks)} task(s), {total:.1f}s")
+            for line in flame(tasks):
+                print(line)
+        logging.info(f"Viewed task timings of job {job}")
+        return
+
+    rows = store.task_timings(exporter=exporter, runs=runs)
+    if not rows:
+        print("[INFO] No task timings recorded yet")
+        return
+    print(f"[INFO] Slowest tasks over the last {runs} run(s) per exporter:")
+    for name, role, task, count, avg, longest in slowest_tasks(rows, top=top):
+        print(f" - {name:<25} {role or '(play)':<20} {task[:50]:<50} avg {avg:7.1f}s  max {longest:7.1f}s  ({count} run(s))")
+
+    found = regressions(rows, window=runs - 1)
+    if found:
+        print("[WARN] Tasks slower than their median in the latest run:")
+        for name, job_id, role, task, duration, baseline in found:
+            print(f" - {name:<25} job {job_id} {role or '(play)'}: {task[:50]} {duration:.1f}s vs median {baseline:.1f}s")
+    else:
+        print("[OK] No task regressed against its median in the latest run")
+
+    print("[INFO] Fixed setup overhead per build (fact gathering, dependencies, service user):")
+    for name, mode, count, setup, total in overhead(rows):
+        share = setup / total if total else 0.0
+        print(f" - {name:<25} {mode:<5} setup {setup:7.1f}s of {total:7.1f}s ({share:.0%}, {count} run(s))")
+    logging.info("Viewed task timings")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="repoctl: manage staged .deb package")
     subparsers = parser.add_subparsers(dest="command")
     
     # Subcommands
-    subparsers.add_parser("list", help="List staged .deb packages")
+    list_parser = subparsers.add_parser("list", help="List staged .deb packages")
+    list_parser.add_argument("--package", metavar="GLOB", help="Only packages whose name matches, e.g. 'dcgm*'")
+    list_parser.add_argument("--version", metavar="GLOB", help="Only versions matching, e.g. '4.2.*'")
+    list_parser.add_argument("--sort", choices=SORT_KEYS, default="name", help="Sort by file name, package, version or date")
+    list_parser.add_argument("--reverse", "-r", action="store_true", help="Reverse the sort order")
     metadata_parser = subparsers.add_parser("meta", help="View metadata of a .deb file")
-    metadata_parser.add_argument("package", help="The .deb file to inspect")
+    metadata_parser.add_argument("package", help="The .deb file (or glob) to inspect")
     
     status_parser = subparsers.add_parser("status", help="Check publish status of a .deb file")
-    status_parser.add_argument("package", help="The .deb file to check")
+    status_parser.add_argument("package", help="The .deb file (or glob) to check")
 
-    publish_parser = subparsers.add_parser("publish", help="Publish a staged .deb package")
-    publish_parser.add_argument("package", help="The .deb file to publish")
-    publish_parser.add_argument("--check", action="store_true", help="Run in check mode")
+    publish_parser = subparsers.add_parser("publish", help="Publish staged .deb packages")
+    publish_parser.add_argument("package", nargs="*", help="The .deb file(s) or globs to publish")
+    publish_parser.add_argument("--package", dest="package_glob", metavar="GLOB", help="Only packages whose name matches")
+    publish_parser.add_argument("--version", metavar="GLOB", help="Only versions matching, e.g. '4.2.*'")
+    publish_parser.add_argument("--latest", action="store_true", help="Only the highest version of each package")
+    publish_parser.add_argument("--jobs", "-j", type=int, default=DEFAULT_JOBS, help="Packages transferred in parallel")
+    publish_parser.add_argument("--yes", "-y", action="store_true", help="Skip confirmation")
+    publish_parser.add_argument("--check", action="store_true", help="Show the plan and bytes to copy without publishing")
 
     remove_parser = subparsers.add_parser("remove", help="Remove a .deb package from staging or published")
     remove_parser.add_argument("package", help="The .deb file to remove")
     remove_parser.add_argument("--published", action="store_true", help="Remove from published repo instead of staging")
     remove_parser.add_argument("--check", action="store_true", help="Simulate removal without deleting")
 
+    subparsers.add_parser("index", help="Regenerate Packages/Release from every published package")
+
+    history_parser = subparsers.add_parser("history", help="Show detected releases/commits and their builds")
+    history_parser.add_argument("--repo", metavar="GLOB", help="Only repos matching, e.g. 'nvidia/*'")
+    history_parser.add_argument("--limit", type=int, default=20, help="Number of events to show")
+
+    builds_parser = subparsers.add_parser("builds", help="Show build outcomes and durations")
+    builds_parser.add_argument("--repo", metavar="GLOB", help="Only repos matching, e.g. 'nvidia/*'")
+    builds_parser.add_argument("--status", dest="build_status", choices=["succeeded", "failed"],
+                               help="Only builds with this outcome")
+    builds_parser.add_argument("--limit", type=int, default=20, help="Number of builds to show")
+
+    timings_parser = subparsers.add_parser("timings", help="Show pipeline task timings and regressions")
+    timings_parser.add_argument("--exporter", metavar="GLOB", help="Only exporters matching, e.g. 'dcgm*'")
+    timings_parser.add_argument("--job", type=int, help="Timeline of every task of one build job")
+    timings_parser.add_argument("--runs", type=int, default=20, help="Runs per exporter to compare against")
+    timings_parser.add_argument("--top", type=int, default=15, help="Number of slowest tasks to show")
+
     reset_parser = subparsers.add_parser("reset", help="Reset monitor log and state")
     reset_parser.add_argument("--yes", "-y", action="store_true", help="Skip confirmation")
 
@@ -154,20 +338,39 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    if args.command == "list" or args.list:
-        list_package()
+    # Subcommands first, their options may share a dest with the legacy flags below
+    if args.command == "list":
+        list_package(package=args.package, version=args.version, sort=args.sort, reverse=args.reverse)
     elif args.command == "publish":
-        publish_package(args.package, check_mode=args.check)
-    elif args.command == "status" or args.status:
-        show_status(args.status if args.status else args.package)
-    elif args.command == "meta" or args.meta:
-        view_metadata(args.meta if args.meta else args.package)
+        if not (args.package or args.package_glob or args.version or args.latest):
+            publish_parser.error("give package files/globs or a --package/--version/--latest selector")
+        publish_package(args.package, check_mode=args.check, package=args.package_glob, version=args.version,
+                        latest=args.latest, yes=args.yes, jobs=args.jobs)
+    elif args.command == "status":
+        show_status(args.package)
+    elif args.command == "meta":
+        view_metadata(args.package)
     elif args.command == "remove":
         remove_package(args.package, from_published=args.published, check_mode=args.check)
-    elif args.remove:
-        remove_package(args.remove, from_published=args.published, check_mode=args.check)
+    elif args.command == "index":
+        update_index(rebuild=True)
+    elif args.command == "history":
+        show_history(repo=args.repo, limit=args.limit)
+    elif args.command == "builds":
+        show_builds(repo=args.repo, status=args.build_status, limit=args.limit)
+    elif args.command == "timings":
+        show_timings(exporter=args.exporter, job=args.job, runs=max(2, args.runs), top=args.top)
     elif args.command == "reset":
         reset_state(confirm=not args.yes)
+    # Legacy flags
+    elif args.list:
+        list_package()
+    elif args.status:
+        show_status(args.status)
+    elif args.meta:
+        view_metadata(args.meta)
+    elif args.remove:
+        remove_package(args.remove, from_published=args.published, check_mode=args.check)
     elif args.publish:
         publish_package(args.publish, check_mode=args.check)
     else:
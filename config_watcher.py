@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+
+# linux/inotify.h
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_IGNORED = 0x8000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+# Quiet time after the last event before rescanning, editors write in several steps
+DEBOUNCE = 1.0
+# Stat-poll period without inotify
+POLL_INTERVAL = 5
+# Full rescan even with inotify, in case an event was lost
+RESCAN_INTERVAL = 60
+
+def _inotify(path):
+    """An inotify fd watching path, or None where inotify is not available."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        logging.warning(f"[Config] inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK) < 0:
+        logging.warning(f"[Config] Cannot watch {path}: {os.strerror(ctypes.get_errno())}")
+        os.close(fd)
+        return None
+    return fd
+
+def _drain(fd):
+    """Read all pending events. False once the watch is gone (directory removed or moved)."""
+    alive = True
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return alive
+            raise
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                alive = False
+            offset += EVENT_HEADER.size + name_len
+
+class ConfigWatcher:
+    """
+    Calls on_change(paths) with the *.json files of config_dir at startup
+    and whenever one of them is added, removed or rewritten.
+
+    Uses inotify through libc where it can and falls back to comparing
+    (mtime, size, inode) of every file every POLL_INTERVAL seconds. A
+    missing directory keeps the last set instead of reporting it empty.
+    """
+
+    def __init__(self, config_dir, on_change, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.config_dir = str(config_dir)
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+    def snapshot(self):
+        files = {}
+        try:
+            entries = list(os.scandir(self.config_dir))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            if entry.name.endswith(".json") and not entry.name.startswith("."):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files[entry.path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        return files
+
+    def run(self):
+        fd = None
+        last = None
+        missing = False
+        while True:
+            if fd is None and self.use_inotify and os.path.isdir(self.config_dir):
+                fd = _inotify(self.config_dir)
+                if fd is not None:
+                    logging.info(f"[Config] Watching {self.config_dir} with inotify")
+
+            files = self.snapshot()
+            if files is None:
+                if not missing:
+                    logging.warning(f"[Config] {self.config_dir} is missing, keeping the current watchers")
+                missing = True
+            elif files != last:
+                missing = False
+                try:
+                    self.on_change(sorted(files))
+                    last = files
+                except Exception as e:
+                    logging.error(f"[Config] Applying config changes failed: {e}")
+
+            if fd is None:
+                time.sleep(self.poll_interval)
+                continue
+            if not select.select([fd], [], [], RESCAN_INTERVAL)[0]:
+                continue
+            alive = _drain(fd)
+            while alive and select.select([fd], [], [], DEBOUNCE)[0]:
+                alive = _drain(fd)
+            if not alive:
+                os.close(fd)
+                fd = None
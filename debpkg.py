@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import time
+import zlib
+import lzma
+import hashlib
+import tarfile
+import argparse
+
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+AR_SIZE_OFFSET = 48
+COMPRESSIONS = ("xz", "gz", "zst", "none")
+SUFFIXES = {"xz": ".xz", "gz": ".gz", "zst": ".zst", "none": ""}
+
+class DebError(Exception):
+    pass
+
+# ───────── Writing ─────────
+
+def _compressor(kind):
+    if kind == "xz":
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=6)
+    if kind == "gz":
+        return zlib.compressobj(9, zlib.DEFLATED, 31)
+    if kind == "zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise DebError("zstd compression needs the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=19).compressobj()
+    return None
+
+class _MemberWriter:
+    """File-like sink compressing into the output file, hashing the member as it goes."""
+
+    def __init__(self, out, kind):
+        self.out = out
+        self.compressor = _compressor(kind)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def _emit(self, data):
+        if data:
+            self.out.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+
+    def write(self, data):
+        self._emit(self.compressor.compress(data) if self.compressor else bytes(data))
+        return len(data)
+
+    def finish(self):
+        if self.compressor:
+            self._emit(self.compressor.flush())
+
+class _HashingReader:
+    """Wraps a source file so its md5 is computed while tarfile copies it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.md5.update(data)
+        return data
+
+def _ar_header(name, size, mtime, mode=0o100644):
+    header = f"{name:<16}{mtime:<12d}{0:<6d}{0:<6d}{mode:<8o}{size:<10d}`\n".encode()
+    if len(header) != AR_HEADER_SIZE:
+        raise DebError(f"ar member {name} does not fit an ar header")
+    return header
+
+def _write_ar_member(out, name, mtime, fill):
+    """
+    Write one ar member whose content fill() streams into a _MemberWriter.
+    The size field is patched afterwards, so nothing is buffered.
+    """
+    header_at = out.tell()
+    out.write(_ar_header(name, 0, mtime))
+    writer = fill()
+    out.write(b"\n" if writer.size % 2 else b"")
+    end = out.tell()
+    out.seek(header_at + AR_SIZE_OFFSET)
+    out.write(f"{writer.size:<10d}".encode())
+    out.seek(end)
+    return writer
+
+def _tarinfo(name, mtime, mode, size=0, is_dir=False):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE if is_dir else tarfile.REGTYPE
+    info.mode = mode
+    info.size = size
+    info.mtime = mtime
+    info.uid = info.gid = 0
+    info.uname = info.gname = "root"
+    return info
+
+def _parent_dirs(paths):
+    dirs = set()
+    for path in paths:
+        parts = path.strip("/").split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            dirs.add("/".join(parts[:i]))
+    return dirs
+
+def _write_tar(out, kind, mtime, files, contents):
+    """
+    files: {install path: (source path, mode)} streamed from disk.
+    contents: {install path: (bytes, mode)} kept in memory.
+    Entries are written in name order under ./, like dpkg-deb does.
+    """
+    writer = _MemberWriter(out, kind)
+    file_hashes = {}
+    with tarfile.open(fileobj=writer, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+        tar.addfile(_tarinfo("./", mtime, 0o755, is_dir=True))
+        entries = {d: None for d in _parent_dirs(list(files) + list(contents))}
+        entries.update({p.strip("/"): p for p in list(files) + list(contents)})
+        for rel in sorted(entries, key=lambda p: p.split("/")):
+            path = entries[rel]
+            if path is None:
+                tar.addfile(_tarinfo(f"./{rel}/", mtime, 0o755, is_dir=True))
+            elif path in contents:
+                data, mode = contents[path]
+                tar.addfile(_tarinfo(f"./{rel}", mtime, mode, size=len(data)), io.BytesIO(data))
+                file_hashes[rel] = hashlib.md5(data).hexdigest()
+            else:
+                source, mode = files[path]
+                with open(source, "rb") as f:
+                    reader = _HashingReader(f)
+                    tar.addfile(_tarinfo(f"./{rel}", mtime, mode, size=os.fstat(f.fileno()).st_size), reader)
+                file_hashes[rel] = reader.md5.hexdigest()
+    writer.finish()
+    writer.file_hashes = file_hashes
+    return writer
+
+def _atomic_output(output):
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f".{os.path.basename(output)}.{os.getpid()}.tmp")
+
+def _commit(f, tmp_path, output):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, output)
+
+def build_deb(output, control, files=None, scripts=None, compression="xz", mtime=None):
+    """
+    Assemble a .deb at output without a staging tree.
+
+    control   -- rendered DEBIAN/control text
+    files     -- {install path: (source path, mode)}, read straight from disk
+    scripts   -- {maintainer script name: (text, mode)}, e.g. postinst
+    mtime     -- timestamp for every entry, defaults to SOURCE_DATE_EPOCH or now
+
+    Writes to a temporary file next to output and renames it into place.
+    Returns the sha256 and size of each ar member and the md5 of each file.
+    """
+    if compression not in COMPRESSIONS:
+        raise DebError(f"Unknown compression {compression}")
+    mtime = int(mtime if mtime is not None else os.environ.get("SOURCE_DATE_EPOCH", time.time()))
+    control_files = {"control": (control.encode() if isinstance(control, str) else control, 0o644)}
+    for name, (text, mode) in (scripts or {}).items():
+        control_files[name] = (text.encode() if isinstance(text, str) else text, mode)
+
+    tmp_path = _atomic_output(output)
+    f = open(tmp_path, "w+b")
+    try:
+        f.write(AR_MAGIC)
+        f.write(_ar_header("debian-binary", 4, mtime))
+        f.write(b"2.0\n")
+        suffix = SUFFIXES[compression]
+        control_member = _write_ar_member(f, f"control.tar{suffix}", mtime,
+                                          lambda: _write_tar(f, compression, mtime, {}, control_files))
+        data_member = _write_ar_member(f, f"data.tar{suffix}", mtime,
+                                       lambda: _write_tar(f, compression, mtime, files or {}, {}))
+        _commit(f, tmp_path, output)
+    except BaseException:
+        f.close()
+        os.remove(tmp_path)
+        raise
+
+    return {
+        "members": {
+            f"control.tar{suffix}": {"size": control_member.size, "sha256": control_member.sha256.hexdigest()},
+            f"data.tar{suffix}": {"size": data_member.size, "sha256": data_member.sha256.hexdigest()},
+        },
+        "md5sums": data_member.file_hashes,
+    }
+
+# ───────── Reading ─────────
+
+def iter_ar_members(f):
+    """Yield (name, offset, size) for every member of an ar archive."""
+    f.seek(0)
+    if f.read(len(AR_MAGIC)) != AR_MAGIC:
+        raise DebError("not an ar archive")
+    offset = len(AR_MAGIC)
+    while True:
+        f.seek(offset)
+        header = f.read(AR_HEADER_SIZE)
+        if len(header) < AR_HEADER_SIZE:
+            return
+        try:
+            name = header[:16].decode().strip().rstrip("/")
+            size = int(header[48:58].decode().strip())
+        except ValueError:
+            raise DebError(f"corrupt ar header at offset {offset}")
+        yield name, offset + AR_HEADER_SIZE, size
+        offset += AR_HEADER_SIZE + size + (size % 2)
+
+def _decompress(name, data):
+    if name.endswith(".xz"):
+        return lzma.decompress(data)
+    if name.endswith(".gz"):
+        return zlib.decompress(data, 47)
+    if name.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise DebError("reading zstd members needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+def read_control_member(path):
+    """(member name, {file name: (bytes, mode)}) of the control tarball."""
+    with open(path, "rb") as f:
+        for name, offset, size in iter_ar_members(f):
+            if name.startswith("control.tar"):
+                f.seek(offset)
+                try:
+                    raw = _decompress(name, f.read(size))
+                    files = {}
+                    with tarfile.open(fileobj=io.BytesIO(raw), mode="r:") as tar:
+                        for member in tar:
+                            if member.isfile():
+                                files[os.path.normpath(member.name)] = (tar.extractfile(member).read(), member.mode)
+                except (tarfile.TarError, lzma.LZMAError, zlib.error, EOFError) as e:
+                    raise DebError(f"{path}: unreadable {name}: {e}")
+                if "control" not in files:
+                    raise DebError(f"{path}: {name} has no control file")
+                return name, files
+    raise DebError(f"{path} has no control member")
+
+def parse_control(text):
+    """DEBIAN/control fields as a dict; continuation lines are kept joined with newlines."""
+    fields = {}
+    key = None
+    for line in text.splitlines():
+        if line.startswith((" ", "\t")) and key:
+            fields[key] += "\n" + line
+        elif ":" in line:
+            key, _, value = line.partition(":")
+            key = key.strip()
+            fields[key] = value.strip()
+    return fields
+
+def read_control(path):
+    """Parsed DEBIAN/control of a .deb, read straight from the archive."""
+    name, files = read_control_member(path)
+    return parse_control(files["control"][0].decode("utf-8", "replace"))
+
+def data_manifest(path):
+    """{entry name: (type, mode, uid, gid, size, sha256)} of the data tarball."""
+    manifest = {}
+    with open(path, "rb") as f:
+        for name, offset, size in iter_ar_members(f):
+            if name.startswith("data.tar"):
+                f.seek(offset)
+                raw = _decompress(name, f.read(size))
+                with tarfile.open(fileobj=io.BytesIO(raw), mode="r:") as tar:
+                    for member in tar:
+                        digest = hashlib.sha256(tar.extractfile(member).read()).hexdigest() if member.isfile() else None
+                        manifest[member.name.rstrip("/") or "."] = (member.type, member.mode, member.uid,
+                                                                    member.gid, member.size, digest)
+    return manifest
+
+def _order(c):
+    if c == "~":
+        return -1
+    if c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+def _compare_part(a, b):
+    # dpkg's verrevcmp: alternate non-digit runs (with ~ sorting first) and numbers
+    while a or b:
+        i = j = 0
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            ac = _order(a[i]) if i < len(a) and not a[i].isdigit() else 0
+            bc = _order(b[j]) if j < len(b) and not b[j].isdigit() else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        a, b = a[i:], b[j:]
+        i = j = 0
+        while i < len(a) and a[i].isdigit():
+            i += 1
+        while j < len(b) and b[j].isdigit():
+            j += 1
+        diff = int(a[:i] or 0) - int(b[:j] or 0)
+        if diff:
+            return diff
+        a, b = a[i:], b[j:]
+    return 0
+
+def _split_version(version):
+    epoch, _, rest = version.rpartition(":") if ":" in version else ("0", "", version)
+    upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "")
+    return int(epoch or 0), upstream, revision
+
+def _part_key(part):
+    # Same ordering as _compare_part as a tuple: every non-digit run ends in
+    # a 0 so that a shorter run sorts after ~ and before anything else
+    key = []
+    while part:
+        i = 0
+        while i < len(part) and not part[i].isdigit():
+            i += 1
+        j = i
+        while j < len(part) and part[j].isdigit():
+            j += 1
+        key.append((tuple(_order(c) for c in part[:i]) + (0,), int(part[i:j] or 0)))
+        part = part[j:]
+    # An empty part compares like "0"
+    return tuple(key or [((0,), 0)]) + (((0,), 0),)
+
+def version_key(version):
+    """Sort key equivalent to compare_versions"""
+    epoch, upstream, revision = _split_version(version)
+    return epoch, _part_key(upstream), _part_key(revision)
+
+def compare_versions(a, b):
+    """Debian version ordering (epoch:upstream-revision), negative if a < b."""
+    ea, ua, ra = _split_version(a)
+    eb, ub, rb = _split_version(b)
+    return (ea - eb) or _compare_part(ua, ub) or _compare_part(ra, rb)
+
+# ───────── Re-stamping ─────────
+
+def restamp(src, dest, edit):
+    """
+    Copy src to dest with DEBIAN/control replaced by edit(control text).
+    Only the control member is rebuilt; the data member is copied byte for byte.
+    """
+    control_name, control_files = read_control_member(src)
+    compression = next((k for k, s in SUFFIXES.items() if s and control_name.endswith(s)), "none")
+    text, mode = control_files["control"]
+    control_files["control"] = (edit(text.decode()).encode(), mode)
+
+    tmp_path = _atomic_output(dest)
+    with open(src, "rb") as f_in:
+        members = list(iter_ar_members(f_in))
+        f = open(tmp_path, "w+b")
+        try:
+            f.write(AR_MAGIC)
+            mtime = int(time.time())
+            for name, offset, size in members:
+                if name == control_name:
+                    _write_ar_member(f, name, mtime, lambda: _write_tar(f, compression, mtime, {}, control_files))
+                    continue
+                f.write(_ar_header(name, size, mtime))
+                f_in.seek(offset)
+                remaining = size
+                while remaining:
+                    chunk = f_in.read(min(remaining, 1024 * 1024))
+                    f.write(chunk)
+                    remaining -= len(chunk)
+                if size % 2:
+                    f.write(b"\n")
+            _commit(f, tmp_path, dest)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+
+# ───────── Checking ─────────
+
+def compare(a, b):
+    """Compare two .debs entry by entry. Returns a list of differences."""
+    differences = []
+    fields_a, fields_b = read_control(a), read_control(b)
+    for key in sorted(set(fields_a) | set(fields_b)):
+        if fields_a.get(key) != fields_b.get(key):
+            differences.append(f"control {key}: {fields_a.get(key)!r} != {fields_b.get(key)!r}")
+    data_a, data_b = data_manifest(a), data_manifest(b)
+    for name in sorted(set(data_a) | set(data_b)):
+        if data_a.get(name) != data_b.get(name):
+            differences.append(f"data {name}: {data_a.get(name)} != {data_b.get(name)}")
+    return differences
+
+def _split_mapping(value, default_mode):
+    # SOURCE:DEST[:MODE]
+    parts = value.split(":")
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"expected SOURCE:DEST[:MODE], got {value}")
+    mode = int(parts[2], 8) if len(parts) == 3 else default_mode
+    return parts[1], (parts[0], mode)
+
+# ───────── CLI ENTRY POINT ─────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and inspect .deb packages without dpkg-deb")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Assemble a .deb from files on disk")
+    build_parser.add_argument("--control", required=True, help="Rendered DEBIAN/control file")
+    build_parser.add_argument("--script", action="append", default=[], help="Maintainer script, e.g. postinst file path")
+    build_parser.add_argument("--file", action="append", default=[], help="SOURCE:INSTALL_PATH[:MODE] (default mode 0644)")
+    build_parser.add_argument("--exec", action="append", default=[], help="SOURCE:INSTALL_PATH (mode 0755)")
+    build_parser.add_argument("--compression", "-Z", choices=COMPRESSIONS, default="xz")
+    build_parser.add_argument("--output", "-o", required=True)
+
+    info_parser = subparsers.add_parser("info", help="Show DEBIAN/control of a .deb")
+    info_parser.add_argument("package")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two .debs, e.g. ours against dpkg-deb's")
+    compare_parser.add_argument("package_a")
+    compare_parser.add_argument("package_b")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "build":
+            files = dict(_split_mapping(v, 0o644) for v in args.file)
+            files.update(_split_mapping(v, 0o755) for v in args.exec)
+            scripts = {}
+            for path in args.script:
+                with open(path) as f:
+                    scripts[os.path.basename(path)] = (f.read(), 0o755)
+            with open(args.control) as f:
+                control = f.read()
+            result = build_deb(args.output, control, files=files, scripts=scripts, compression=args.compression)
+            print(f"[OK] Built {args.output}")
+            for name, member in result["members"].items():
+                print(f"  {name}: {member['size']} bytes, sha256 {member['sha256']}")
+        elif args.command == "info":
+            name, files = read_control_member(args.package)
+            print(files["control"][0].decode(), end="")
+        elif args.command == "compare":
+            differences = compare(args.package_a, args.package_b)
+            for line in differences:
+                print(f"[DIFF] {line}")
+            if differences:
+                sys.exit(1)
+            print("[OK] Packages have identical control fields and data entries")
+    except (DebError, OSError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
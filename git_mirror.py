@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import time
+import fcntl
+import shutil
+import logging
+import argparse
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from metrics import MIRROR_LOCK_WAIT
+
+MIRROR_ROOT = "/opt/repo-watcher/mirrors"
+WORKTREE_MAX_AGE = 24 * 3600
+WORKTREE_BUDGET_BYTES = 20 * 1024 ** 3
+
+def git(*args, cwd=None):
+    result = subprocess.run(["git", *args], cwd=cwd, check=True, text=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stdout.strip()
+
+def mirror_path(repo_url, mirror_root=MIRROR_ROOT):
+    """One bare mirror per upstream, e.g. github.com_NVIDIA_DCGM.git"""
+    name = re.sub(r"^[a-z]+://", "", repo_url.strip().rstrip("/"))
+    name = re.sub(r"\.git$", "", name)
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+    return os.path.join(mirror_root, f"{name}.git")
+
+@contextmanager
+def mirror_lock(mirror):
+    """flock on <mirror>.lock, held by one fetch/worktree change at a time across threads and processes."""
+    os.makedirs(os.path.dirname(mirror), exist_ok=True)
+    with open(f"{mirror}.lock", "w") as f:
+        started = time.monotonic()
+        fcntl.flock(f, fcntl.LOCK_EX)
+        MIRROR_LOCK_WAIT.observe(time.monotonic() - started, os.path.basename(mirror))
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def ensure_mirror(repo_url, mirror_root=MIRROR_ROOT):
+    """Create the bare mirror on first use, afterwards only fetch new refs."""
+    mirror = mirror_path(repo_url, mirror_root)
+    if not os.path.exists(os.path.join(mirror, "HEAD")):
+        logging.info(f"Creating mirror of {repo_url} at {mirror}")
+        git("init", "--bare", "--quiet", mirror)
+        git("remote", "add", "origin", repo_url, cwd=mirror)
+        # Branches and tags only, GitHub's refs/pull/* would multiply the size
+        git("config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*", cwd=mirror)
+    git("fetch", "--quiet", "--prune", "--tags", "--force", "origin", cwd=mirror)
+    return mirror
+
+def resolve(mirror, git_ref):
+    """(commit sha, tree sha) of a branch, tag or sha in the mirror."""
+    commit = git("rev-parse", "--verify", f"{git_ref}^{{commit}}", cwd=mirror)
+    tree = git("rev-parse", f"{commit}^{{tree}}", cwd=mirror)
+    return commit, tree
+
+def dir_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def list_worktrees(mirror):
+    """Paths of the linked worktrees registered in a mirror."""
+    output = git("worktree", "list", "--porcelain", cwd=mirror)
+    paths = [line[len("worktree "):] for line in output.splitlines() if line.startswith("worktree ")]
+    # The first entry is the bare mirror itself
+    return [p for p in paths if os.path.abspath(p) != os.path.abspath(mirror)]
+
+def prune_worktrees(mirror, max_age=WORKTREE_MAX_AGE, budget=WORKTREE_BUDGET_BYTES, keep=()):
+    """
+    Drop worktrees whose directory is gone, older than max_age, or over
+    the size budget (oldest first). Returns the number removed.
+    """
+    git("worktree", "prune", cwd=mirror)
+    now = time.time()
+    keep = {os.path.abspath(p) for p in keep}
+    worktrees = []
+    for path in list_worktrees(mirror):
+        if os.path.abspath(path) in keep or not os.path.isdir(path):
+            continue
+        worktrees.append((os.path.getmtime(path), path))
+    worktrees.sort()
+
+    removed = 0
+    sizes = {path: dir_size(path) for _, path in worktrees}
+    total = sum(sizes.values())
+    for mtime, path in worktrees:
+        if now - mtime < max_age and total <= budget:
+            continue
+        logging.info(f"Removing stale worktree {path} ({sizes[path] // 1024 ** 2} MiB)")
+        git("worktree", "remove", "--force", path, cwd=mirror)
+        total -= sizes[path]
+        removed += 1
+    return removed
+
+def prepare_worktree(repo_url, git_ref, dest, mirror_root=MIRROR_ROOT):
+    """
+    Check git_ref out into a fresh worktree at dest, fetching only the new
+    refs into the persistent mirror. Returns commit, tree and timings.
+    """
+    mirror = mirror_path(repo_url, mirror_root)
+    with mirror_lock(mirror):
+        started = time.time()
+        ensure_mirror(repo_url, mirror_root)
+        fetched = time.time()
+        commit, tree = resolve(mirror, git_ref)
+
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+        prune_worktrees(mirror, keep=(dest,))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        git("worktree", "add", "--force", "--detach", "--quiet", dest, commit, cwd=mirror)
+        done = time.time()
+
+    return {
+        "commit": commit,
+        "tree": tree,
+        "fetch_seconds": round(fetched - started, 2),
+        "checkout_seconds": round(done - fetched, 2),
+    }
+
+# ───────── CLI ENTRY POINT ─────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time mirror fetch + worktree checkout against a full clone")
+    parser.add_argument("repo_url", help="Upstream URL or path, e.g. a local bare repo")
+    parser.add_argument("git_ref", help="Branch, tag or commit to check out")
+    parser.add_argument("--mirror-root", default=MIRROR_ROOT, help="Where mirrors are kept")
+    parser.add_argument("--compare-clone", action="store_true", help="Also time a full git clone of the same ref")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    with tempfile.TemporaryDirectory() as tmp:
+        info = prepare_worktree(args.repo_url, args.git_ref, os.path.join(tmp, "worktree"), args.mirror_root)
+        print(f"[OK] {args.git_ref} -> {info['commit']} (tree {info['tree']})")
+        print(f"     mirror fetch: {info['fetch_seconds']}s, worktree checkout: {info['checkout_seconds']}s")
+
+        if args.compare_clone:
+            started = time.time()
+            git("clone", "--quiet", args.repo_url, os.path.join(tmp, "clone"))
+            git("checkout", "--quiet", "--detach", info["commit"], cwd=os.path.join(tmp, "clone"))
+            print(f"     full clone: {round(time.time() - started, 2)}s")
+
+        prune_worktrees(mirror_path(args.repo_url, args.mirror_root), max_age=0)
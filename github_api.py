@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from scheduler import get_scheduler
+from metrics import API_REQUESTS
+
+try:
+    from github_config import GITHUB_TOKEN
+except ImportError:
+    GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "")
+
+API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+REQUEST_TIMEOUT = 10
+POOL_MAXSIZE = 32
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the pooled requests.Session shared by every watcher thread."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept"] = "application/vnd.github+json"
+            if GITHUB_TOKEN:
+                session.headers["Authorization"] = f"token {GITHUB_TOKEN}"
+            _session = session
+    return _session
+
+def validator_file_for(state_file):
+    """Validator cache path kept next to a watcher's state file."""
+    base, _ = os.path.splitext(state_file)
+    if base.endswith("_state"):
+        base = base[:-len("_state")]
+    return f"{base}_validators.json"
+
+class ValidatorCache:
+    """
+    Per-repo cache of ETag/Last-Modified validators.
+
+    Each entry also keeps the result parsed from the last 200 response so a
+    304 can be answered without downloading or parsing anything.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable validator cache {self.path}: {e}")
+            return {}
+
+    def headers_for(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def result_for(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        return entry.get("result") if entry else None
+
+    def store(self, url, response_headers, result):
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        with self.lock:
+            self.entries[url] = {"etag": etag, "last_modified": last_modified, "result": result}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.entries)
+            self.dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+def conditional_get(url, cache, parse):
+    """
+    GET a GitHub API url, sending the cached validators for it.
+
+    A 304 returns the cached parsed result as-is; anything else goes through
+    raise_for_status() and parse(), and the new validators are remembered.
+    """
+    session = get_session()
+    headers = cache.headers_for(url) if cache is not None else {}
+    r = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    get_scheduler().update_rate_limit(r.headers)
+    API_REQUESTS.inc("rest", str(r.status_code))
+
+    if r.status_code == 304:
+        cached = cache.result_for(url) if cache is not None else None
+        if cached is not None:
+            return cached
+        # Validators without a result should not happen, refetch unconditionally
+        r = session.get(url, timeout=REQUEST_TIMEOUT)
+        get_scheduler().update_rate_limit(r.headers)
+        API_REQUESTS.inc("rest", str(r.status_code))
+
+    r.raise_for_status()
+    result = parse(r.json())
+    if cache is not None:
+        cache.store(url, r.headers, result)
+    return result
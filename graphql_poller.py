@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import logging
+import threading
+import requests
+from scheduler import get_scheduler
+from metrics import API_REQUESTS, record_poll
+from github_api import API_URL, GITHUB_TOKEN, REQUEST_TIMEOUT, ValidatorCache, get_session, validator_file_for
+from monitor import (TAG_PAGE, check_commit, check_release, get_repo_logger, handle_check_result, latest_tag,
+                     load_state)
+
+GRAPHQL_URL = os.environ.get("GITHUB_GRAPHQL_URL", f"{API_URL}/graphql")
+DEFAULT_INTERVAL = 120
+
+# GitHub rejects queries that touch too many nodes, keep each request well below that
+MAX_REPOS_PER_QUERY = 50
+MAX_QUERY_CHARS = 32000
+
+REPO_FRAGMENT = """
+  r{index}: repository(owner: {owner}, name: {repo}) {{
+    latestRelease {{ tagName publishedAt }}
+    refs(refPrefix: "refs/tags/", first: {tag_page}, orderBy: {{field: ALPHABETICAL, direction: DESC}}) {{ nodes {{ name }} }}
+    ref(qualifiedName: {branch}) {{ target {{ oid ... on Commit {{ committedDate }} }} }}
+  }}"""
+
+def build_query(configs, offset=0):
+    """One query with an aliased repository() block per config, r<offset+i>."""
+    fragments = []
+    for i, config in enumerate(configs):
+        fragments.append(REPO_FRAGMENT.format(
+            index=offset + i,
+            tag_page=TAG_PAGE,
+            owner=json.dumps(config["owner"]),
+            repo=json.dumps(config["repo"]),
+            branch=json.dumps(f"refs/heads/{config.get('branch', 'main')}"),
+        ))
+    return "query {" + "".join(fragments) + "\n  rateLimit { cost limit remaining resetAt }\n}"
+
+def chunk_configs(configs, max_repos=MAX_REPOS_PER_QUERY, max_chars=MAX_QUERY_CHARS):
+    """Split configs so no chunk exceeds max_repos repos or max_chars of query text."""
+    chunks = []
+    current = []
+    size = 0
+    for config in configs:
+        fragment_size = len(build_query([config]))
+        if current and (len(current) >= max_repos or size + fragment_size > max_chars):
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append(config)
+        size += fragment_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+def parse_repository(node):
+    """
+    Map one repository() node onto the (release, commit) tuples returned by
+    check_release()/check_commit(). None means GraphQL had nothing usable.
+    """
+    if not node:
+        return None
+
+    release = node.get("latestRelease")
+    tags = (node.get("refs") or {}).get("nodes") or []
+    if release and release.get("tagName"):
+        release_info = (release["tagName"], release.get("publishedAt") or "unknown", "release")
+    elif tags:
+        # Same choice as the REST fallback, so switching paths never looks like a new tag
+        release_info = (latest_tag([tag["name"] for tag in tags]), "unknown", "tag")
+    else:
+        release_info = (None, None, None)
+
+    target = (node.get("ref") or {}).get("target")
+    if not target:
+        return None
+    commit_info = (target["oid"], target.get("committedDate") or "unknown")
+    return release_info, commit_info
+
+def post_query(query):
+    session = get_session()
+    r = session.post(GRAPHQL_URL, json={"query": query}, timeout=REQUEST_TIMEOUT * 3)
+    get_scheduler().update_rate_limit(r.headers)
+    API_REQUESTS.inc("graphql", str(r.status_code))
+    r.raise_for_status()
+    return r.json()
+
+def is_size_error(e):
+    """Errors GitHub returns when a query is too expensive to finish in time."""
+    if isinstance(e, requests.exceptions.Timeout):
+        return True
+    response = getattr(e, "response", None)
+    return response is not None and response.status_code in (413, 502, 504)
+
+def query_chunk(configs, offset=0):
+    """
+    Run one chunk and return {index: (release, commit) or None}.
+
+    A failed request is split in half and retried, so one oversized or
+    timing-out chunk only pushes its own repos back to REST.
+    """
+    try:
+        payload = post_query(build_query(configs, offset))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        if len(configs) == 1 or not is_size_error(e):
+            logging.warning(f"[GraphQL] Query for {len(configs)} repos failed, using REST: {e}")
+            return {offset + i: None for i in range(len(configs))}
+        half = len(configs) // 2
+        logging.warning(f"[GraphQL] Query for {len(configs)} repos failed ({e}), splitting")
+        results = query_chunk(configs[:half], offset)
+        results.update(query_chunk(configs[half:], offset + half))
+        return results
+
+    data = payload.get("data") or {}
+    for error in payload.get("errors") or []:
+        logging.warning(f"[GraphQL] {error.get('type', 'ERROR')}: {error.get('message')} at {error.get('path')}")
+
+    rate = data.get("rateLimit")
+    if rate:
+        get_scheduler().update_graphql_rate_limit(rate)
+        logging.info(f"[GraphQL] Query cost {rate.get('cost')}, remaining {rate.get('remaining')}")
+
+    return {offset + i: parse_repository(data.get(f"r{offset + i}")) for i in range(len(configs))}
+
+def poll_all(configs):
+    """Results for every config, in order; None entries must be checked over REST."""
+    results = {}
+    offset = 0
+    for chunk in chunk_configs(configs):
+        results.update(query_chunk(chunk, offset))
+        offset += len(chunk)
+    return [results.get(i) for i in range(len(configs))]
+
+class BatchedWatcher:
+    """
+    Polls every configured repo with batched GraphQL queries and feeds the
+    results into the same change logic the per-repo REST watchers use.
+    """
+
+    def __init__(self, configs, builds):
+        self.configs = configs
+        self.builds = builds
+        self.states = [load_state(c) for c in configs]
+        self.loggers = [get_repo_logger(c) for c in configs]
+        self.validators = [ValidatorCache(validator_file_for(c["state_file"])) for c in configs]
+        self.busy = set()
+        self.busy_lock = threading.Lock()
+        self.interval = min(c.get("check_interval", DEFAULT_INTERVAL) for c in configs)
+        self.scheduler = get_scheduler()
+
+    def rest_check(self, i):
+        config = self.configs[i]
+        owner, repo = config["owner"], config["repo"]
+        release = check_release(owner, repo, self.validators[i], self.loggers[i])
+        commit = check_commit(owner, repo, config.get("branch", "main"), self.validators[i], self.loggers[i])
+        self.validators[i].save()
+        return release, commit
+
+    def handle(self, i, result, started):
+        config = self.configs[i]
+        outcome = "error"
+        try:
+            if result is None or result[0][0] is None:
+                self.loggers[i].info(f"[{config['owner']}/{config['repo']}] Falling back to REST for this cycle")
+                result = self.rest_check(i)
+            outcome = handle_check_result(config, self.states[i], result[0], result[1], self.builds, self.loggers[i])
+        except Exception as e:
+            self.loggers[i].error(f"[{config['owner']}/{config['repo']}] Error occurred: {e}")
+        finally:
+            # Latency from the start of the batched query to this repo's result
+            record_poll(f"{config['owner']}/{config['repo']}", outcome, time.monotonic() - started)
+            with self.busy_lock:
+                self.busy.discard(i)
+
+    def run_cycle(self):
+        started = time.monotonic()
+        if GITHUB_TOKEN:
+            results = poll_all(self.configs)
+        else:
+            # The GraphQL API does not accept anonymous requests
+            results = [None] * len(self.configs)
+        outcome = "error" if all(result is None for result in results) else "unchanged"
+
+        for i, result in enumerate(results):
+            with self.busy_lock:
+                if i in self.busy:
+                    # The last check for this repo has not finished yet, pick it up next cycle
+                    continue
+                self.busy.add(i)
+            state = self.states[i]
+            if result and result[0][0] == state["latest_release"] and result[1][0] == state["latest_commit"]:
+                self.handle(i, result, started)
+            else:
+                if result:
+                    outcome = "changed"
+                # REST fallbacks may block, keep them off the polling loop
+                threading.Thread(target=self.handle, args=(i, result, started), daemon=True).start()
+        return outcome
+
+    def run(self):
+        if not GITHUB_TOKEN:
+            logging.warning("[GraphQL] No GitHub token configured, using REST for every repo")
+        logging.info(f"[GraphQL] Watching {len(self.configs)} repos every {self.interval}s")
+        # One query per chunk, all charged to the separate GraphQL quota
+        self.scheduler.register("graphql", self.interval, resource="graphql",
+                                calls_per_poll=len(chunk_configs(self.configs)))
+        while True:
+            try:
+                outcome = self.run_cycle()
+            except Exception as e:
+                logging.error(f"[GraphQL] Poll cycle failed: {e}")
+                outcome = "error"
+            self.scheduler.record_result("graphql", outcome)
+            time.sleep(self.scheduler.next_delay("graphql"))
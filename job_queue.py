@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import fnmatch
+import socket
+import sqlite3
+import logging
+import threading
+
+JOBS_DB = "/opt/repo-watcher/state/jobs.db"
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+RETRY_BASE = 60
+RETRY_MAX = 3600
+# Rollback journal: WAL needs shared memory, which build hosts sharing the file over NFS do not have
+JOURNAL_MODE = "DELETE"
+# Quiet period before a commit build may start, config key commit_debounce (0: off)
+COMMIT_DEBOUNCE = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL UNIQUE,
+    repo TEXT NOT NULL,
+    exporter TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    duration REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, available_at);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    exporters TEXT NOT NULL,
+    slots INTEGER NOT NULL,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+
+def worker_id(name=""):
+    """Lease owner for this process, host:pid[:name]."""
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{base}:{name}" if name else base
+
+def _alive(owner):
+    """Whether the process of a lease owner on this host still runs."""
+    try:
+        pid = int(owner.split(":")[1])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def dedup_key(event_type, value, config):
+    return f"{config['owner'].lower()}/{config['repo'].lower()}:{event_type}:{value}"
+
+class JobQueue:
+    """
+    Durable build queue in SQLite (rollback journal, see JOURNAL_MODE).
+
+    Pollers enqueue events with a dedup key, so re-detecting the same
+    release or commit never queues a second build. Workers claim jobs with
+    a lease they have to renew; a job whose lease ran out (crashed worker,
+    killed service) is handed to the next claimer. Failed jobs are retried
+    with exponential backoff up to max_attempts.
+
+    Commit builds are coalesced: they can wait out a quiet period, and a
+    newer head of the same repo supersedes the ones that have not started
+    yet. Release and tag builds are claimed first.
+
+    Build processes on any host sharing the database register themselves
+    with the exporters they can build and a heartbeat; the watcher only
+    has to enqueue.
+    """
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connect() as db:
+            db.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+            db.executescript(SCHEMA)
+
+    def connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA synchronous=FULL")
+            self.local.db = db
+        return db
+
+    def transaction(self):
+        """BEGIN IMMEDIATE so concurrent claimers serialize on the write lock."""
+        return _Transaction(self.connect())
+
+    def enqueue(self, event_type, value, config, max_attempts=MAX_ATTEMPTS):
+        """
+        Queue a build. Returns the job id, or None if the event was already queued.
+
+        A new commit marks the queued commit builds of the same repo that
+        have not started as superseded: it is the newer head. That also
+        holds when the head moves back to a commit queued or built before
+        (revert, force-push), which queues nothing new. A superseded job
+        gives up its dedup key, so its commit can be queued again. A commit
+        build only becomes available after config's commit_debounce, so a
+        burst of pushes can end up as one build of the last one.
+        """
+        now = time.time()
+        exporter = config["repo"].lower().replace('_', '-')
+        repo = f"{config['owner'].lower()}/{config['repo'].lower()}"
+        available_at = now
+        if event_type == "commit":
+            available_at += config.get("commit_debounce", COMMIT_DEBOUNCE)
+        with self.transaction() as db:
+            cur = db.execute(
+                "INSERT OR IGNORE INTO jobs (dedup_key, repo, exporter, event_type, value, config, "
+                "max_attempts, available_at, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (dedup_key(event_type, value, config), repo, exporter, event_type, value,
+                 json.dumps(config), max_attempts, available_at, now))
+            if cur.rowcount:
+                job_id = head_id = cur.lastrowid
+            else:
+                job_id = None
+                head_id = db.execute("SELECT id FROM jobs WHERE dedup_key = ?",
+                                     (dedup_key(event_type, value, config), )).fetchone()["id"]
+            superseded = 0
+            if event_type == "commit":
+                superseded = db.execute(
+                    "UPDATE jobs SET status = 'superseded', finished = ?, last_error = ?, "
+                    "dedup_key = dedup_key || '#' || id "
+                    "WHERE repo = ? AND event_type = 'commit' AND status = 'queued' AND id != ?",
+                    (now, f"superseded by job {head_id}", repo, head_id)).rowcount
+        if superseded:
+            logging.info(f"[{repo}] Commit {value[:12]} superseded {superseded} queued commit build(s)")
+        return job_id
+
+    def claim(self, owner, lease_seconds=LEASE_SECONDS, commit_slots=None, exporters=None):
+        """
+        Lease the oldest runnable job whose exporter is not being built by
+        anyone else, release and tag builds before commit builds. With
+        commit_slots, no commit build is handed out while this process
+        already runs that many, so a release never waits for a free worker
+        behind them. exporters limits the jobs to matching exporter globs.
+        Returns the job row as a dict, or None.
+        """
+        now = time.time()
+        capable, params = "", []
+        if exporters and "*" not in exporters:
+            capable = "AND (" + " OR ".join("exporter GLOB ?" for _ in exporters) + ") "
+            params = list(exporters)
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT * FROM jobs WHERE "
+                "((status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?)) "
+                "AND exporter NOT IN (SELECT exporter FROM jobs WHERE status = 'running' AND lease_until >= ?) "
+                "AND (event_type != 'commit' OR ? IS NULL OR (SELECT COUNT(*) FROM jobs WHERE status = 'running' "
+                "AND lease_until >= ? AND event_type = 'commit' AND lease_owner LIKE ?) < ?) "
+                + capable +
+                "ORDER BY event_type = 'commit', available_at, id LIMIT 1",
+                [now, now, now, commit_slots, now, f"{worker_id()}:%", commit_slots] + params).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "running":
+                logging.warning(f"[{row['repo']}] Lease of job {row['id']} held by {row['lease_owner']} expired, reclaiming")
+            db.execute(
+                "UPDATE jobs SET status = 'running', lease_owner = ?, lease_until = ?, "
+                "attempts = attempts + 1, started = ? WHERE id = ?",
+                (owner, now + lease_seconds, now, row["id"]))
+        job = dict(row)
+        job["attempts"] += 1
+        job["started"] = now
+        job["config"] = json.loads(job["config"])
+        return job
+
+    def heartbeat(self, job_id, owner, lease_seconds=LEASE_SECONDS):
+        """Extend a lease. False means the lease was lost to another worker."""
+        with self.transaction() as db:
+            cur = db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, owner))
+            return cur.rowcount == 1
+
+    def complete(self, job_id, owner, success, error=None):
+        """Record the outcome of a claimed job, scheduling a retry if attempts are left."""
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ? AND lease_owner = ?", (job_id, owner)).fetchone()
+            if row is None:
+                logging.warning(f"Job {job_id} is no longer leased by {owner}, dropping its result")
+                return None
+            duration = now - row["started"] if row["started"] else None
+            if success:
+                status, available_at = "succeeded", row["available_at"]
+            elif row["attempts"] < row["max_attempts"]:
+                status = "queued"
+                available_at = now + min(RETRY_MAX, RETRY_BASE * 2 ** (row["attempts"] - 1))
+            else:
+                status, available_at = "failed", row["available_at"]
+            db.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, lease_until = NULL, "
+                "finished = ?, duration = ?, last_error = ? WHERE id = ?",
+                (status, available_at, now, duration, error, job_id))
+        return status
+
+    def recover(self):
+        """
+        Requeue jobs leased by processes on this host that are gone. They
+        died with that process, so there is no point waiting for their leases
+        to run out. Other build processes on the host keep their jobs.
+        """
+        with self.transaction() as db:
+            rows = db.execute("SELECT id, lease_owner FROM jobs WHERE status = 'running' AND lease_owner LIKE ?",
+                              (f"{socket.gethostname()}:%", )).fetchall()
+            dead = [row["id"] for row in rows if not _alive(row["lease_owner"])]
+            for job_id in dead:
+                db.execute("UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_until = NULL WHERE id = ?",
+                           (job_id, ))
+            return len(dead)
+
+    # ───────── Build workers ─────────
+
+    def register_worker(self, worker, exporters=("*", ), slots=1):
+        """Announce a build process and the exporter globs it can build."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO workers (id, host, exporters, slots, started, heartbeat) "
+                       "VALUES (?, ?, ?, ?, ?, ?)",
+                       (worker, socket.gethostname(), json.dumps(list(exporters)), slots, now, now))
+
+    def worker_heartbeat(self, worker):
+        """False if the worker is not registered (anymore)."""
+        with self.transaction() as db:
+            cur = db.execute("UPDATE workers SET heartbeat = ? WHERE id = ?", (time.time(), worker))
+            return cur.rowcount == 1
+
+    def unregister_worker(self, worker):
+        with self.transaction() as db:
+            db.execute("DELETE FROM workers WHERE id = ?", (worker, ))
+
+    def workers(self):
+        """Build processes seen within a lease period, with the number of jobs each is running."""
+        now = time.time()
+        db = self.connect()
+        rows = db.execute("SELECT * FROM workers WHERE heartbeat >= ? ORDER BY id", (now - LEASE_SECONDS, )).fetchall()
+        workers = []
+        for row in rows:
+            worker = dict(row)
+            worker["exporters"] = json.loads(worker["exporters"])
+            worker["running"] = db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'running' AND lease_until >= ? AND lease_owner LIKE ?",
+                (now, f"{row['id']}:%")).fetchone()[0]
+            workers.append(worker)
+        return workers
+
+    def can_build(self, exporter):
+        """Whether a live build process accepts jobs for exporter."""
+        return any(fnmatch.fnmatchcase(exporter, glob) for worker in self.workers() for glob in worker["exporters"])
+
+    def running(self):
+        """Jobs with a live lease, whichever process holds it."""
+        rows = self.connect().execute(
+            "SELECT id, repo, event_type, value, started, lease_owner FROM jobs "
+            "WHERE status = 'running' AND lease_until >= ? ORDER BY started", (time.time(), )).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        now = time.time()
+        db = self.connect()
+        counts = {row["status"]: row["n"] for row in
+                  db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        oldest = db.execute("SELECT MIN(created) FROM jobs WHERE status = 'queued' AND available_at <= ?",
+                            (now,)).fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "succeeded": counts.get("succeeded", 0),
+            "failed": counts.get("failed", 0),
+            "superseded": counts.get("superseded", 0),
+            "oldest_queued_wait": round(now - oldest, 1) if oldest else 0,
+        }
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scheduler import get_scheduler
+
+# Prometheus' default buckets, plus longer ones for builds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUILD_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self.lock:
+            values = {k: ([*v[0]], v[1], v[2]) for k, v in self.values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+class CallbackGauge(_Metric):
+    """Gauge read at scrape time; fn() returns {label values tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels, fn):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            logging.warning(f"Metric {self.name} failed: {e}")
+            values = {}
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, labels, fn):
+        return self.register(CallbackGauge(name, help, labels, fn))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Recorded unconditionally: an increment is a dict update under a lock,
+# the text format is only built when /metrics is scraped
+POLL_DURATION = REGISTRY.histogram("repo_watcher_poll_duration_seconds",
+                                   "Time one check of a repo took", ["repo"])
+POLLS = REGISTRY.counter("repo_watcher_polls_total", "Checks of a repo by outcome", ["repo", "outcome"])
+API_REQUESTS = REGISTRY.counter("repo_watcher_github_requests_total",
+                                "GitHub API responses by API and status code", ["api", "code"])
+BUILD_QUEUE_WAIT = REGISTRY.histogram("repo_watcher_build_queue_wait_seconds",
+                                      "Time a build job waited in the queue before a worker claimed it",
+                                      ["exporter"], BUILD_BUCKETS)
+MIRROR_LOCK_WAIT = REGISTRY.histogram("repo_watcher_mirror_lock_wait_seconds",
+                                      "Time spent waiting for a git mirror lock", ["mirror"])
+BUILD_DURATION = REGISTRY.histogram("repo_watcher_build_duration_seconds",
+                                    "Pipeline run time by result", ["exporter", "result"], BUILD_BUCKETS)
+BUILDS = REGISTRY.counter("repo_watcher_builds_total", "Finished build attempts by result", ["exporter", "result"])
+WEBHOOKS = REGISTRY.counter("repo_watcher_webhooks_total", "Webhook deliveries by event and outcome", ["event", "outcome"])
+
+_last_success = {}
+_last_success_lock = threading.Lock()
+
+def record_poll(repo, outcome, seconds):
+    POLL_DURATION.observe(seconds, repo)
+    POLLS.inc(repo, outcome)
+    if outcome != "error":
+        with _last_success_lock:
+            _last_success[repo] = time.time()
+
+def _seconds_since_success():
+    now = time.time()
+    with _last_success_lock:
+        return {(repo, ): now - ts for repo, ts in _last_success.items()}
+
+REGISTRY.callback("repo_watcher_seconds_since_last_success",
+                  "Seconds since the last check of a repo that did not fail", ["repo"], _seconds_since_success)
+
+def _rate_limits(field):
+    limits = get_scheduler().rate_limit_snapshot()
+    return {(resource, ): rate[field] for resource, rate in limits.items()}
+
+REGISTRY.callback("repo_watcher_rate_limit_remaining", "GitHub API calls left until the reset",
+                  ["resource"], lambda: _rate_limits("remaining"))
+REGISTRY.callback("repo_watcher_rate_limit_reset_timestamp_seconds", "When the GitHub API quota resets",
+                  ["resource"], lambda: _rate_limits("reset"))
+
+def watch_builds(builds):
+    """Export queue depth and running jobs of a BuildExecutor."""
+    def depth():
+        stats = builds.queue.stats()
+        return {(status, ): stats[status] for status in ("queued", "running", "succeeded", "failed", "superseded")}
+    REGISTRY.callback("repo_watcher_build_queue_depth", "Build jobs by queue status", ["status"], depth)
+    REGISTRY.callback("repo_watcher_build_oldest_queued_seconds", "Wait of the oldest runnable queued job", [],
+                      lambda: {(): builds.queue.stats()["oldest_queued_wait"]})
+
+def _staged(staging_dir):
+    """(count, total size) of the .deb files in staging_dir"""
+    count = size = 0
+    try:
+        for entry in os.scandir(staging_dir):
+            if entry.name.endswith(".deb") and entry.is_file():
+                count += 1
+                size += entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return count, size
+
+def watch_staging(staging_dir):
+    """Export the number and total size of staged packages."""
+    # Two metrics, not one with a unit label: a sum over a metric must not add packages to bytes
+    REGISTRY.callback("repo_watcher_staged_packages", "Staged .deb packages", [],
+                      lambda: {(): _staged(staging_dir)[0]})
+    REGISTRY.callback("repo_watcher_staged_bytes", "Total size of the staged .deb packages", [],
+                      lambda: {(): _staged(staging_dir)[1]})
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, addr="0.0.0.0"):
+    """Serve /metrics from a daemon thread."""
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://{addr}:{port}/metrics")
+    return server
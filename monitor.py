@@ -6,15 +6,39 @@ import os
 import time
 import ansible_runner
 import logging
+import fnmatch
 import argparse
+import functools
 import threading
 from datetime import datetime
 from pathlib import Path
-from github_config import GITHUB_TOKEN
+from github_api import API_URL, ValidatorCache, conditional_get, validator_file_for
+from scheduler import get_scheduler, print_status
+from build_executor import BUILD_ROOT, DEFAULT_BUILD_WORKERS, BuildExecutor
+from git_mirror import prepare_worktree
+from artifact_cache import ArtifactCache, artifact_key, hash_role_inputs, restamp
+from build_cache import enforce_budgets
+from release_assets import fetch_prebuilt
+from warm_pipeline import WarmPipeline
+from pipeline_timings import setup_overhead
+from debpkg import version_key
+from state_store import STATE_DB, get_state_store, repo_key
+from metrics import record_poll, start_metrics_server, watch_builds, watch_staging
+from structured_log import route_repo_log, setup_logging
 
 DEFAULT_CONFIG_PATH = "/opt/repo-watcher/configs/dcgm_exporter.json"
-LOCK_TIMEOUT = 600
-GITHUB_TOKEN = ""
+PIPELINE_DIR = "/opt/repo-watcher/pipeline"
+# ansible_runner runs PLAYBOOK from PROJECT_DIR, the roles come from PIPELINE_DIR (roles_path)
+PROJECT_DIR = "/opt/repo-watcher/ansible"
+PLAYBOOK = "playbooks/build-packages.yml"
+STAGING_DIR = "/opt/staging"
+# The compare API lists at most this many files, a longer diff is cut off
+COMPARE_FILE_LIMIT = 300
+# Tags fetched to find the latest one of a repo without releases, by REST and GraphQL alike
+TAG_PAGE = 100
+
+artifacts = ArtifactCache()
+warm_state = WarmPipeline(PIPELINE_DIR)
 
 def format_date(iso_str):
     try:
@@ -23,28 +47,40 @@ def format_date(iso_str):
     except Exception:
         return iso_str or "unknown"
     
-def acquire_with_timeout(lock, timeout, name=""):
-    logging.info(f"[{name}] Waiting to acquire lock (timeout: {timeout}s)...")
-    acquired = lock.acquire(timeout=timeout)
-    if not acquired:
-        logging.error(f"[{name}] Timed out after {timeout}s waiting for lock.")
-    else:
-        logging.info(f"[{name}] Acquired lock - starting pipeline")
-    return acquired
-
-def trigger_pipeline(event_type, value, repo_config, lock):
-    """Trigger Ansible pipeline for a repository release or commit change."""
+def custom_stats(r):
+    """Data the playbook published with set_stats, from the runner's final stats event."""
+    for event in reversed(list(r.events)):
+        if event.get("event") == "playbook_on_stats":
+            return event.get("event_data", {}).get("artifact_data") or {}
+    return {}
+
+def log_build_cache_stats(owner_repo_name, stats):
+    for name, cache in stats.items():
+        if "hits" in cache:
+            logging.info(f"[{owner_repo_name}] Build cache {name}: {cache['hits']} hits, {cache['misses']} misses, "
+                         f"{cache['bytes'] // 1024 ** 2} MiB")
+
+def trigger_pipeline(event_type, value, repo_config, build_root=BUILD_ROOT, private_data_dir=PIPELINE_DIR, timer=None,
+                     staging_dir=None, cold=False):
+    """
+    Trigger Ansible pipeline for a repository release or commit change.
+
+    Called from BuildExecutor workers, which pass a build_root and runner
+    private_data_dir of their own to every job, and a TaskTimer that
+    receives the runner's events. The package goes to staging_dir,
+    STAGING_DIR unless a build worker collects it elsewhere first.
+
+    Builds run warm (cached facts, setup skipped while its fingerprint
+    holds) unless cold is set or the repo config has "warm_pipeline": false.
+    """
+    staging_dir = staging_dir or STAGING_DIR
     repo_name = repo_config['repo'].lower()
     owner_name = repo_config['owner'].lower()
     exporter_name = repo_name.replace('_', '-')
     owner_repo_name = f"{owner_name}/{repo_name}"
 
-    
-    print(f"[ACTION] Trigger: {event_type} detected - {value} ({owner_repo_name})")
-    logging.info(f"[ACTION] Triggering pipeline for {event_type} in {owner_repo_name}: {value}")
-    
-    if not acquire_with_timeout(lock, LOCK_TIMEOUT, owner_repo_name):
-        return False
+    fields = {"repo": owner_repo_name, "event": "pipeline", "value": value}
+    logging.info(f"[ACTION] Triggering pipeline for {event_type} in {owner_repo_name}: {value}", extra=fields)
 
     # Determine version and git reference
     if event_type == "release":
@@ -60,169 +96,402 @@ def trigger_pipeline(event_type, value, repo_config, lock):
     else:
         version = "unknown"
         git_ref = "HEAD"
+
+    extravars = {
+        "exporter_name": exporter_name,
+        "version": version,
+        "git_ref": git_ref,
+        "repo_url": repo_config["repo_url"],
+        "service_user": "james",
+        "service_group": "james",
+        "maintainer": "james@stninc.com",
+        "description": f"{repo_name} exporter for monitoring {owner_name} components",
+        "build_root": build_root,
+        "staging_dir": staging_dir,
+        "source_prepared": False,
+        # Not ansible_date_time: warm builds read facts from a cache up to a day old
+        "build_date": time.strftime("%Y-%m-%d"),
+        "build_time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    package_path = os.path.join(staging_dir, f"{exporter_name}_{version}.deb")
+
+    # Upstream publishes binaries: package the release's own instead of building it. The
+    # exporter role has to be able to render the service file on its own (tasks/service.yml)
+    service_tasks = os.path.join(PIPELINE_DIR, "roles", exporter_name, "tasks", "service.yml")
+    if event_type == "release" and repo_config.get("release_assets") and not os.path.exists(service_tasks):
+        logging.warning(f"[{owner_repo_name}] {service_tasks} is missing, building the release from source")
+    elif event_type == "release" and repo_config.get("release_assets"):
+        try:
+            started = time.monotonic()
+            extravars["prebuilt_binary"] = fetch_prebuilt(repo_config, value, os.path.join(build_root, "prebuilt"))
+            logging.info(f"[{owner_repo_name}] Using the release binary of {value}, "
+                         f"fetched and verified in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            logging.warning(f"[{owner_repo_name}] Release asset fast path failed, building from source: {e}")
+
+    # Check the source out of the persistent mirror, the common role then skips its clone
+    source = None
+    if repo_config.get("git_mirror", True) and "prebuilt_binary" not in extravars:
+        try:
+            source = prepare_worktree(repo_config["repo_url"], git_ref, os.path.join(build_root, exporter_name))
+            extravars["source_prepared"] = True
+            logging.info(f"[{owner_repo_name}] Source {source['commit'][:7]} ready: "
+                         f"fetch {source['fetch_seconds']}s, checkout {source['checkout_seconds']}s")
+        except Exception as e:
+            logging.warning(f"[{owner_repo_name}] Mirror checkout failed, falling back to a full clone: {e}")
+
+    # Same tree + same pipeline inputs = same package, only the version differs
+    cache_key = None
+    if source and repo_config.get("artifact_cache", True):
+        inputs = hash_role_inputs(PIPELINE_DIR, exporter_name, extravars, os.path.join(PROJECT_DIR, PLAYBOOK))
+        cache_key = artifact_key(source["tree"], exporter_name, inputs)
+        cached = artifacts.lookup(cache_key)
+        if cached:
+            try:
+                restamp(cached["path"], package_path, version, git_ref)
+                logging.info(f"[{owner_repo_name}] Tree {source['tree'][:7]} already packaged as {cached['version']}, "
+                             f"re-stamped as {os.path.basename(package_path)} without building")
+                return True
+            except Exception as e:
+                logging.warning(f"[{owner_repo_name}] Re-stamping cached package failed, building instead: {e}")
     
     # Run ansible pipeline
     try:
-        runner_path = "/opt/repo-watcher/pipeline"
-        os.makedirs(runner_path, exist_ok=True)
+        os.makedirs(private_data_dir, exist_ok=True)
+        enforce_budgets(exporter_name)
+
+        runner_options = {}
+        warm = not cold and repo_config.get("warm_pipeline", True)
+        if warm:
+            extravars["setup_warm"] = warm_state.is_warm(exporter_name, extravars)
+            runner_options = warm_state.runner_options()
         
+        started = time.monotonic()
         r = ansible_runner.run(
-            private_data_dir=runner_path,
-            project_dir = '/opt/repo-watcher/ansible',
-            playbook='playbooks/build-packages.yml',
-            extravars={
-                "exporter_name": exporter_name,
-                "version": version,
-                "git_ref": git_ref,
-                "repo_url": repo_config["repo_url"],
-                "service_user": "james",
-                "service_group": "james",
-                "maintainer": "james@stninc.com",
-                "description": f"{repo_name} exporter for monitoring {owner_name} components",
-                "build_root": "/tmp/build",
-                "staging_dir": "/opt/staging"
-            }
+            private_data_dir=private_data_dir,
+            project_dir=PROJECT_DIR,
+            inventory=os.path.join(PIPELINE_DIR, "inventory"),
+            playbook=PLAYBOOK,
+            extravars=extravars,
+            event_handler=timer.handle if timer else None,
+            **runner_options
         )
 
+        fields.update(status=r.status, duration=round(time.monotonic() - started, 3))
+        if warm:
+            warm_state.record(exporter_name, extravars, r.rc == 0)
+        if timer:
+            setup, total = setup_overhead(timer.results())
+            logging.info(f"[{owner_repo_name}] Setup overhead {setup:.1f}s of {total:.1f}s "
+                         f"({'warm' if extravars.get('setup_warm') else 'cold'})",
+                         extra={"repo": owner_repo_name, "event": "setup_overhead", "duration": round(setup, 3)})
         if r.rc != 0:
-            logging.error(f"[{owner_repo_name}] Pipeline failed! Status: {r.status}, RC: {r.rc}")
+            logging.error(f"[{owner_repo_name}] Pipeline failed! Status: {r.status}, RC: {r.rc}", extra=fields)
             return False
         else:
-            logging.info(f"[{owner_repo_name}] Pipeline finished successfully: {r.status}")
+            logging.info(f"[{owner_repo_name}] Pipeline finished successfully: {r.status}", extra=fields)
+            log_build_cache_stats(owner_repo_name, custom_stats(r).get("build_cache", {}))
+            if cache_key and os.path.exists(package_path):
+                artifacts.store(cache_key, package_path, version, source["commit"])
             return True
 
     except Exception as e:
-        logging.error(f"[{owner_repo_name}] Pipeline execution error: {e}")
+        logging.error(f"[{owner_repo_name}] Pipeline execution error: {e}", extra=fields)
         return False
-    finally:
-        lock.release()
-        logging.info(f"[{owner_repo_name}] Released lock")
 
-def monitor_single_repo(config, lock):
-    OWNER = config["owner"]
-    REPO = config["repo"]
-    CHECK_INTERVAL = config["check_interval"]
-    STATE_FILE = config["state_file"]
-    LOG_FILE = config.get("log_file", "log/repo-watcher.log")
-    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-    BRANCH = config.get("branch", "main")
+def load_state(config):
+    """Last seen release/commit of a repo; an old state_file is imported on first use."""
+    return get_state_store().cursor(repo_key(config), config.get("state_file"))
 
-    OWNER_REPO_NAME = f"{OWNER}/{REPO}"
-    REPO_NAME = f"{REPO}"
-    RELEASES_URL = f"https://api.github.com/repos/{OWNER}/{REPO}/releases/latest"
-    COMMITS_URL = f"https://api.github.com/repos/{OWNER}/{REPO}/commits?sha={BRANCH}&per_page=1"
+def get_repo_logger(config):
+    owner = config["owner"]
+    repo = config["repo"]
+    log_file = config.get("log_file", "log/repo-watcher.log")
 
-    logger = logging.getLogger(f"{OWNER}/{REPO}")
+    logger = logging.getLogger(f"{owner}/{repo}")
     logger.setLevel(logging.INFO)
 
-    file_handler = logging.FileHandler(LOG_FILE)
-    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-    file_handler.setFormatter(formatter)
-
-    if not logger.handlers:
-        logger.addHandler(file_handler)
+    # No handler of its own: records go through the shared queue, the
+    # listener thread writes them to log_file
+    route_repo_log(logger.name, log_file)
+    return logger
 
-    # Ensure log path exists
-    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+def tag_key(name):
+    """Sort key of a tag: Debian version order without the v prefix, 1.0-rc1 before 1.0."""
+    return version_key(name.lstrip("vV").replace("-", "~"))
 
-    def load_state():
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, "r") as f:
-                return json.load(f)
-        return {"latest_release": "", "latest_commit": ""}
+def latest_tag(names):
+    """
+    The newest of a repo's tag names, or None. REST lists tags by name and
+    GraphQL by whatever order it was asked for, so both pick by version.
+    """
+    return max(names, key=tag_key, default=None)
 
-    def save_state(state):
-        os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
-        with open(STATE_FILE, "w") as f:
-            json.dump(state, f)
+def check_release(owner, repo, validators, logger):
+    """Check for latest release, falling back to tags if releases aren't available"""
+    try:
+        # First try the releases endpoint
+        releases_url = f"{API_URL}/repos/{owner}/{repo}/releases/latest"
+        return tuple(conditional_get(releases_url, validators,
+                                     lambda data: [data["tag_name"], data.get("published_at", "unknown"), "release"]))
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 404:
+            # If no releases found, try tags
+            logger.info(f"[{owner}/{repo}] No releases found, checking tags instead")
+            tags_url = f"{API_URL}/repos/{owner}/{repo}/tags?per_page={TAG_PAGE}"
+            tag = conditional_get(tags_url, validators,
+                                  lambda data: [latest_tag([t["name"] for t in data]), "unknown", "tag"] if data else None)
+            if tag:
+                return tuple(tag)
+    # Re-raise the error if it's not a 404 or if tags lookup failed
+        logger.error(f"[{owner}/{repo}] GitHub API Error: {e}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"[{owner}/{repo}] GitHub API Request Exception: {e}")
+
+    return None, None, None
+
+def check_commit(owner, repo, branch, validators, logger):
+    commits_url = f"{API_URL}/repos/{owner}/{repo}/commits?sha={branch}&per_page=1"
+    try:
+        return tuple(conditional_get(commits_url, validators,
+                                     lambda data: [data[0]["sha"], data[0]["commit"]["committer"]["date"]]))
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"[{owner}/{repo}] GitHub API HTTP Error (commit): {e}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"[{owner}/{repo}] GitHub API Request Exception (release): {e}")
+    return None, None
+
+def changed_paths(owner, repo, base, head, logger):
+    """
+    Files changed from base to head according to the compare API, renamed
+    files under both names. None when the list cannot be trusted: an API
+    error, a truncated file list, or a head that is not simply ahead of
+    base (force push).
+    """
+    compare_url = f"{API_URL}/repos/{owner}/{repo}/compare/{base}...{head}"
+    try:
+        data = conditional_get(compare_url, None, lambda data: data)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"[{owner}/{repo}] GitHub API Error (compare): {e}")
+        return None
+    files = data.get("files")
+    if data.get("status") != "ahead" or files is None or len(files) >= COMPARE_FILE_LIMIT:
+        return None
+    paths = set()
+    for changed in files:
+        paths.add(changed["filename"])
+        if changed.get("previous_filename"):
+            paths.add(changed["previous_filename"])
+    return sorted(paths)
+
+def relevant_paths(config, paths):
+    """
+    paths matching the config's include_paths globs (all if unset) and
+    none of its exclude_paths globs. A * also matches across directories.
+    """
+    include = config.get("include_paths") or ["*"]
+    exclude = config.get("exclude_paths") or []
+    return [path for path in paths
+            if any(fnmatch.fnmatchcase(path, glob) for glob in include)
+            and not any(fnmatch.fnmatchcase(path, glob) for glob in exclude)]
+
+def commit_needs_build(config, base, head, logger):
+    """
+    Whether the commits from base to head touch a path the config's path
+    filters care about. Without filters, without a base, or without a
+    trustworthy list of changed files, every new head is built.
+    """
+    if not base or not (config.get("include_paths") or config.get("exclude_paths")):
+        return True
+    owner_repo_name = f"{config['owner']}/{config['repo']}"
+    paths = changed_paths(config["owner"], config["repo"], base, head, logger)
+    if paths is None:
+        logger.info(f"[{owner_repo_name}] Changed files of {base[:7]}...{head[:7]} unknown, building to be safe")
+        return True
+    if not relevant_paths(config, paths):
+        logger.info(f"[{owner_repo_name}] Skipping build of {head[:7]}: none of its {len(paths)} changed file(s) "
+                    f"match the path filters", extra={"repo": owner_repo_name, "event": "skipped", "value": head})
+        return False
+    return True
 
-    def check_release(owner, repo):
-        """Check for latest release, falling back to tags if releases aren't available"""
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+def handle_check_result(config, state, release, commit, builds, logger):
+    """
+    Compare a polled release/commit with the saved state and queue a build
+    on change. Shared by the REST watchers and the GraphQL poller.
 
-        try:
-            # First try the releases endpoint
-            releases_url = f"https://api.github.com/repos/{owner}/{repo}/releases/latest"
-            r = requests.get(releases_url, headers=headers, timeout=10)
-            r.raise_for_status()
-            data = r.json()
-            return data["tag_name"], data.get("published_at", "unknown"), "release"
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                # If no releases found, try tags
-                logger.info(f"[{owner}/{repo}] No releases found, checking tags instead")
-                tags_url = f"https://api.github.com/repos/{owner}/{repo}/tags"
-                r = requests.get(tags_url, headers=headers, timeout=10)
-                r.raise_for_status()
-                if r.json():
-                    latest_tag = r.json()[0]
-                    return latest_tag["name"], "unknown", "tag"
-        # Re-raise the error if it's not a 404 or if tags lookup failed
-            logger.error(f"[{owner}/{repo}] GitHub API Error: {e}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"[{owner}/{repo}] GitHub API Request Exception: {e}")
-    
-        return None, None, None
+    The job queue is durable, so the state advances as soon as the build is
+    queued; retries and restarts are handled by the build workers. A commit
+    that only touches filtered-out paths advances the state without a build.
 
-    def check_commit():
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+    Returns "changed", "unchanged" or "error" for the poll scheduler.
+    """
+    OWNER_REPO_NAME = f"{config['owner']}/{config['repo']}"
+    BRANCH = config.get("branch", "main")
+    store = get_state_store()
+
+    latest_release, raw_release_date, release_type = release
+    latest_commit, raw_commit_date = commit
+
+    if not latest_release or not latest_commit:
+        logger.warning(f"[{OWNER_REPO_NAME}] Skipping check cycle due to API error.",
+                       extra={"repo": OWNER_REPO_NAME, "event": "error"})
+        return "error"
+
+    release_date = format_date(raw_release_date)
+    commit_date = format_date(raw_commit_date)
+
+    if latest_release != state["latest_release"]:
+        logger.info(f"[{OWNER_REPO_NAME}] New {release_type} detected: {latest_release} (published: {release_date})",
+                    extra={"repo": OWNER_REPO_NAME, "event": release_type, "value": latest_release})
+        job_id = builds.submit(release_type, latest_release, config)
+        state["latest_release"] = latest_release
+        state["latest_commit"] = latest_commit
+        store.record_event(repo_key(config), release_type, latest_release, state,
+                           published=raw_release_date, job_id=job_id)
+        return "changed"
+
+    elif latest_commit != state["latest_commit"]:
+        logger.info(f"[{OWNER_REPO_NAME}] New commit detected on {BRANCH}: {latest_commit} (date: {commit_date})",
+                    extra={"repo": OWNER_REPO_NAME, "event": "commit", "value": latest_commit})
+        job_id = None
+        if commit_needs_build(config, state["latest_commit"], latest_commit, logger):
+            job_id = builds.submit("commit", latest_commit, config)
+        state["latest_commit"] = latest_commit
+        store.record_event(repo_key(config), "commit", latest_commit, state, published=raw_commit_date, job_id=job_id)
+        return "changed"
 
-        try:
-            r = requests.get(COMMITS_URL, headers=headers, timeout=10)
-            r.raise_for_status()
-            data = r.json()[0]
-            return data["sha"], data["commit"]["committer"]["date"]
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"[{OWNER_REPO_NAME}] GitHub API HTTP Error (commit): {e}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"[{OWNER_REPO_NAME}] GitHub API Request Exception (release): {e}")
-        return None, None
+    else:
+        # One line, identical until something changes, so the repeat filter can collapse it
+        logger.info(f"[{OWNER_REPO_NAME}] No new release or commit detected. "
+                    f"Latest release: {state['latest_release']} (published: {release_date}), "
+                    f"latest commit: {state['latest_commit']} (date: {commit_date})",
+                    extra={"repo": OWNER_REPO_NAME, "event": "unchanged"})
+        return "unchanged"
+
+def webhook_result(event, payload, state, branch):
+    """
+    (release, commit) for handle_check_result from a webhook payload, the
+    other half taken from the cursor. None if the delivery changes nothing
+    watched; "check" if it needs a real check (tags, or no cursor yet).
+    """
+    if not state["latest_release"] or not state["latest_commit"]:
+        return "check"
+    if event == "push":
+        if payload.get("ref") != f"refs/heads/{branch}" or payload.get("deleted") or not payload.get("after"):
+            return None
+        head = payload.get("head_commit") or {}
+        return (state["latest_release"], None, "release"), (payload["after"], head.get("timestamp"))
+    if event == "release":
+        release = payload.get("release") or {}
+        # releases/latest never returns drafts or prereleases
+        if payload.get("action") not in ("published", "released") or release.get("draft") or release.get("prerelease"):
+            return None
+        return (release["tag_name"], release.get("published_at"), "release"), (state["latest_commit"], None)
+    if event == "create" and payload.get("ref_type") == "tag":
+        # Tags only count for repos without releases, let check_release decide
+        return "check"
+    return None
+
+class WatcherControl:
+    """Lets another thread stop a watcher, or wake it after its config changed."""
+
+    def __init__(self):
+        self.stopped = False
+        self.event = threading.Event()
+
+    def stop(self):
+        self.stopped = True
+        self.event.set()
+
+    def wake(self):
+        self.event.set()
+
+    def sleep(self, seconds):
+        """Sleep unless woken first. True if woken."""
+        woken = self.event.wait(seconds)
+        self.event.clear()
+        return woken
+
+def monitor_single_repo(config, builds, webhooks=None, control=None):
+    """
+    Poll one repo until control.stop(). config may be updated in place by
+    the caller; branch and interval changes apply from the next poll.
+    """
+    OWNER = config["owner"]
+    REPO = config["repo"]
+    STATE_FILE = config["state_file"]
 
-    def run_check(state):
-        try:
-            latest_release, raw_release_date, release_type = check_release(OWNER, REPO)
-            latest_commit, raw_commit_date = check_commit()
-
-            if not latest_release or not latest_commit:
-                logger.warning(f"[{OWNER_REPO_NAME}] Skipping check cycle due to API error.")
-                return
-
-            release_date = format_date(raw_release_date)
-            commit_date = format_date(raw_commit_date)
-
-            if latest_release != state["latest_release"]:
-                logger.info(f"[{OWNER_REPO_NAME}] New {release_type} detected: {latest_release} (published: {release_date})")
-                print(f"[INFO] [{OWNER_REPO_NAME}] New {release_type} detected: {latest_release} (published: {release_date})")
-                is_successful = trigger_pipeline(release_type, latest_release, config, lock)
-                if is_successful:
-                    state["latest_release"] = latest_release
-                    state["latest_commit"] = latest_commit
-                    save_state(state)
-
-            elif latest_commit != state["latest_commit"]:
-                logger.info(f"[{OWNER_REPO_NAME}] New commit detected on {BRANCH}: {latest_commit} (date: {commit_date})")
-                print(f"[INFO] [{OWNER_REPO_NAME}] New commit detected on {BRANCH}: {latest_commit} (date: {commit_date})")
-                is_successful = trigger_pipeline("commit", latest_commit, config, lock)
-                if is_successful:
-                    state["latest_commit"] = latest_commit
-                    save_state(state)
+    OWNER_REPO_NAME = f"{OWNER}/{REPO}"
+    control = control or WatcherControl()
 
-            else:
-                msg = (f"No new release or commit detected.\n"
-                       f"Latest release: {state['latest_release']} (published: {release_date})\n"
-                       f"Latest commit: {state['latest_commit']} (date: {commit_date})")
-                print(f"[{OWNER_REPO_NAME}]: {msg}")
-                logger.info(f"[{OWNER_REPO_NAME}]: {msg}")
+    # ETag/Last-Modified validators survive restarts next to the state file
+    validators = ValidatorCache(validator_file_for(STATE_FILE))
+    logger = get_repo_logger(config)
+    scheduler = get_scheduler()
 
-        except Exception as e:
-            logger.error(f"[{OWNER_REPO_NAME}] Error occurred: {e}")
+    # Polls and webhook deliveries both move the cursor
+    check_lock = threading.Lock()
 
-    state = load_state()
-    logger.info(f"[{OWNER_REPO_NAME}] Starting monitoring with check interval: {CHECK_INTERVAL}s")
-    
-    while True:
-        run_check(state)
-        time.sleep(CHECK_INTERVAL)
+    def run_check(state):
+        with check_lock:
+            try:
+                release = check_release(OWNER, REPO, validators, logger)
+                commit = check_commit(OWNER, REPO, config.get("branch", "main"), validators, logger)
+                return handle_check_result(config, state, release, commit, builds, logger)
+            except Exception as e:
+                logger.error(f"[{OWNER_REPO_NAME}] Error occurred: {e}")
+                return "error"
+            finally:
+                validators.save()
+
+    def on_webhook(event, payload):
+        with check_lock:
+            result = webhook_result(event, payload, state, config.get("branch", "main"))
+            if result is None:
+                return "ignored"
+            if result != "check":
+                logger.info(f"[{OWNER_REPO_NAME}] Webhook: {event} event")
+                return handle_check_result(config, state, result[0], result[1], builds, logger)
+        logger.info(f"[{OWNER_REPO_NAME}] Webhook: {event} event, checking the API")
+        return run_check(state)
+
+    def poll_interval():
+        return webhooks.poll_interval(config) if webhooks else config["check_interval"]
+
+    state = load_state(config)
+    if webhooks:
+        webhooks.register(OWNER_REPO_NAME, on_webhook)
+        logger.info(f"[{OWNER_REPO_NAME}] Receiving webhooks, polling only to reconcile")
+    interval = poll_interval()
+    logger.info(f"[{OWNER_REPO_NAME}] Starting monitoring with check interval: {interval}s")
+
+    # Start at a random phase so watchers do not all hit the API together
+    # Owned by control: a stopped watcher that is still finishing a check
+    # must not unregister the thread that replaced it
+    delay = scheduler.register(OWNER_REPO_NAME, interval, owner=control)
+    try:
+        while True:
+            if control.sleep(delay):
+                if control.stopped:
+                    break
+                # Config changed: take the new interval, again from a random phase
+                if poll_interval() != interval:
+                    interval = poll_interval()
+                    logger.info(f"[{OWNER_REPO_NAME}] Check interval is now {interval}s")
+                delay = scheduler.register(OWNER_REPO_NAME, interval, owner=control)
+                continue
+            started = time.monotonic()
+            outcome = run_check(state)
+            record_poll(OWNER_REPO_NAME, outcome, time.monotonic() - started)
+            scheduler.record_result(OWNER_REPO_NAME, outcome)
+            if control.stopped:
+                break
+            delay = scheduler.next_delay(OWNER_REPO_NAME)
+    finally:
+        scheduler.unregister(OWNER_REPO_NAME, owner=control)
+        if webhooks:
+            webhooks.unregister(OWNER_REPO_NAME, on_webhook)
+        logger.info(f"[{OWNER_REPO_NAME}] Stopped monitoring")
 
 def reset_state(confirm=True):
     STATE_FILES_DIR = "/opt/repo-watcher/state"
@@ -235,17 +504,19 @@ def reset_state(confirm=True):
             print("[CANCELLED] No changes made.")
             return
     
-    # Clean state files
+    # Clean state files and the state store
     if os.path.exists(STATE_FILES_DIR):
+        state_db = os.path.basename(STATE_DB)
         for file in os.listdir(STATE_FILES_DIR):
-            if file.endswith(".json"):
+            if file.endswith(".json") or file in (state_db, f"{state_db}-wal", f"{state_db}-shm"):
                 os.remove(os.path.join(STATE_FILES_DIR, file))
                 print(f"[OK] Removed state file: {file}")
     
     # Clean log files
     if os.path.exists(LOG_FILES_DIR):
         for file in os.listdir(LOG_FILES_DIR):
-            if file.endswith(".log"):
+            # Rotated files too (name.log.1, ...)
+            if file.endswith(".log") or ".log." in file:
                 os.remove(os.path.join(LOG_FILES_DIR, file))
                 print(f"[OK] Removed log file: {file}")
     
@@ -257,15 +528,44 @@ if __name__ == "__main__":
     parser.add_argument("--config", "-c", help="Path to config file", default=DEFAULT_CONFIG_PATH)
     parser.add_argument("--once", action="store_true", help="Run a single check cycle and exit")
     parser.add_argument("--reset", action="store_true", help="Reset state/log files and exit")
+    parser.add_argument("--status", action="store_true", help="Show the poll scheduler status of the running watcher and exit")
     parser.add_argument("--multi", action="store_true", help="Monitor multiple repos from configs directory")
+    parser.add_argument("--graphql", action="store_true", help="With --multi: poll all repos with batched GraphQL queries")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="With --multi: run all watchers on one asyncio event loop")
+    parser.add_argument("--build-workers", type=int, default=DEFAULT_BUILD_WORKERS, help="Number of pipeline jobs that may run at once, 0 leaves them to build_worker.py processes")
+    parser.add_argument("--cold", action="store_true", help="Gather facts and run every setup task on each build")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--webhook-port", type=int, help="Receive GitHub push/release/create webhooks on this port")
     args = parser.parse_args()
 
     if args.reset:
         reset_state()
         exit(0)
 
-    # Global lock for ansible operations
-    lock = threading.Lock()
+    if args.status:
+        print_status()
+        exit(0)
+
+    if args.webhook_port and (args.graphql or args.use_async):
+        parser.error("--webhook-port works with the per-repo REST watchers, not --graphql/--async")
+
+    setup_logging()
+
+    builds = webhooks = None
+    # --once only checks; the job queue and state store under /opt are opened by the modes that build
+    if args.multi or not args.once:
+        # Shared build pool, jobs for the same exporter still run one at a time
+        builds = BuildExecutor(functools.partial(trigger_pipeline, cold=args.cold), workers=args.build_workers)
+        get_scheduler().add_status_source("builds", builds.stats)
+        if args.metrics_port:
+            watch_builds(builds)
+            watch_staging(STAGING_DIR)
+            start_metrics_server(args.metrics_port)
+
+        if args.webhook_port:
+            from webhook import WebhookReceiver
+            webhooks = WebhookReceiver()
+            webhooks.start(args.webhook_port)
 
     if args.multi:
         # Monitor multiple repositories
@@ -276,12 +576,25 @@ if __name__ == "__main__":
             logging.error("No config files found in configs/")
             exit(1)
         
+        if args.graphql or args.use_async:
+            from graphql_poller import BatchedWatcher
+            from async_monitor import run_async
+            configs = []
+            for cfg_file in config_files:
+                with open(cfg_file) as f:
+                    configs.append(json.load(f))
+            if args.graphql:
+                BatchedWatcher(configs, builds).run()
+            else:
+                run_async(configs, builds)
+            exit(0)
+
         threads = []
         for cfg_file in config_files:
             with open(cfg_file) as f:
                 config = json.load(f)
             
-            t = threading.Thread(target=monitor_single_repo, args=(config, lock))
+            t = threading.Thread(target=monitor_single_repo, args=(config, builds, webhooks))
             t.daemon = True
             t.start()
             threads.append(t)
@@ -296,12 +609,11 @@ if __name__ == "__main__":
         
         if args.once:
             # Single run for testing
-            state = load_state(config["state_file"])
             run_check = getattr(monitor_single_repo, "run_check", None)
             if callable(run_check):
-                run_check(state)
+                run_check(load_state(config))
             else:
                 logging.error("Single run mode not available")
         else:
             # Continuous monitoring
-            monitor_single_repo(config, lock)
\ No newline at end of file
+            monitor_single_repo(config, builds, webhooks)
\ No newline at end of file
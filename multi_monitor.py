@@ -2,69 +2,183 @@
 
 import os
 import json
+import argparse
+import functools
 import threading
 import time
 import logging
 from pathlib import Path
-from monitor import monitor_single_repo
+from monitor import STAGING_DIR, WatcherControl, get_repo_logger, monitor_single_repo, trigger_pipeline
+from graphql_poller import BatchedWatcher
+from async_monitor import run_async
+from build_executor import DEFAULT_BUILD_WORKERS, BuildExecutor
+from scheduler import get_scheduler
+from metrics import start_metrics_server, watch_builds, watch_staging
+from webhook import WebhookReceiver
+from config_watcher import ConfigWatcher
+from structured_log import setup_logging
 
 CONFIG_DIR = Path("configs")  
 DEFAULT_INTERVAL = 120 
+# How long a reloaded repo waits for its old watcher to finish a check
+STOP_TIMEOUT = 60
 
-lock = threading.Lock()
-
-def monitor_worker(config_path):
+def load_config(config_path):
     with open(config_path) as f:
         config = json.load(f)
 
-    owner = config["owner"]
-    repo = config["repo"]
-    repo_name = f"{owner}/{repo}"
-    
-    sanitized_repo = repo.replace('-', '_').replace('/', '_').lower()
+    sanitized_repo = config["repo"].replace('-', '_').replace('/', '_').lower()
     
     log_dir = "/opt/repo-watcher/log"
     os.makedirs(log_dir, exist_ok=True)
     
-    log_file_path = os.path.join(log_dir, f"{sanitized_repo}.log")
-    config["log_file"] = log_file_path
-    
-    logger = logging.getLogger(repo_name)
-    logger.setLevel(logging.INFO)
-    
-    file_handler = logging.FileHandler(log_file_path)
-    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-    file_handler.setFormatter(formatter)
-    
-    if logger.handlers:
-        logger.handlers.clear()
-    
-    logger.addHandler(file_handler)
+    config["log_file"] = os.path.join(log_dir, f"{sanitized_repo}.log")
+    return config
 
-    startup_msg = f"Starting watcher for {repo_name} (check interval: {config.get('check_interval', DEFAULT_INTERVAL)}s)"
-    print(f"[Thread] [{repo_name}] {startup_msg}")
-    logger.info(f"[Thread] [{repo_name}] {startup_msg}")
+def monitor_worker(config_path, builds, webhooks=None, control=None, config=None):
+    config = config or load_config(config_path)
+
+    repo_name = f"{config['owner']}/{config['repo']}"
+    logger = get_repo_logger(config)
+    logger.info(f"[Thread] [{repo_name}] Starting watcher for {repo_name} "
+                f"(check interval: {config.get('check_interval', DEFAULT_INTERVAL)}s)")
     
-    monitor_single_repo(config, lock)
+    monitor_single_repo(config, builds, webhooks, control)
+
+def repo_identity(config):
+    return f"{config['owner'].lower()}/{config['repo'].lower()}"
+
+class Fleet:
+    """
+    The REST watcher threads for a set of config files. reconcile() starts,
+    stops and updates watchers to match the files; a repo whose config did
+    not change keeps its thread, cursor and validator cache.
+    """
+
+    def __init__(self, builds, webhooks=None):
+        self.builds = builds
+        self.webhooks = webhooks
+        self.lock = threading.Lock()
+        # repo -> {"path", "config", "control", "thread"}
+        self.watchers = {}
+
+    def reconcile(self, config_paths):
+        with self.lock:
+            wanted = {}
+            for path in config_paths:
+                try:
+                    config = load_config(path)
+                    repo = repo_identity(config)
+                except (OSError, ValueError, KeyError, AttributeError) as e:
+                    logging.error(f"[Config] Ignoring {path}: {e}")
+                    # A half-written file must not stop a running watcher
+                    for repo, watcher in self.watchers.items():
+                        if watcher["path"] == str(path):
+                            wanted[repo] = (watcher["path"], watcher["config"])
+                    continue
+                if repo in wanted:
+                    logging.warning(f"[Config] {path} watches {repo} again, already configured in {wanted[repo][0]}")
+                    continue
+                wanted[repo] = (str(path), config)
 
-def main():
+            for repo in set(self.watchers) - set(wanted):
+                self._stop(repo)
+            for repo, (path, config) in wanted.items():
+                watcher = self.watchers.get(repo)
+                if watcher is None:
+                    self._start(repo, path, config)
+                elif watcher["config"] != config:
+                    self._update(repo, path, config)
+                else:
+                    watcher["path"] = path
+
+    def _start(self, repo, path, config):
+        control = WatcherControl()
+        thread = threading.Thread(target=monitor_worker, args=(path, self.builds, self.webhooks, control, config),
+                                  name=f"watch-{repo}", daemon=True)
+        self.watchers[repo] = {"path": path, "config": config, "control": control, "thread": thread}
+        logging.info(f"[Config] Starting watcher for {repo} from {path}")
+        thread.start()
+
+    def _stop(self, repo):
+        watcher = self.watchers.pop(repo)
+        logging.info(f"[Config] Stopping watcher for {repo}, {watcher['path']} is gone")
+        watcher["control"].stop()
+        # Give the old thread a chance to finish its check. If it is still
+        # running when the repo is added back, it only drops its own
+        # scheduler and webhook entries, not those of the new watcher.
+        watcher["thread"].join(STOP_TIMEOUT)
+        if watcher["thread"].is_alive():
+            logging.warning(f"[Config] Watcher for {repo} is still finishing a check")
+
+    def _update(self, repo, path, config):
+        watcher = self.watchers[repo]
+        current = watcher["config"]
+        changed = sorted(key for key in set(current) | set(config) if current.get(key) != config.get(key))
+        logging.info(f"[Config] Updating {repo} in place: {', '.join(changed)}")
+        # Same dict the watcher reads, new keys first so it never misses one
+        current.update(config)
+        for key in set(current) - set(config):
+            del current[key]
+        watcher["path"] = path
+        watcher["control"].wake()
+
+def main(graphql=False, use_async=False, build_workers=DEFAULT_BUILD_WORKERS, metrics_port=None, webhook_port=None,
+         reload=True, cold=False):
+    # Watcher threads only enqueue records, one listener thread writes them
+    setup_logging()
 
     config_files = list(CONFIG_DIR.glob("*.json"))
-    if not config_files:
-        msg = "[ERROR] No config files found in configs/"
-        print(f"{msg}")
-        logging.error(f"{msg}")
+    # Only the REST watchers pick up configs added later
+    if not config_files and (graphql or use_async or not reload):
+        logging.error("[ERROR] No config files found in configs/")
         return
 
-    threads = []
-    for cfg in config_files:
-        t = threading.Thread(target=monitor_worker, args=(cfg,))
-        t.daemon = True
-        t.start()
-        threads.append(t)
+    # Shared build pool, jobs for the same exporter still run one at a time
+    builds = BuildExecutor(functools.partial(trigger_pipeline, cold=cold), workers=build_workers)
+    get_scheduler().add_status_source("builds", builds.stats)
+    if metrics_port:
+        watch_builds(builds)
+        watch_staging(STAGING_DIR)
+        start_metrics_server(metrics_port)
+
+    # Deliveries go to the REST watcher of each repo, which then only polls to reconcile
+    webhooks = None
+    if webhook_port:
+        webhooks = WebhookReceiver()
+        webhooks.start(webhook_port)
 
-    for t in threads:
-        t.join()
+    if graphql:
+        # One batched GraphQL poller instead of a REST thread per repo
+        BatchedWatcher([load_config(cfg) for cfg in config_files], builds).run()
+        return
+
+    if use_async:
+        # All watchers as tasks on one event loop instead of a thread per repo
+        run_async([load_config(cfg) for cfg in config_files], builds)
+        return
+
+    fleet = Fleet(builds, webhooks)
+    if not reload:
+        fleet.reconcile(config_files)
+        while True:
+            time.sleep(3600)
+
+    # Added, removed and edited configs apply without a restart
+    ConfigWatcher(CONFIG_DIR, fleet.reconcile).run()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Watch every repo in the configs directory")
+    parser.add_argument("--graphql", action="store_true", help="Poll all repos with batched GraphQL queries")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run all watchers on one asyncio event loop")
+    parser.add_argument("--build-workers", type=int, default=DEFAULT_BUILD_WORKERS, help="Number of pipeline jobs that may run at once, 0 leaves them to build_worker.py processes")
+    parser.add_argument("--cold", action="store_true", help="Gather facts and run every setup task on each build")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--webhook-port", type=int, help="Receive GitHub push/release/create webhooks on this port")
+    parser.add_argument("--no-reload", dest="reload", action="store_false", help="Read the configs once at startup")
+    args = parser.parse_args()
+    if args.webhook_port and (args.graphql or args.use_async):
+        parser.error("--webhook-port works with the per-repo REST watchers, not --graphql/--async")
+
+    main(graphql=args.graphql, use_async=args.use_async, build_workers=args.build_workers,
+         metrics_port=args.metrics_port, webhook_port=args.webhook_port, reload=args.reload, cold=args.cold)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import threading
+from datetime import datetime, timezone
+from statistics import median
+
+RESULT_EVENTS = {
+    "runner_on_ok": "ok",
+    "runner_on_failed": "failed",
+    "runner_on_skipped": "skipped",
+    "runner_on_unreachable": "unreachable",
+}
+# A task is a regression when it is this much slower than its median...
+REGRESSION_FACTOR = 1.5
+# ...and at least this many seconds slower
+REGRESSION_MIN_SECONDS = 5
+FLAME_WIDTH = 50
+# Fixed per-build overhead: fact gathering and the setup a warm build skips
+SETUP_TASKS = {
+    "Gathering Facts",
+    "Ensure service user exists",
+    "Install node exporter dependencies",
+    "Install DCGM exporter dependencies",
+    "Install dependencies",
+    "Set proper permissions for service directories",
+}
+
+def _timestamp(value):
+    """ansible-runner event times are naive ISO 8601 in UTC"""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+class TaskTimer:
+    """
+    ansible_runner event_handler collecting start/end of every task.
+
+    A task starts with its playbook_on_task_start event and ends with the
+    last runner_on_* result for it. Tasks that produce no host result
+    (include_role, skipped blocks) end where the next task starts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.order = []
+
+    def handle(self, event):
+        kind = event.get("event")
+        data = event.get("event_data") or {}
+        uuid = data.get("task_uuid")
+        if uuid and kind == "playbook_on_task_start":
+            with self.lock:
+                if uuid not in self.tasks:
+                    self.tasks[uuid] = {"task": data.get("task") or data.get("name") or "?",
+                                        "role": data.get("role") or "", "action": data.get("task_action"),
+                                        "start": _timestamp(event.get("created")), "end": None, "status": None}
+                    self.order.append(uuid)
+        elif uuid and kind in RESULT_EVENTS:
+            end = _timestamp(data.get("end")) or _timestamp(event.get("created"))
+            with self.lock:
+                task = self.tasks.get(uuid)
+                if task is not None and end is not None:
+                    task["end"] = max(task["end"] or end, end)
+                    # failed wins over ok/skipped on another host or loop item
+                    if task["status"] != "failed":
+                        task["status"] = RESULT_EVENTS[kind]
+        # Keep the event for the runner's own artifacts
+        return True
+
+    def results(self):
+        """Tasks in run order with start, end and duration."""
+        with self.lock:
+            tasks = [dict(self.tasks[uuid]) for uuid in self.order]
+        for i, task in enumerate(tasks):
+            if task["end"] is None:
+                following = next((t["start"] for t in tasks[i + 1:] if t["start"]), None)
+                task["end"] = following or task["start"]
+                task["status"] = task["status"] or "no result"
+            task["duration"] = (task["end"] - task["start"]) if task["start"] and task["end"] else 0.0
+        return tasks
+
+def setup_overhead(tasks):
+    """(seconds spent in SETUP_TASKS, seconds of the whole run) of one run's tasks."""
+    setup = sum(t["duration"] for t in tasks if t["task"] in SETUP_TASKS)
+    starts = [t["start"] for t in tasks if t["start"] is not None]
+    ends = [t["end"] for t in tasks if t["end"] is not None]
+    return setup, (max(ends) - min(starts)) if starts and ends else 0.0
+
+# ───────── Reports (used by repoctl timings) ─────────
+
+def overhead(rows):
+    """
+    (exporter, mode, runs, average setup, average run) per exporter, where
+    mode is "warm" for runs that skipped a setup task and "cold" otherwise.
+    """
+    runs = {}
+    for row in rows:
+        runs.setdefault((row["exporter"], row["job_id"], row["attempt"]), []).append(row)
+    grouped = {}
+    for (exporter, _, _), tasks in runs.items():
+        warm = any(t["task"] in SETUP_TASKS and t["status"] == "skipped" for t in tasks)
+        grouped.setdefault((exporter, "warm" if warm else "cold"), []).append(setup_overhead(tasks))
+    return [(exporter, mode, len(found), sum(s for s, _ in found) / len(found), sum(t for _, t in found) / len(found))
+            for (exporter, mode), found in sorted(grouped.items())]
+
+def slowest_tasks(rows, top=15):
+    """(exporter, role, task, runs, average, max) sorted by average duration."""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault((row["exporter"], row["role"], row["task"]), []).append(row["duration"])
+    summary = [(exporter, role, task, len(durations), sum(durations) / len(durations), max(durations))
+               for (exporter, role, task), durations in grouped.items()]
+    summary.sort(key=lambda s: s[4], reverse=True)
+    return summary[:top]
+
+def regressions(rows, window=10):
+    """
+    Tasks of each exporter's latest run that were slower than the median of
+    the same task over the previous window runs.
+    Returns (exporter, job_id, role, task, duration, median).
+    """
+    runs = {}
+    for row in rows:
+        runs.setdefault(row["exporter"], {}).setdefault((row["job_id"], row["attempt"]), []).append(row)
+    found = []
+    for exporter, by_run in runs.items():
+        ordered = sorted(by_run, key=lambda run: min(r["start"] or 0 for r in by_run[run]))
+        if len(ordered) < 2:
+            continue
+        latest, history = ordered[-1], ordered[-1 - window:-1]
+        previous = {}
+        for run in history:
+            for row in by_run[run]:
+                previous.setdefault((row["role"], row["task"]), []).append(row["duration"])
+        for row in by_run[latest]:
+            durations = previous.get((row["role"], row["task"]))
+            if not durations:
+                continue
+            baseline = median(durations)
+            if row["duration"] > baseline * REGRESSION_FACTOR and row["duration"] - baseline >= REGRESSION_MIN_SECONDS:
+                found.append((exporter, latest[0], row["role"], row["task"], row["duration"], baseline))
+    return found
+
+def flame(rows, width=FLAME_WIDTH):
+    """
+    Text breakdown of one run: every role with its share of the run, and
+    under it every task as a bar placed at its offset on the run's timeline.
+    """
+    rows = [r for r in rows if r["start"] is not None]
+    if not rows:
+        return []
+    run_start = min(r["start"] for r in rows)
+    total = max(max(r["end"] or r["start"] for r in rows) - run_start, 1e-9)
+
+    lines = []
+    roles = []
+    for row in sorted(rows, key=lambda r: r["seq"]):
+        if not roles or roles[-1][0] != row["role"]:
+            roles.append((row["role"], []))
+        roles[-1][1].append(row)
+    for role, tasks in roles:
+        spent = sum(t["duration"] for t in tasks)
+        lines.append(f"{role or '(play)'} {spent:.1f}s ({spent / total:.0%})")
+        for t in tasks:
+            offset = int((t["start"] - run_start) / total * width)
+            length = max(1, round(t["duration"] / total * width)) if t["duration"] > 0 else 0
+            bar = " " * offset + "█" * min(length, width - offset)
+            lines.append(f"  |{bar:<{width}}| {t['duration']:7.1f}s  {t['task']}"
+                         f"{'' if t['status'] in ('ok', None) else ' [' + t['status'] + ']'}")
+    return lines
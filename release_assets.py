@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import fnmatch
+import hashlib
+import logging
+import tarfile
+import requests
+from github_api import API_URL, REQUEST_TIMEOUT, conditional_get, get_session
+
+ASSET_DIR = "/opt/repo-watcher/cache/assets"
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 5
+DEFAULT_CHECKSUMS = "sha256sums.txt"
+
+class AssetError(Exception):
+    pass
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_checksums(text):
+    """{file name: sha256} from a sha256sum-style file ("<hex>  <name>", "*" marks binary mode)."""
+    sums = {}
+    for line in text.splitlines():
+        parts = line.split(None, 1)
+        if len(parts) == 2:
+            sums[parts[1].strip().lstrip("*")] = parts[0].lower()
+    return sums
+
+def download(url, dest, size=None, attempts=DOWNLOAD_ATTEMPTS):
+    """
+    Stream url to dest. Data goes to dest.part first; a retry, or a later
+    call after a crash, continues where that file ends with a Range request.
+    """
+    part = f"{dest}.part"
+    session = get_session()
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    for attempt in range(1, attempts + 1):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if size is not None and offset >= size:
+            break
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as r:
+                if r.status_code == 416:
+                    # The partial file does not fit the asset (anymore), start over
+                    os.remove(part)
+                    continue
+                r.raise_for_status()
+                resumed = r.status_code == 206 and r.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+                with open(part, "ab" if resumed else "wb") as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+            if size is None or os.path.getsize(part) >= size:
+                break
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Downloading {url} failed (attempt {attempt}/{attempts}): {e}")
+        time.sleep(min(30, 2 ** attempt))
+    else:
+        raise AssetError(f"could not download {url} in {attempts} attempts")
+    os.replace(part, dest)
+
+def extract_binary(tarball, binary, dest):
+    """Stream the member of tarball named binary (in any directory) to dest, executable."""
+    tmp_path = f"{dest}.tmp"
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with tarfile.open(tarball, "r|*") as tar:
+        for member in tar:
+            if member.isfile() and os.path.basename(member.name) == binary:
+                with tar.extractfile(member) as src, open(tmp_path, "wb") as out:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                        out.write(chunk)
+                os.chmod(tmp_path, 0o755)
+                os.replace(tmp_path, dest)
+                return dest
+    raise AssetError(f"{os.path.basename(tarball)} has no file named {binary}")
+
+def fetch_prebuilt(config, tag, dest_dir):
+    """
+    Path of the upstream binary of release tag, extracted into dest_dir.
+
+    config["release_assets"] names the tarball (glob "pattern"), the sums
+    file published with it ("checksums") and the file to take out of it
+    ("binary", the repo name by default). Tarballs are kept per exporter
+    under ASSET_DIR and only downloaded again if they do not match.
+    """
+    spec = config["release_assets"]
+    owner, repo = config["owner"], config["repo"]
+    exporter = repo.lower().replace('_', '-')
+    release = conditional_get(f"{API_URL}/repos/{owner}/{repo}/releases/tags/{tag}", None, lambda data: data)
+    assets = {asset["name"]: asset for asset in release.get("assets", [])}
+
+    matches = fnmatch.filter(assets, spec["pattern"])
+    if len(matches) != 1:
+        raise AssetError(f"{len(matches)} assets of {tag} match {spec['pattern']}")
+    name = matches[0]
+    checksums = spec.get("checksums", DEFAULT_CHECKSUMS)
+    if checksums not in assets:
+        raise AssetError(f"{tag} has no {checksums} to verify {name} with")
+    tarball = os.path.join(ASSET_DIR, exporter, name)
+    sums_path = f"{tarball}.{checksums}"
+    download(assets[checksums]["browser_download_url"], sums_path, assets[checksums].get("size"))
+    with open(sums_path) as f:
+        expected = parse_checksums(f.read()).get(name)
+    os.remove(sums_path)
+    if not expected:
+        raise AssetError(f"{checksums} of {tag} has no entry for {name}")
+
+    if not (os.path.exists(tarball) and sha256_file(tarball) == expected):
+        download(assets[name]["browser_download_url"], tarball, assets[name].get("size"))
+        actual = sha256_file(tarball)
+        if actual != expected:
+            os.remove(tarball)
+            raise AssetError(f"{name} has sha256 {actual}, {checksums} says {expected}")
+    # Only the tarball of the latest release is worth keeping
+    for other in os.listdir(os.path.dirname(tarball)):
+        if other != name:
+            os.remove(os.path.join(os.path.dirname(tarball), other))
+
+    return extract_binary(tarball, spec.get("binary", repo), os.path.join(dest_dir, spec.get("binary", repo)))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import calendar
+import random
+import logging
+import threading
+
+STATUS_FILE = "/opt/repo-watcher/state/scheduler_status.json"
+STATUS_DUMP_INTERVAL = 30
+
+CALLS_PER_POLL = 2          # releases/latest (or tags) + commits
+JITTER = 0.1                # +/- 10% on every delay
+MAX_BACKOFF = 3600
+MIN_INTERVAL = 30
+RATE_LIMIT_RESERVE = 100    # calls left alone for retries and manual use
+
+class RepoSchedule:
+    """Polling state for one watcher."""
+
+    def __init__(self, key, base_interval, resource="core", calls_per_poll=CALLS_PER_POLL, owner=None):
+        self.key = key
+        self.owner = owner
+        self.resource = resource
+        self.calls_per_poll = calls_per_poll
+        self.errors = 0
+        self.polls = 0
+        self.changes = 0
+        self.last_poll = None
+        self.last_change = None
+        self.next_poll = None
+        self.set_base_interval(base_interval)
+
+    def set_base_interval(self, base_interval):
+        self.base_interval = base_interval
+        self.min_interval = max(MIN_INTERVAL, base_interval / 4)
+        self.max_interval = base_interval * 8
+        self.interval = min(max(getattr(self, "interval", base_interval), self.min_interval), self.max_interval)
+
+    def as_dict(self):
+        return {
+            "resource": self.resource,
+            "base_interval": self.base_interval,
+            "interval": round(self.interval, 1),
+            "errors": self.errors,
+            "polls": self.polls,
+            "changes": self.changes,
+            "last_poll": self.last_poll,
+            "last_change": self.last_change,
+            "next_poll": self.next_poll,
+        }
+
+class PollScheduler:
+    """
+    Decides when every watcher polls next.
+
+    - Tracks the X-RateLimit-* headers across all watchers, per resource.
+    - Stretches every interval when the fleet would exhaust the remaining
+      quota before the reset, and adds jitter so polls spread out.
+    - Backs off exponentially per repo while its checks keep failing.
+    - Halves a repo's interval when it changes and slowly grows it while it
+      stays quiet, bounded to [base/4, base*8].
+    """
+
+    def __init__(self, status_file=STATUS_FILE):
+        self.lock = threading.Lock()
+        self.repos = {}
+        self.rate_limits = {}
+        self.blocked_until = 0
+        self.status_file = status_file
+        self.status_sources = {}
+        self.dumper = None
+
+    def register(self, key, base_interval, resource="core", calls_per_poll=CALLS_PER_POLL, owner=None):
+        """
+        Add a watcher and return its initial delay, a random phase within its
+        interval. The last owner to register a key owns it.
+        """
+        with self.lock:
+            sched = self.repos.get(key)
+            if sched is None:
+                self.repos[key] = RepoSchedule(key, base_interval, resource, calls_per_poll, owner)
+            else:
+                sched.set_base_interval(base_interval)
+                sched.owner = owner
+        self.start_status_dumper()
+        return random.uniform(0, base_interval)
+
+    def unregister(self, key, owner=None):
+        """Drop a watcher, unless another owner has registered the key since."""
+        with self.lock:
+            sched = self.repos.get(key)
+            if sched is not None and sched.owner is owner:
+                del self.repos[key]
+
+    def update_rate_limit(self, headers):
+        """Record the rate-limit headers of any GitHub response."""
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        try:
+            entry = {
+                "limit": int(headers.get("X-RateLimit-Limit", 0)),
+                "remaining": int(remaining),
+                "reset": int(headers.get("X-RateLimit-Reset", 0)),
+                "updated": time.time(),
+            }
+        except ValueError:
+            return
+        resource = headers.get("X-RateLimit-Resource", "core")
+        retry_after = headers.get("Retry-After")
+        with self.lock:
+            self.rate_limits[resource] = entry
+            if retry_after and retry_after.isdigit():
+                # Secondary rate limit, nobody polls until it has passed
+                self.blocked_until = max(self.blocked_until, time.time() + int(retry_after))
+
+    def update_graphql_rate_limit(self, rate):
+        """Record the rateLimit node of a GraphQL response."""
+        try:
+            reset = calendar.timegm(time.strptime(rate["resetAt"], "%Y-%m-%dT%H:%M:%SZ"))
+            entry = {"limit": int(rate.get("limit", 0)), "remaining": int(rate["remaining"]),
+                     "reset": int(reset), "updated": time.time()}
+        except (KeyError, TypeError, ValueError):
+            return
+        with self.lock:
+            self.rate_limits["graphql"] = entry
+
+    def record_result(self, key, outcome):
+        """outcome is "changed", "unchanged" or "error"."""
+        now = time.time()
+        with self.lock:
+            sched = self.repos.get(key)
+            if sched is None:
+                return
+            sched.polls += 1
+            if outcome == "error":
+                sched.errors += 1
+                return
+            sched.errors = 0
+            if outcome == "changed":
+                sched.changes += 1
+                sched.last_change = now
+                sched.interval = max(sched.min_interval, sched.interval / 2)
+            else:
+                sched.interval = min(sched.max_interval, sched.interval * 1.1)
+
+    def _stretch(self, resource, now):
+        """
+        Factor to slow every watcher of a resource down by so the fleet fits
+        the remaining quota. None means the quota is gone until the reset.
+        """
+        rate = self.rate_limits.get(resource)
+        if not rate or rate["reset"] <= now:
+            return 1.0
+        budget = (rate["remaining"] - RATE_LIMIT_RESERVE) / (rate["reset"] - now)
+        if budget <= 0:
+            return None
+        demand = sum(s.calls_per_poll / s.interval for s in self.repos.values() if s.resource == resource)
+        return max(1.0, demand / budget)
+
+    def next_delay(self, key):
+        """Seconds the watcher should sleep before its next poll."""
+        now = time.time()
+        with self.lock:
+            sched = self.repos[key]
+            sched.last_poll = now
+
+            if sched.errors:
+                delay = min(MAX_BACKOFF, sched.base_interval * 2 ** min(sched.errors, 10))
+            else:
+                delay = sched.interval
+
+            stretch = self._stretch(sched.resource, now)
+            if stretch is None or (stretch > 1 and delay * stretch > MAX_BACKOFF):
+                # The quota refills at the reset, spread this watcher over the interval after it
+                until_reset = self.rate_limits[sched.resource]["reset"] - now
+                delay = max(min(delay, MAX_BACKOFF), until_reset + random.uniform(0, sched.interval))
+            else:
+                delay *= stretch
+            delay = max(delay, self.blocked_until - now)
+            delay *= random.uniform(1 - JITTER, 1 + JITTER)
+
+            sched.next_poll = now + delay
+            return delay
+
+    def rate_limit_snapshot(self):
+        with self.lock:
+            return {k: dict(v) for k, v in self.rate_limits.items()}
+
+    def add_status_source(self, name, source):
+        """Include source() under name in every status dump."""
+        with self.lock:
+            self.status_sources[name] = source
+
+    def status(self):
+        with self.lock:
+            status = {
+                "generated_at": time.time(),
+                "blocked_until": self.blocked_until,
+                "rate_limits": {k: dict(v) for k, v in self.rate_limits.items()},
+                "repos": {k: s.as_dict() for k, s in self.repos.items()},
+            }
+            sources = dict(self.status_sources)
+        for name, source in sources.items():
+            status[name] = source()
+        return status
+
+    def dump_status(self):
+        os.makedirs(os.path.dirname(self.status_file), exist_ok=True)
+        tmp_path = f"{self.status_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp_path, self.status_file)
+
+    def start_status_dumper(self, every=STATUS_DUMP_INTERVAL):
+        with self.lock:
+            if self.dumper is not None:
+                return
+            self.dumper = threading.Thread(target=self._dump_loop, args=(every,), daemon=True)
+        self.dumper.start()
+
+    def _dump_loop(self, every):
+        while True:
+            time.sleep(every)
+            try:
+                self.dump_status()
+            except OSError as e:
+                logging.warning(f"Could not write scheduler status to {self.status_file}: {e}")
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide scheduler shared by every watcher."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PollScheduler()
+    return _scheduler
+
+def print_status(status_file=STATUS_FILE):
+    try:
+        with open(status_file) as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        print(f"[INFO] No scheduler status at {status_file}, is the watcher running?")
+        return
+
+    now = time.time()
+    print(f"Scheduler status ({int(now - status['generated_at'])}s old):")
+    for resource, rate in status["rate_limits"].items():
+        print(f"  rate limit [{resource}]: {rate['remaining']}/{rate['limit']} remaining, "
+              f"resets in {max(0, int(rate['reset'] - now))}s")
+    if status["blocked_until"] > now:
+        print(f"  blocked by Retry-After for {int(status['blocked_until'] - now)}s")
+    for key, repo in sorted(status["repos"].items()):
+        next_in = int(repo["next_poll"] - now) if repo["next_poll"] else "?"
+        print(f"  {key}: interval {repo['interval']}s (base {repo['base_interval']}s), "
+              f"errors {repo['errors']}, changes {repo['changes']}/{repo['polls']}, next poll in {next_in}s")
+
+    builds = status.get("builds")
+    if builds:
+        print(f"Builds: {len(builds['running'])}/{builds['workers']} workers busy, {builds['queue_depth']} queued "
+              f"(oldest waiting {builds['oldest_queued_wait']}s), avg wait {builds['avg_wait']}s, "
+              f"max wait {builds['max_wait']}s, {builds['completed']} done, {builds['failed']} failed")
+        for job_id, job in builds["running"].items():
+            where = f" on {job['worker']}" if job.get("worker") else ""
+            print(f"  {job_id}: {job['repo']} {job['event']} {job['value']} running for {job['running_for']}s{where}")
+        for worker in builds.get("build_hosts", []):
+            print(f"  worker {worker['id']}: {worker['running']}/{worker['slots']} busy, "
+                  f"builds {', '.join(worker['exporters'])}")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+STATE_DB = "/opt/repo-watcher/state/state.db"
+# Rollback journal: build workers on other hosts record builds here over NFS, WAL needs shared memory
+JOURNAL_MODE = "DELETE"
+# GitHub only redelivers on request, a week of delivery ids is plenty
+DELIVERY_RETENTION = 7 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursors (
+    repo TEXT PRIMARY KEY,
+    latest_release TEXT NOT NULL DEFAULT '',
+    latest_commit TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    repo TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    published TEXT,
+    detected REAL NOT NULL,
+    job_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_repo ON events (repo, detected);
+CREATE TABLE IF NOT EXISTS builds (
+    job_id INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    repo TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    started REAL,
+    finished REAL NOT NULL,
+    duration REAL,
+    error TEXT,
+    PRIMARY KEY (job_id, attempt)
+);
+CREATE INDEX IF NOT EXISTS builds_repo ON builds (repo, finished);
+CREATE TABLE IF NOT EXISTS task_timings (
+    job_id INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    exporter TEXT NOT NULL,
+    role TEXT NOT NULL,
+    task TEXT NOT NULL,
+    status TEXT,
+    start REAL,
+    end REAL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (job_id, attempt, seq)
+);
+CREATE INDEX IF NOT EXISTS task_timings_exporter ON task_timings (exporter, start);
+CREATE TABLE IF NOT EXISTS deliveries (
+    id TEXT PRIMARY KEY,
+    event TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    received REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deliveries_received ON deliveries (received);
+"""
+
+def repo_key(config):
+    return f"{config['owner'].lower()}/{config['repo'].lower()}"
+
+class StateStore:
+    """
+    Watcher state in one SQLite database (rollback journal): the last seen release
+    and commit per repo, every detected event, and every build attempt.
+
+    A cursor and the event that moved it are written in one transaction,
+    so a crash never leaves them disagreeing.
+    """
+
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self.connect()
+        db.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        db.executescript(SCHEMA)
+
+    def connect(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA synchronous=FULL")
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        db = self.connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    # ───────── Cursors and events ─────────
+
+    def cursor(self, repo, state_file=None):
+        """
+        {"latest_release", "latest_commit"} for a repo. The first time a
+        repo is seen, its old *_state.json (if any) is imported.
+        """
+        row = self.connect().execute("SELECT * FROM cursors WHERE repo = ?", (repo,)).fetchone()
+        if row is None and state_file:
+            return self.migrate_file(repo, state_file)
+        if row is None:
+            return {"latest_release": "", "latest_commit": ""}
+        return {"latest_release": row["latest_release"], "latest_commit": row["latest_commit"]}
+
+    def migrate_file(self, repo, state_file):
+        try:
+            with open(state_file) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {"latest_release": "", "latest_commit": ""}
+        except (OSError, ValueError) as e:
+            logging.warning(f"[{repo}] Ignoring unreadable state file {state_file}: {e}")
+            return {"latest_release": "", "latest_commit": ""}
+        cursor = {"latest_release": state.get("latest_release") or "", "latest_commit": state.get("latest_commit") or ""}
+        with self.transaction() as db:
+            db.execute("INSERT OR IGNORE INTO cursors (repo, latest_release, latest_commit, updated) VALUES (?, ?, ?, ?)",
+                       (repo, cursor["latest_release"], cursor["latest_commit"], os.path.getmtime(state_file)))
+        logging.info(f"[{repo}] Imported state from {state_file}")
+        return cursor
+
+    def record_event(self, repo, event_type, value, cursor, published=None, job_id=None):
+        """Store a detected event and the cursor it advanced to."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("INSERT INTO events (repo, event_type, value, published, detected, job_id) VALUES (?, ?, ?, ?, ?, ?)",
+                       (repo, event_type, value, published, now, job_id))
+            db.execute("INSERT INTO cursors (repo, latest_release, latest_commit, updated) VALUES (?, ?, ?, ?) "
+                       "ON CONFLICT (repo) DO UPDATE SET latest_release = excluded.latest_release, "
+                       "latest_commit = excluded.latest_commit, updated = excluded.updated",
+                       (repo, cursor["latest_release"], cursor["latest_commit"], now))
+
+    def record_delivery(self, delivery_id, event, repo):
+        """Remember a webhook delivery id. False if it was seen before."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("DELETE FROM deliveries WHERE received < ?", (now - DELIVERY_RETENTION,))
+            cur = db.execute("INSERT OR IGNORE INTO deliveries (id, event, repo, received) VALUES (?, ?, ?, ?)",
+                             (delivery_id, event, repo, now))
+            return cur.rowcount == 1
+
+    def forget_delivery(self, delivery_id):
+        """Drop a delivery id again, so a redelivery of a failed delivery is processed."""
+        with self.transaction() as db:
+            db.execute("DELETE FROM deliveries WHERE id = ?", (delivery_id,))
+
+    # ───────── Builds ─────────
+
+    def record_build(self, job_id, attempt, repo, event_type, value, status, started, worker=None, error=None,
+                     exporter=None, tasks=()):
+        """Store a build attempt and, in the same transaction, the timings of its pipeline tasks."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (job_id, attempt, repo, event_type, value, status, worker, started, now,
+                        now - started if started else None, error))
+            db.execute("DELETE FROM task_timings WHERE job_id = ? AND attempt = ?", (job_id, attempt))
+            db.executemany("INSERT INTO task_timings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(job_id, attempt, seq, exporter or repo, t["role"], t["task"], t["status"],
+                             t["start"], t["end"], t["duration"]) for seq, t in enumerate(tasks)])
+
+    # ───────── Queries ─────────
+
+    def cursors(self):
+        return [dict(row) for row in self.connect().execute("SELECT * FROM cursors ORDER BY repo")]
+
+    def events(self, repo=None, limit=50):
+        """
+        Newest events first, each with the outcome of the last attempt of
+        the build it queued (build_status, build_duration).
+        """
+        query = ("SELECT e.*, b.status AS build_status, b.duration AS build_duration, b.attempt AS build_attempt "
+                 "FROM events e LEFT JOIN builds b ON b.job_id = e.job_id AND b.attempt = "
+                 "(SELECT MAX(attempt) FROM builds WHERE job_id = e.job_id) ")
+        params = []
+        if repo:
+            query += "WHERE e.repo GLOB ? "
+            params.append(repo)
+        query += "ORDER BY e.detected DESC, e.id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self.connect().execute(query, params)]
+
+    def builds(self, repo=None, status=None, limit=50):
+        query = "SELECT * FROM builds WHERE 1 = 1 "
+        params = []
+        if repo:
+            query += "AND repo GLOB ? "
+            params.append(repo)
+        if status:
+            query += "AND status = ? "
+            params.append(status)
+        query += "ORDER BY finished DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self.connect().execute(query, params)]
+
+    def task_timings(self, exporter=None, job_id=None, runs=20):
+        """
+        Task rows of the newest runs (job_id, attempt) per exporter, or of
+        every attempt of one job, in run order.
+        """
+        if job_id is not None:
+            query = "SELECT * FROM task_timings WHERE job_id = ? ORDER BY attempt, seq"
+            return [dict(row) for row in self.connect().execute(query, (job_id,))]
+        query = ("WITH recent AS (SELECT job_id, attempt, exporter, ROW_NUMBER() OVER "
+                 "(PARTITION BY exporter ORDER BY MIN(start) DESC) AS n FROM task_timings ")
+        params = []
+        if exporter:
+            query += "WHERE exporter GLOB ? "
+            params.append(exporter)
+        query += ("GROUP BY job_id, attempt, exporter) "
+                  "SELECT t.* FROM task_timings t JOIN recent r ON r.job_id = t.job_id AND r.attempt = t.attempt "
+                  "WHERE r.n <= ? ORDER BY t.exporter, t.job_id, t.attempt, t.seq")
+        params.append(runs)
+        return [dict(row) for row in self.connect().execute(query, params)]
+
+    def build_summary(self, repo=None):
+        """Per repo: number of builds, failures and average/max duration of successful ones."""
+        query = ("SELECT repo, COUNT(*) AS builds, SUM(status = 'failed') AS failed, "
+                 "AVG(CASE WHEN status = 'succeeded' THEN duration END) AS avg_duration, "
+                 "MAX(CASE WHEN status = 'succeeded' THEN duration END) AS max_duration FROM builds ")
+        params = []
+        if repo:
+            query += "WHERE repo GLOB ? "
+            params.append(repo)
+        query += "GROUP BY repo ORDER BY repo"
+        return [dict(row) for row in self.connect().execute(query, params)]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_state_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+    return _store
+
+def migrate_configs(store, config_dir):
+    """Import the *_state.json of every config in config_dir. Returns the repos imported."""
+    imported = []
+    for config_file in sorted(Path(config_dir).glob("*.json")):
+        with open(config_file) as f:
+            config = json.load(f)
+        state_file = config.get("state_file")
+        if not state_file or not os.path.exists(state_file):
+            continue
+        repo = repo_key(config)
+        if store.connect().execute("SELECT 1 FROM cursors WHERE repo = ?", (repo,)).fetchone():
+            print(f"[INFO] {repo} already in the state store, skipping {state_file}")
+            continue
+        store.migrate_file(repo, state_file)
+        print(f"[OK] Imported {state_file} as {repo}")
+        imported.append(repo)
+    return imported
+
+# ───────── CLI ENTRY POINT ─────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import *_state.json files into the state store")
+    parser.add_argument("--configs", default="/opt/repo-watcher/configs", help="Directory of repo configs")
+    parser.add_argument("--db", default=STATE_DB, help="State store path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    imported = migrate_configs(StateStore(args.db), args.configs)
+    print(f"[OK] Imported {len(imported)} repo(s) into {args.db}")
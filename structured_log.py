@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+LOG_DIR = "/opt/repo-watcher/log"
+MAIN_LOG = os.path.join(LOG_DIR, "repo-watcher.log")
+# Size-based rotation of every log file
+MAX_BYTES = 10 * 1024 ** 2
+BACKUPS = 5
+# An identical unchanged-poll message from the same repo is written at most once per window
+REPEAT_WINDOW = 3600
+# Only records logged with one of these events are rate-limited
+REPEAT_EVENTS = ("unchanged",)
+# Record attributes written as JSON fields when set through extra=
+FIELDS = ("repo", "event", "value", "duration", "status", "job_id", "repeated")
+CONSOLE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+_lock = threading.Lock()
+_router = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg and the FIELDS that are set."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RepeatFilter(logging.Filter):
+    """
+    Lets an identical message from the same logger through once per window,
+    for records with an event in REPEAT_EVENTS (the unchanged poll). All
+    other records, and anything at WARNING or above, always pass.
+    The first one after a window carries how many it replaced as "repeated".
+    """
+
+    def __init__(self, window=REPEAT_WINDOW, max_tracked=10000, events=REPEAT_EVENTS):
+        super().__init__()
+        self.window = window
+        self.max_tracked = max_tracked
+        self.events = events
+        # (logger, level, message) -> [time last written, suppressed since]
+        self.seen = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or getattr(record, "event", None) not in self.events:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        entry = self.seen.get(key)
+        if entry and record.created - entry[0] < self.window:
+            entry[1] += 1
+            return False
+        if entry and entry[1]:
+            record.repeated = entry[1]
+        self.seen[key] = [record.created, 0]
+        if len(self.seen) > self.max_tracked:
+            # Messages quote the latest release and commit, old ones never come back
+            self.seen = {k: v for k, v in self.seen.items() if record.created - v[0] < self.window}
+        return True
+
+class RoutingHandler(logging.Handler):
+    """
+    Writes records of a registered repo logger to that repo's own rotating
+    file and everything else to the main log. Files are opened on first use.
+    """
+
+    def __init__(self, main_log=MAIN_LOG, max_bytes=MAX_BYTES, backups=BACKUPS):
+        super().__init__()
+        self.main_log = main_log
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # logger name -> log file
+        self.routes = {}
+        self.files = {}
+
+    def route(self, name, log_file):
+        self.routes[name] = log_file
+
+    def emit(self, record):
+        path = self.routes.get(record.name, self.main_log)
+        handler = self.files.get(path)
+        try:
+            if handler is None:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(path, maxBytes=self.max_bytes,
+                                                               backupCount=self.backups, encoding="utf-8")
+                handler.setFormatter(self.formatter)
+                self.files[path] = handler
+            handler.emit(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        super().close()
+
+class _Listener(logging.handlers.QueueListener):
+    # The repeat filter runs once per record here, before any handler sees it
+    def __init__(self, records, *handlers, repeats):
+        super().__init__(records, *handlers, respect_handler_level=True)
+        self.repeats = repeats
+
+    def handle(self, record):
+        record = self.prepare(record)
+        if self.repeats.filter(record):
+            super().handle(record)
+
+def setup_logging(main_log=MAIN_LOG, level=logging.INFO, console=True, max_bytes=MAX_BYTES,
+                  backups=BACKUPS, repeat_window=REPEAT_WINDOW):
+    """
+    Send every record through one queue to a listener thread that does all
+    of the formatting and file I/O, so logging never blocks a watcher. Safe
+    to call more than once; later calls return the existing router.
+    """
+    global _router
+    with _lock:
+        if _router is not None:
+            return _router
+        router = RoutingHandler(main_log, max_bytes, backups)
+        router.setFormatter(JsonFormatter())
+        handlers = [router]
+        if console:
+            # The journal keeps its plain one-line format
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            handlers.append(stream)
+
+        records = queue.SimpleQueue()
+        listener = _Listener(records, *handlers, repeats=RepeatFilter(repeat_window))
+        listener.start()
+        atexit.register(listener.stop)
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(logging.handlers.QueueHandler(records))
+        _router = router
+        return router
+
+def route_repo_log(name, log_file):
+    """Write the records of logger name to log_file instead of the main log."""
+    setup_logging().route(name, log_file)
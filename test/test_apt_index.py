@@ -0,0 +1,108 @@
+import os
+import gzip
+import lzma
+import hashlib
+
+import pytest
+
+from apt_index import BY_HASH_KEEP, INDEX_FILES, AptIndex, parse_packages
+from catalog import Catalog
+from debpkg import parse_control
+from test_catalog import make_deb
+
+@pytest.fixture
+def repo(tmp_path):
+    """(index, pool dir, catalog) of an empty flat repository."""
+    pool = tmp_path / "www" / "pool"
+    pool.mkdir(parents=True)
+    catalog = Catalog(str(tmp_path / "catalog.db"))
+    return AptIndex(str(tmp_path / "www"), str(pool), catalog), str(pool), catalog
+
+def publish(repo, package, version, payload=b"binary"):
+    index, pool, catalog = repo
+    filename = os.path.basename(make_deb(pool, package, version, payload=payload))
+    catalog.refresh("published", pool)
+    return filename
+
+def read(index, name):
+    with open(os.path.join(index.index_dir, name), "rb") as f:
+        return f.read()
+
+def release_sums(index):
+    """{file name: (size, sha256)} from the SHA256 section of Release"""
+    fields = parse_control(read(index, "Release").decode())
+    sums = {}
+    for line in fields["SHA256"].splitlines():
+        if line.strip():
+            sha256, size, name = line.split()
+            sums[name] = (int(size), sha256)
+    return sums
+
+def test_incremental_update_matches_a_full_rebuild(repo):
+    index, pool, catalog = repo
+    added = [publish(repo, "node-exporter", "1.8.2-1"), publish(repo, "dcgm-exporter", "4.2.0-1"),
+             publish(repo, "dcgm-exporter", "4.10.0-1")]
+    for filename in added:
+        index.update(added=[filename])
+    dropped = publish(repo, "old-exporter", "0.1-1")
+    index.update(added=[dropped])
+    os.remove(os.path.join(pool, dropped))
+    catalog.refresh("published", pool)
+    index.update(removed=[dropped])
+    incremental = read(index, "Packages")
+
+    assert index.rebuild() == 3
+    assert read(index, "Packages") == incremental
+
+def test_stanzas_added_and_removed(repo):
+    index, pool, catalog = repo
+    first = publish(repo, "dcgm-exporter", "4.2.0-1")
+    second = publish(repo, "dcgm-exporter", "4.10.0-1")
+    index.update(added=[second, first])
+    stanzas = parse_packages(read(index, "Packages").decode())
+    assert list(stanzas) == [f"pool/{first}", f"pool/{second}"]  # Debian version order
+
+    fields = parse_control(stanzas[f"pool/{first}"])
+    with open(os.path.join(pool, first), "rb") as f:
+        data = f.read()
+    assert fields["Package"] == "dcgm-exporter"
+    assert fields["Size"] == str(len(data))
+    assert fields["MD5sum"] == hashlib.md5(data).hexdigest()
+    assert fields["SHA256"] == hashlib.sha256(data).hexdigest()
+    # Filename and hashes go right before the Description, like dpkg-scanpackages
+    assert list(fields)[-5:] == ["Filename", "Size", "MD5sum", "SHA256", "Description"]
+
+    index.update(removed=[first])
+    assert list(parse_packages(read(index, "Packages").decode())) == [f"pool/{second}"]
+    index.update(removed=[second])
+    assert read(index, "Packages") == b""
+
+def test_release_lists_every_index_file(repo):
+    index = repo[0]
+    index.update(added=[publish(repo, "node-exporter", "1.8.2-1")])
+    sums = release_sums(index)
+    assert set(sums) == set(INDEX_FILES)
+    for name in INDEX_FILES:
+        data = read(index, name)
+        assert sums[name] == (len(data), hashlib.sha256(data).hexdigest())
+    assert gzip.decompress(read(index, "Packages.gz")) == read(index, "Packages")
+    assert lzma.decompress(read(index, "Packages.xz")) == read(index, "Packages")
+    assert "Acquire-By-Hash: yes" in read(index, "Release").decode()
+
+def test_by_hash_keeps_the_last_generations(repo):
+    index = repo[0]
+    by_hash = os.path.join(index.index_dir, "by-hash", "SHA256")
+    generations = []
+    for i in range(BY_HASH_KEEP + 2):
+        index.update(added=[publish(repo, "exporter", f"1.{i}-1")])
+        sums = release_sums(index)
+        generations.append({sha256 for _, sha256 in sums.values()})
+        # Every file the current Release lists is there under its hash
+        for name, (size, sha256) in sums.items():
+            with open(os.path.join(by_hash, sha256), "rb") as f:
+                assert f.read() == read(index, name)
+
+    kept = set(os.listdir(by_hash))
+    assert set().union(*generations[-BY_HASH_KEEP:]) <= kept
+    assert not kept & set().union(*generations[:-BY_HASH_KEEP])
+    assert len(kept) == BY_HASH_KEEP * len(INDEX_FILES)
@@ -0,0 +1,31 @@
+import os
+
+from artifact_cache import hash_role_inputs
+
+EXTRAVARS = {"exporter_name": "node-exporter", "version": "1.0.0-20260101", "build_root": "/tmp/build/1"}
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+def test_inputs_follow_the_playbook_that_runs(tmp_path):
+    pipeline_dir, playbook = str(tmp_path / "pipeline"), str(tmp_path / "ansible" / "playbooks" / "build-packages.yml")
+    write(os.path.join(pipeline_dir, "roles", "node-exporter", "tasks", "main.yml"), "---\n")
+    write(playbook, "- hosts: localhost\n")
+    before = hash_role_inputs(pipeline_dir, "node-exporter", EXTRAVARS, playbook)
+    # A stale copy under the pipeline dir does not matter
+    write(os.path.join(pipeline_dir, "playbooks", "build-packages.yml"), "- hosts: all\n")
+    assert hash_role_inputs(pipeline_dir, "node-exporter", EXTRAVARS, playbook) == before
+    write(playbook, "- hosts: localhost\n  become: yes\n")
+    assert hash_role_inputs(pipeline_dir, "node-exporter", EXTRAVARS, playbook) != before
+
+def test_inputs_ignore_per_build_values(tmp_path):
+    pipeline_dir, playbook = str(tmp_path / "pipeline"), str(tmp_path / "build-packages.yml")
+    write(os.path.join(pipeline_dir, "roles", "common", "tasks", "main.yml"), "---\n")
+    write(playbook, "---\n")
+    other = dict(EXTRAVARS, version="1.0.0-20260102", build_root="/tmp/build/2")
+    before = hash_role_inputs(pipeline_dir, "node-exporter", EXTRAVARS, playbook)
+    assert hash_role_inputs(pipeline_dir, "node-exporter", other, playbook) == before
+    write(os.path.join(pipeline_dir, "roles", "common", "tasks", "main.yml"), "--- # changed\n")
+    assert hash_role_inputs(pipeline_dir, "node-exporter", other, playbook) != before
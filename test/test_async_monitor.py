@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+
+# async_monitor shares the change logic of monitor.py, which runs the pipeline
+pytest.importorskip("ansible_runner")
+pytest.importorskip("aiohttp")
+
+import monitor
+import async_monitor
+import github_api
+from async_monitor import AsyncEngine
+from scheduler import PollScheduler
+from state_store import StateStore
+from tools.fake_github import FakeGitHub, serve
+
+class Builds:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, event_type, value, config):
+        self.submitted.append((config["repo"], event_type, value))
+        return len(self.submitted)
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    fake = FakeGitHub(repos=6, change_rate=0, tags_only=0.5, latency=0.01, seed=3)
+    server = serve(fake)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(async_monitor, "API_URL", url)
+    monkeypatch.setattr(async_monitor, "GITHUB_TOKEN", "test-token")
+    monkeypatch.setattr(async_monitor, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(async_monitor, "get_repo_logger", lambda config: logging.getLogger("test-async"))
+    store = StateStore(str(tmp_path / "state.db"))
+    monkeypatch.setattr(monitor, "get_state_store", lambda: store)
+    scheduler = PollScheduler(status_file=str(tmp_path / "scheduler_status.json"))
+    fake.scheduler = scheduler
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+def configs(fake, tmp_path):
+    return [{"owner": "bench", "repo": name.split("/")[1], "branch": "main", "check_interval": 0.1,
+             "state_file": str(tmp_path / f"{name.split('/')[1]}_state.json")} for name in sorted(fake.repos)]
+
+async def run_until(engine, done, timeout=10):
+    task = asyncio.ensure_future(engine.run())
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done():
+            assert asyncio.get_running_loop().time() < deadline and not task.done()
+            await asyncio.sleep(0.02)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+def test_engine_queues_a_build_per_repo(github, tmp_path, monkeypatch):
+    saves = []
+    save = github_api.ValidatorCache.save
+
+    def recording_save(cache):
+        saves.append(threading.current_thread() is threading.main_thread())
+        save(cache)
+    monkeypatch.setattr(github_api.ValidatorCache, "save", recording_save)
+
+    builds = Builds()
+    repos = configs(github, tmp_path)
+    engine = AsyncEngine(repos, builds, max_concurrency=4)
+    asyncio.run(run_until(engine, lambda: len(builds.submitted) == len(repos) and len(saves) == len(repos)))
+
+    for config in repos:
+        repo = github.repos[f"bench/{config['repo']}"]
+        event_type = "tag" if repo.tags_only else "release"
+        assert (config["repo"], event_type, repo.tag) in builds.submitted
+        assert github_api.ValidatorCache(github_api.validator_file_for(config["state_file"])).entries
+    # Every save ran in the executor, never on the event loop's thread
+    assert saves and not any(saves)
+
+def test_unchanged_polls_do_not_save(github, tmp_path, monkeypatch):
+    builds = Builds()
+    repos = configs(github, tmp_path)[:1]
+    asyncio.run(run_until(AsyncEngine(repos, builds), lambda: len(builds.submitted) == 1))
+
+    saves = []
+    monkeypatch.setattr(github_api.ValidatorCache, "save", lambda cache: saves.append(cache))
+    # Second engine, same validator files: every request is answered with a 304
+    engine = AsyncEngine(repos, builds)
+    polled = lambda: github.scheduler.repos["bench/repo-0000"].polls >= 2
+    asyncio.run(run_until(engine, polled))
+    assert github.requests["commits 304"] == 1
+    assert saves == []
+    assert len(builds.submitted) == 1
+
+def test_tags_pick_the_same_latest_as_rest(github, tmp_path):
+    repo = next(r for r in github.repos.values() if r.tags_only)
+    repo.tag = "v1.10.0"
+    repo.other_tags = [("v1.9.1", "2025-11-01T00:00:00Z"), ("v1.8.5", "2099-01-01T00:00:00Z")]
+    validators = github_api.ValidatorCache(str(tmp_path / "validators.json"))
+
+    async def check():
+        engine = AsyncEngine([], Builds())
+        engine.semaphore = asyncio.Semaphore(1)
+        async with async_monitor.aiohttp.ClientSession() as engine.session:
+            return await engine.check_release("bench", repo.name.split("/")[1], validators, logging.getLogger("test"))
+    assert asyncio.run(check()) == ("v1.10.0", "unknown", "tag")
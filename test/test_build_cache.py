@@ -0,0 +1,113 @@
+import os
+import glob
+import shutil
+import subprocess
+
+import pytest
+
+import build_cache
+from build_cache import cache_dirs, enforce_budgets, evict_lru, report, snapshot
+
+PIPELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipeline")
+
+def write(path, size, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+def test_go_build_evicts_least_recently_used(tmp_path):
+    root = str(tmp_path / "go-build")
+    for i in range(5):
+        write(os.path.join(root, f"{i:02x}", f"entry-{i}-d"), 100, 1000 + i)
+    write(os.path.join(root, "README"), 100, 0)
+    assert evict_lru("go-build", root, 300) == 200
+    left = sorted(os.path.basename(p) for p in glob.glob(os.path.join(root, "*", "*")))
+    assert left == ["entry-2-d", "entry-3-d", "entry-4-d"]
+    assert os.path.exists(os.path.join(root, "README"))
+    assert evict_lru("go-build", root, 300) == 0
+
+def test_go_mod_evicts_whole_read_only_modules(tmp_path):
+    root = str(tmp_path / "go-mod")
+    old = os.path.join(root, "github.com", "old", "lib@v1.0.0")
+    new = os.path.join(root, "github.com", "new", "lib@v2.0.0")
+    write(os.path.join(old, "lib.go"), 300, 1000)
+    write(os.path.join(new, "lib.go"), 300, 2000)
+    download = os.path.join(root, "cache", "download", "github.com", "old", "lib", "@v")
+    write(os.path.join(download, "v1.0.0.zip"), 50, 1000)
+    for path, mtime in ((old, 1000), (new, 2000), (download, 1000)):
+        os.utime(path, (mtime, mtime))
+    # go makes module directories read-only
+    for path in (old, new):
+        os.chmod(path, 0o555)
+    assert evict_lru("go-mod", root, 400) == 350
+    assert not os.path.exists(old) and not os.path.exists(download) and os.path.exists(new)
+
+def test_enforce_budgets_leaves_ccache_alone(tmp_path, monkeypatch):
+    monkeypatch.setitem(build_cache.BUDGETS, "go-build", 100)
+    dirs = cache_dirs("node-exporter", str(tmp_path))
+    write(os.path.join(dirs["go-build"], "00", "a-d"), 100, 1000)
+    write(os.path.join(dirs["go-build"], "00", "b-d"), 100, 2000)
+    write(os.path.join(dirs["ccache"], "0", "big"), 10 ** 6, 1000)
+    enforce_budgets("node-exporter", str(tmp_path))
+    assert os.listdir(os.path.join(dirs["go-build"], "00")) == ["b-d"]
+    assert os.path.exists(os.path.join(dirs["ccache"], "0", "big"))
+
+def test_report_counts_new_entries_as_misses(tmp_path):
+    dirs = cache_dirs("node-exporter", str(tmp_path))
+    write(os.path.join(dirs["go-build"], "00", "used-d"), 10, 1000)
+    write(os.path.join(dirs["go-build"], "00", "idle-d"), 10, 1000)
+    before = snapshot("node-exporter", str(tmp_path))
+    os.utime(os.path.join(dirs["go-build"], "00", "used-d"), (2000, 2000))
+    write(os.path.join(dirs["go-build"], "01", "new-d"), 10, 2000)
+    stats = report("node-exporter", before, str(tmp_path))
+    assert stats["go-build"] == {"hits": 1, "misses": 1, "entries": 3, "bytes": 30}
+
+def test_go_roles_build_from_the_stable_path():
+    for role in ("node-exporter", "dcgm-exporter"):
+        with open(os.path.join(PIPELINE_DIR, "roles", role, "tasks", "main.yml")) as f:
+            tasks = f.read()
+        assert "cd {{ build_src_dir }}" in tasks
+        assert "cd {{ build_root }}" not in tasks
+
+GO_MAIN = 'package main\n\nimport "example.com/exporter/collector"\n\nfunc main() { println(collector.Name()) }\n'
+GO_LIB = 'package collector\n\nfunc Name() string { return "node" }\n'
+
+def checkout(root):
+    os.makedirs(os.path.join(root, "collector"))
+    with open(os.path.join(root, "go.mod"), "w") as f:
+        f.write("module example.com/exporter\n\ngo 1.20\n")
+    with open(os.path.join(root, "main.go"), "w") as f:
+        f.write(GO_MAIN)
+    with open(os.path.join(root, "collector", "collector.go"), "w") as f:
+        f.write(GO_LIB)
+    return root
+
+def go_build(cache_root, link_dir, source):
+    """Build like the exporter roles: through link_dir when given, else from the job's own dir."""
+    workdir = source
+    if link_dir:
+        if os.path.lexists(link_dir):
+            os.remove(link_dir)
+        os.symlink(source, link_dir)
+        workdir = link_dir
+    before = snapshot("node-exporter", cache_root)
+    env = dict(os.environ, GOCACHE=cache_dirs("node-exporter", cache_root)["go-build"], GOPROXY="off",
+               GOFLAGS="-mod=mod", GOTOOLCHAIN="local")
+    subprocess.run(f"cd {workdir} && export PWD && go build -o exporter .", shell=True, env=env, check=True,
+                   capture_output=True)
+    return report("node-exporter", before, cache_root)["go-build"]
+
+@pytest.mark.skipif(not shutil.which("go"), reason="go not installed")
+def test_stable_path_reuses_the_go_cache(tmp_path):
+    cache_root, link_dir = str(tmp_path / "cache"), str(tmp_path / "cache" / "node-exporter" / "src")
+    os.makedirs(os.path.dirname(link_dir))
+    go_build(cache_root, None, checkout(str(tmp_path / "job-1" / "node-exporter")))
+
+    # Each job's own build_root: the project's packages are compiled again
+    per_job = go_build(cache_root, None, checkout(str(tmp_path / "job-2" / "node-exporter")))
+    assert per_job["misses"] > 0
+
+    go_build(cache_root, link_dir, checkout(str(tmp_path / "job-3" / "node-exporter")))
+    stable = go_build(cache_root, link_dir, checkout(str(tmp_path / "job-4" / "node-exporter")))
+    assert stable["misses"] == 0
@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+
+from job_queue import JobQueue
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_worker(path, script, *args):
+    """A separate build process running script against the queue at path, like build_worker.py on another host."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    return subprocess.Popen([sys.executable, "-c", script, path, *map(str, args)],
+                            stdout=subprocess.PIPE, text=True, env=env)
+
+def enqueue(queue, count):
+    return [queue.enqueue("release", "v1.0.0", {"owner": "owner", "repo": f"exporter{i}"}) for i in range(count)]
+
+DRAIN = """
+import sys, time
+from job_queue import JobQueue, worker_id
+queue = JobQueue(sys.argv[1])
+while True:
+    job = queue.claim(worker_id())
+    if job is None:
+        break
+    time.sleep(0.01)
+    queue.complete(job["id"], worker_id(), True)
+    print(job["id"], flush=True)
+"""
+
+HOLD = """
+import sys, time
+from job_queue import JobQueue, worker_id
+queue = JobQueue(sys.argv[1])
+lease, beat_for = float(sys.argv[2]), float(sys.argv[3])
+queue.register_worker(worker_id(), ["*"], 1)
+# Build threads lease as host:pid:name, like BuildExecutor's
+owner = worker_id("build-0")
+job = queue.claim(owner, lease_seconds=lease)
+print(job["id"], flush=True)
+deadline = time.monotonic() + beat_for
+while time.monotonic() < deadline:
+    time.sleep(lease / 5)
+    queue.heartbeat(job["id"], owner, lease_seconds=lease)
+    queue.worker_heartbeat(worker_id())
+time.sleep(3600)
+"""
+
+def test_processes_claim_every_job_once(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path)
+    job_ids = enqueue(queue, 40)
+    workers = [start_worker(path, DRAIN) for _ in range(4)]
+    claimed = []
+    for worker in workers:
+        out, _ = worker.communicate(timeout=60)
+        assert worker.returncode == 0
+        claimed.extend(int(line) for line in out.split())
+    assert sorted(claimed) == sorted(job_ids)
+    assert queue.stats()["succeeded"] == 40
+
+def test_expired_lease_is_claimed_by_another_process(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path)
+    job_id, = enqueue(queue, 1)
+    holder = start_worker(path, HOLD, 1, 0)
+    try:
+        assert int(holder.stdout.readline()) == job_id
+        # Leased, and the holder stops renewing it
+        assert queue.claim("other") is None
+        time.sleep(1.5)
+        job = queue.claim("other")
+        assert job["id"] == job_id and job["attempts"] == 2
+        assert queue.complete(job_id, "other", True) == "succeeded"
+    finally:
+        holder.kill()
+        holder.wait()
+
+def test_heartbeat_keeps_lease_and_dead_process_is_recovered(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path)
+    job_id, = enqueue(queue, 1)
+    holder = start_worker(path, HOLD, 1, 60)
+    try:
+        assert int(holder.stdout.readline()) == job_id
+        # Renewed every 0.2s, so it outlives its 1s lease
+        time.sleep(2)
+        assert queue.claim("other") is None
+        workers = queue.workers()
+        assert [w["running"] for w in workers] == [1]
+        assert workers[0]["id"].endswith(f":{holder.pid}")
+        assert json.loads(queue.connect().execute("SELECT exporters FROM workers").fetchone()[0]) == ["*"]
+    finally:
+        holder.send_signal(signal.SIGKILL)
+        holder.wait()
+    # The process is gone: a restart on the same host requeues its job right away
+    assert queue.recover() == 1
+    assert queue.claim("other")["id"] == job_id
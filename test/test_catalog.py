@@ -0,0 +1,135 @@
+import os
+import time
+
+import pytest
+
+import catalog
+from catalog import Catalog
+from debpkg import build_deb
+
+def make_deb(directory, package, version, arch="amd64", payload=b"binary"):
+    """Build a small .deb named like the pipeline names them; returns its path."""
+    source = os.path.join(directory, f".{package}.payload")
+    with open(source, "wb") as f:
+        f.write(payload)
+    path = os.path.join(directory, f"{package}_{version}_{arch}.deb")
+    control = f"Package: {package}\nVersion: {version}\nArchitecture: {arch}\nDescription: test\n"
+    build_deb(path, control, files={f"/usr/bin/{package}": (source, 0o755)}, compression="none", mtime=1700000000)
+    os.remove(source)
+    return path
+
+@pytest.fixture
+def staging(tmp_path):
+    directory = tmp_path / "staging"
+    directory.mkdir()
+    return str(directory)
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Paths catalog._parse was called with."""
+    calls = []
+    parse = catalog._parse
+
+    def counting(path):
+        calls.append(os.path.basename(path))
+        return parse(path)
+    monkeypatch.setattr(catalog, "_parse", counting)
+    return calls
+
+def test_first_scan_indexes_every_deb(tmp_path, staging, parses):
+    make_deb(staging, "node-exporter", "1.8.2-1")
+    make_deb(staging, "dcgm-exporter", "4.2.0-1")
+    with open(os.path.join(staging, "broken_1.0_amd64.deb"), "wb") as f:
+        f.write(b"not an archive")
+    with open(os.path.join(staging, "notes.txt"), "w") as f:
+        f.write("ignored")
+
+    cat = Catalog(str(tmp_path / "catalog.db"))
+    assert cat.refresh("staging", staging) == (3, 0)
+    row = cat.get("staging", "node-exporter_1.8.2-1_amd64.deb")
+    assert (row["package"], row["version"], row["architecture"], row["error"]) == \
+        ("node-exporter", "1.8.2-1", "amd64", None)
+    assert "Package: node-exporter" in row["control"]
+    broken = cat.get("staging", "broken_1.0_amd64.deb")
+    assert broken["package"] is None and "not an ar archive" in broken["error"]
+    assert cat.get("staging", "notes.txt") is None
+
+def test_rescan_only_parses_changed_files(tmp_path, staging, parses):
+    make_deb(staging, "node-exporter", "1.8.2-1")
+    dcgm = make_deb(staging, "dcgm-exporter", "4.2.0-1")
+    gone = make_deb(staging, "old-exporter", "0.1-1")
+    cat = Catalog(str(tmp_path / "catalog.db"))
+    cat.refresh("staging", staging)
+    parses.clear()
+
+    assert cat.refresh("staging", staging) == (0, 0)
+    assert parses == []
+
+    # touch: same inode and size, new mtime
+    st = os.stat(dcgm)
+    os.utime(dcgm, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert cat.refresh("staging", staging) == (1, 0)
+    assert parses == ["dcgm-exporter_4.2.0-1_amd64.deb"]
+    parses.clear()
+
+    # replace: a rebuilt file renamed over the old one has a new inode
+    rebuilt = make_deb(str(tmp_path), "dcgm-exporter", "4.2.0-1", payload=b"rebuilt")
+    os.utime(rebuilt, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    os.replace(rebuilt, dcgm)
+    assert cat.refresh("staging", staging) == (1, 0)
+    assert parses == ["dcgm-exporter_4.2.0-1_amd64.deb"]
+    assert cat.get("staging", "dcgm-exporter_4.2.0-1_amd64.deb")["inode"] == os.stat(dcgm).st_ino
+    parses.clear()
+
+    # delete: the row goes, nothing is parsed
+    os.remove(gone)
+    assert cat.refresh("staging", staging) == (0, 1)
+    assert parses == []
+    assert cat.get("staging", "old-exporter_0.1-1_amd64.deb") is None
+    assert [r["filename"] for r in cat.packages("staging")] == ["dcgm-exporter_4.2.0-1_amd64.deb",
+                                                                "node-exporter_1.8.2-1_amd64.deb"]
+
+def test_missing_directory_drops_its_rows(tmp_path, staging):
+    make_deb(staging, "node-exporter", "1.8.2-1")
+    cat = Catalog(str(tmp_path / "catalog.db"))
+    cat.refresh("staging", staging)
+    cat.refresh("published", str(tmp_path / "missing"))
+    assert len(cat.packages("staging")) == 1
+    os.remove(os.path.join(staging, "node-exporter_1.8.2-1_amd64.deb"))
+    os.rmdir(staging)
+    assert cat.refresh("staging", staging) == (0, 1)
+    assert cat.packages("staging") == []
+
+def test_filters_and_sort(tmp_path, staging):
+    for package, version in [("dcgm-exporter", "4.2.0-1"), ("dcgm-exporter", "4.10.0-1"),
+                             ("dcgm-exporter", "4.2.0~rc1-1"), ("node-exporter", "1.8.2-1")]:
+        make_deb(staging, package, version)
+    cat = Catalog(str(tmp_path / "catalog.db"))
+    cat.refresh("staging", staging)
+
+    def versions(**kwargs):
+        return [r["version"] for r in cat.packages("staging", **kwargs)]
+    assert versions(package="dcgm*", sort="version") == ["4.2.0~rc1-1", "4.2.0-1", "4.10.0-1"]
+    assert versions(package="dcgm*", sort="version", reverse=True) == ["4.10.0-1", "4.2.0-1", "4.2.0~rc1-1"]
+    assert versions(version="4.10.*") == ["4.10.0-1"]
+    assert versions(package="node*", version="4.*") == []
+    assert [r["package"] for r in cat.packages("staging", sort="package")][-1] == "node-exporter"
+    # Name order is plain string order, unlike version order
+    assert versions(package="dcgm*") == ["4.10.0-1", "4.2.0-1", "4.2.0~rc1-1"]
+
+def test_list_answers_in_under_50_ms(tmp_path, staging):
+    for i in range(300):
+        make_deb(staging, f"exporter-{i:03d}", f"1.{i}.0-1")
+    cat = Catalog(str(tmp_path / "catalog.db"))
+    cat.refresh("staging", staging)
+
+    # What `repoctl list` does once the catalog is warm: stat the dir and read the rows
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        cat = Catalog(str(tmp_path / "catalog.db"))
+        cat.refresh("staging", staging)
+        rows = cat.packages("staging", sort="version")
+        timings.append(time.perf_counter() - started)
+    assert len(rows) == 300
+    assert min(timings) < 0.05, f"list took {min(timings) * 1000:.1f} ms"
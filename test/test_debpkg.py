@@ -0,0 +1,149 @@
+import io
+import os
+import hashlib
+import shutil
+import tarfile
+import subprocess
+
+import pytest
+
+import debpkg
+
+CONTROL = """Package: node-exporter
+Version: 1.8.2-1
+Architecture: amd64
+Maintainer: repo-watcher <ops@example.com>
+Description: Prometheus node exporter
+ Exports hardware and OS metrics.
+"""
+
+dpkg_deb = pytest.mark.skipif(not shutil.which("dpkg-deb"), reason="dpkg-deb not installed")
+
+def build(tmp_path, name="node-exporter.deb", control=CONTROL, binary=b"\x7fELF binary", compression="xz"):
+    source = tmp_path / f"{name}.bin"
+    source.write_bytes(binary)
+    output = tmp_path / name
+    result = debpkg.build_deb(str(output), control,
+                              files={"/usr/bin/node_exporter": (str(source), 0o755)},
+                              scripts={"postinst": ("#!/bin/sh\nexit 0\n", 0o755)},
+                              compression=compression, mtime=1700000000)
+    return output, result
+
+def members(path):
+    with open(path, "rb") as f:
+        out = {}
+        for name, offset, size in debpkg.iter_ar_members(f):
+            f.seek(offset)
+            out[name] = f.read(size)
+        return out
+
+@pytest.mark.parametrize("compression", ["xz", "gz", "none"])
+def test_build_writes_debian_ar_layout(tmp_path, compression):
+    output, result = build(tmp_path, compression=compression)
+    found = members(output)
+    suffix = debpkg.SUFFIXES[compression]
+    # dpkg requires this exact member order
+    assert list(found) == ["debian-binary", f"control.tar{suffix}", f"data.tar{suffix}"]
+    assert found["debian-binary"] == b"2.0\n"
+    for name, info in result["members"].items():
+        assert len(found[name]) == info["size"]
+
+    control = tarfile.open(fileobj=io.BytesIO(debpkg._decompress(f"control.tar{suffix}", found[f"control.tar{suffix}"])))
+    assert sorted(control.getnames()) == [".", "./control", "./postinst"]
+    assert control.getmember("./postinst").mode == 0o755
+    assert control.extractfile("./control").read().decode() == CONTROL
+
+    manifest = debpkg.data_manifest(str(output))
+    assert set(manifest) == {".", "./usr", "./usr/bin", "./usr/bin/node_exporter"}
+    entry = manifest["./usr/bin/node_exporter"]
+    assert (entry[1], entry[2], entry[3], entry[4]) == (0o755, 0, 0, len(b"\x7fELF binary"))
+    assert result["md5sums"] == {"usr/bin/node_exporter": hashlib.md5(b"\x7fELF binary").hexdigest()}
+
+def test_build_is_reproducible(tmp_path):
+    first, _ = build(tmp_path, name="a.deb")
+    second, _ = build(tmp_path, name="b.deb")
+    assert first.read_bytes() == second.read_bytes()
+
+def test_read_control_parses_continuation_lines(tmp_path):
+    output, _ = build(tmp_path)
+    fields = debpkg.read_control(str(output))
+    assert fields["Package"] == "node-exporter"
+    assert fields["Version"] == "1.8.2-1"
+    assert fields["Description"] == "Prometheus node exporter\n Exports hardware and OS metrics."
+
+@dpkg_deb
+def test_dpkg_deb_reads_our_package(tmp_path):
+    output, _ = build(tmp_path)
+    info = subprocess.run(["dpkg-deb", "--info", str(output)], capture_output=True, text=True, check=True).stdout
+    assert "Package: node-exporter" in info
+    assert "postinst" in info
+    contents = subprocess.run(["dpkg-deb", "--contents", str(output)], capture_output=True, text=True, check=True).stdout
+    line = next(l for l in contents.splitlines() if l.endswith("./usr/bin/node_exporter"))
+    assert line.startswith("-rwxr-xr-x root/root")
+
+@dpkg_deb
+def test_compare_matches_dpkg_deb_build(tmp_path):
+    output, _ = build(tmp_path)
+    tree = tmp_path / "tree"
+    (tree / "DEBIAN").mkdir(parents=True)
+    (tree / "DEBIAN" / "control").write_text(CONTROL)
+    (tree / "DEBIAN" / "postinst").write_text("#!/bin/sh\nexit 0\n")
+    os.chmod(tree / "DEBIAN" / "postinst", 0o755)
+    (tree / "usr" / "bin").mkdir(parents=True)
+    (tree / "usr" / "bin" / "node_exporter").write_bytes(b"\x7fELF binary")
+    os.chmod(tree / "usr" / "bin" / "node_exporter", 0o755)
+    os.chmod(tree / "usr", 0o755)
+    os.chmod(tree / "usr" / "bin", 0o755)
+    os.chmod(tree, 0o755)
+    reference = tmp_path / "reference.deb"
+    subprocess.run(["dpkg-deb", "--root-owner-group", "-Zxz", "--build", str(tree), str(reference)],
+                   capture_output=True, check=True, env=dict(os.environ, SOURCE_DATE_EPOCH="1700000000"))
+    assert debpkg.compare(str(output), str(reference)) == []
+
+def test_compare_reports_control_and_data_differences(tmp_path):
+    output, _ = build(tmp_path, name="a.deb")
+    other, _ = build(tmp_path, name="b.deb", control=CONTROL.replace("1.8.2-1", "1.8.3-1"), binary=b"other")
+    differences = debpkg.compare(str(output), str(other))
+    assert differences[0] == "control Version: '1.8.2-1' != '1.8.3-1'"
+    assert len(differences) == 2 and differences[1].startswith("data ./usr/bin/node_exporter:")
+
+def test_restamp_keeps_data_member(tmp_path):
+    output, _ = build(tmp_path)
+    restamped = tmp_path / "restamped.deb"
+    debpkg.restamp(str(output), str(restamped), lambda text: text.replace("1.8.2-1", "1.8.2-2"))
+    assert debpkg.read_control(str(restamped))["Version"] == "1.8.2-2"
+    assert members(restamped)["data.tar.xz"] == members(output)["data.tar.xz"]
+
+# Each pair is ordered a < b by `dpkg --compare-versions a lt b`
+ORDERED = [
+    ("1.0~rc1", "1.0"),
+    ("1.0~~", "1.0~"),
+    ("1.0~", "1.0"),
+    ("1.0", "1.0a"),
+    ("1.0", "1.0.1"),
+    ("1.0-1", "1.0-2"),
+    ("1.0-9", "1.0-10"),
+    ("1.0-1", "1.0+really-1"),
+    ("1.2.10", "1.10.1"),
+    ("9.9", "1:0.1"),
+    ("1:2.0", "2:1.0"),
+    ("1.0-1~bpo1", "1.0-1"),
+    ("1.0a", "1.0+"),
+    ("1.0", "1.0-0.1"),
+]
+
+@pytest.mark.parametrize("a,b", ORDERED)
+def test_version_ordering(a, b):
+    assert debpkg.compare_versions(a, b) < 0
+    assert debpkg.compare_versions(b, a) > 0
+    assert debpkg.version_key(a) < debpkg.version_key(b)
+
+@pytest.mark.parametrize("a,b", [("1.0", "0:1.0"), ("1.0", "1.0-0"), ("1.00", "1.0"), ("1.0-", "1.0")])
+def test_equal_versions(a, b):
+    assert debpkg.compare_versions(a, b) == 0
+    assert debpkg.version_key(a) == debpkg.version_key(b)
+
+@pytest.mark.skipif(not shutil.which("dpkg"), reason="dpkg not installed")
+def test_version_ordering_agrees_with_dpkg():
+    for a, b in ORDERED:
+        assert subprocess.run(["dpkg", "--compare-versions", a, "lt", b]).returncode == 0, (a, b)
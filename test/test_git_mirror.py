@@ -0,0 +1,84 @@
+import os
+import time
+import shutil
+import subprocess
+
+import pytest
+
+from git_mirror import list_worktrees, mirror_path, prepare_worktree
+
+def run(*args, cwd=None):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                          cwd=cwd, check=True, text=True, capture_output=True).stdout.strip()
+
+@pytest.fixture
+def upstream(tmp_path):
+    """A local bare repo and a commit(content) helper that pushes a new commit to it, returning its sha."""
+    bare, work = str(tmp_path / "upstream.git"), str(tmp_path / "work")
+    run("init", "--bare", "--quiet", "--initial-branch=main", bare)
+    run("clone", "--quiet", bare, work)
+
+    def commit(content):
+        with open(os.path.join(work, "VERSION"), "w") as f:
+            f.write(content)
+        run("add", "VERSION", cwd=work)
+        run("commit", "--quiet", "-m", content, cwd=work)
+        run("push", "--quiet", "origin", "HEAD:refs/heads/main", cwd=work)
+        return run("rev-parse", "HEAD", cwd=work)
+    return bare, commit
+
+def read(path):
+    with open(os.path.join(path, "VERSION")) as f:
+        return f.read()
+
+def test_fetch_then_worktree_at_sha(upstream, tmp_path):
+    bare, commit = upstream
+    first = commit("1.0.0")
+    commit("1.1.0")
+    dest = str(tmp_path / "build" / "exporter")
+    info = prepare_worktree(bare, first, dest, mirror_root=str(tmp_path / "mirrors"))
+    assert info["commit"] == first
+    assert info["tree"] == run("rev-parse", f"{first}^{{tree}}", cwd=bare)
+    assert read(dest) == "1.0.0"
+    assert run("rev-parse", "HEAD", cwd=dest) == first
+
+def test_second_build_reuses_the_mirror(upstream, tmp_path):
+    bare, commit = upstream
+    mirrors = str(tmp_path / "mirrors")
+    prepare_worktree(bare, commit("1.0.0"), str(tmp_path / "build-1" / "exporter"), mirror_root=mirrors)
+    mirror = mirror_path(bare, mirrors)
+    # Marks this mirror: a re-created one would not have it
+    marker = os.path.join(mirror, "marker")
+    open(marker, "w").close()
+
+    second = commit("1.1.0")
+    dest = str(tmp_path / "build-2" / "exporter")
+    assert prepare_worktree(bare, second, dest, mirror_root=mirrors)["commit"] == second
+    assert os.path.exists(marker)
+    assert read(dest) == "1.1.0"
+    # The same build root again, e.g. a retried job, gets a fresh checkout
+    with open(os.path.join(dest, "VERSION"), "w") as f:
+        f.write("dirty")
+    prepare_worktree(bare, second, dest, mirror_root=mirrors)
+    assert read(dest) == "1.1.0"
+
+def test_stale_worktrees_are_cleaned_up(upstream, tmp_path):
+    bare, commit = upstream
+    sha = commit("1.0.0")
+    mirrors = str(tmp_path / "mirrors")
+    mirror = mirror_path(bare, mirrors)
+    interrupted = str(tmp_path / "build-1" / "exporter")
+    old = str(tmp_path / "build-2" / "exporter")
+    prepare_worktree(bare, sha, interrupted, mirror_root=mirrors)
+    prepare_worktree(bare, sha, old, mirror_root=mirrors)
+    assert sorted(list_worktrees(mirror)) == sorted([interrupted, old])
+
+    # A build that died after its build root was wiped, and one left behind two days ago
+    shutil.rmtree(tmp_path / "build-1")
+    two_days_ago = time.time() - 2 * 24 * 3600
+    os.utime(old, (two_days_ago, two_days_ago))
+
+    current = str(tmp_path / "build-3" / "exporter")
+    prepare_worktree(bare, sha, current, mirror_root=mirrors)
+    assert list_worktrees(mirror) == [current]
+    assert not os.path.exists(old)
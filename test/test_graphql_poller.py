@@ -0,0 +1,110 @@
+import time
+import logging
+import functools
+
+import pytest
+
+# graphql_poller shares the change logic of monitor.py, which runs the pipeline
+pytest.importorskip("ansible_runner")
+
+import monitor
+import state_store
+import graphql_poller
+from graphql_poller import BatchedWatcher, chunk_configs, poll_all
+from tools.fake_github import FakeGitHub, serve
+
+def start(monkeypatch, repos=4, **options):
+    fake = FakeGitHub(repos=repos, change_rate=0, tags_only=0, latency=0, seed=1, **options)
+    server = serve(fake)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(graphql_poller, "GRAPHQL_URL", f"{url}/graphql")
+    monkeypatch.setattr(graphql_poller, "GITHUB_TOKEN", "test-token")
+    monkeypatch.setattr(monitor, "API_URL", url)
+    return fake, server
+
+@pytest.fixture
+def github(monkeypatch):
+    servers = []
+
+    def make(**options):
+        fake, server = start(monkeypatch, **options)
+        servers.append(server)
+        return fake
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def config(name, tmp_path=None):
+    return {"owner": "bench", "repo": name, "branch": "main", "check_interval": 60,
+            "state_file": str(tmp_path / f"{name}_state.json") if tmp_path else f"/tmp/{name}_state.json"}
+
+def test_chunks_respect_repo_and_size_limits():
+    configs = [config(f"repo-{i:04d}") for i in range(7)]
+    assert [len(c) for c in chunk_configs(configs, max_repos=3)] == [3, 3, 1]
+    single = len(graphql_poller.build_query(configs[:1]))
+    assert [len(c) for c in chunk_configs(configs, max_chars=single * 2)] == [2, 2, 2, 1]
+
+def test_aliases_map_back_to_their_repos(github, monkeypatch):
+    fake = github()
+    monkeypatch.setattr(graphql_poller, "chunk_configs", functools.partial(chunk_configs, max_repos=2))
+    configs = [config("repo-0003"), config("repo-0000"), config("unknown"), config("repo-0001")]
+    results = poll_all(configs)
+    for result, cfg in zip(results, configs):
+        repo = fake.repos.get(f"bench/{cfg['repo']}")
+        if repo is None:
+            assert result is None
+        else:
+            assert result == ((repo.tag, repo.release_date, "release"), (repo.sha, repo.commit_date))
+    assert fake.requests["graphql 200"] == 2
+
+def test_oversized_query_is_split(github):
+    fake = github(graphql_max_repos=1)
+    configs = [config(f"repo-{i:04d}") for i in range(4)]
+    results = poll_all(configs)
+    assert [r[1][0] for r in results] == [fake.repos[f"bench/repo-{i:04d}"].sha for i in range(4)]
+    # 4 -> 2 + 2 -> 1 + 1 + 1 + 1
+    assert fake.requests == {"graphql 502": 3, "graphql 200": 4}
+
+class Builds:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, event_type, value, config):
+        self.submitted.append((config["repo"], event_type, value))
+        return len(self.submitted)
+
+def test_unanswered_repos_fall_back_to_rest(github, monkeypatch, tmp_path):
+    fake = github(graphql_max_repos=0)
+    monkeypatch.setattr(state_store, "_store", state_store.StateStore(str(tmp_path / "state.db")))
+    monkeypatch.setattr(graphql_poller, "get_repo_logger", lambda c: logging.getLogger(f"{c['owner']}/{c['repo']}"))
+    builds = Builds()
+    watcher = BatchedWatcher([config(f"repo-{i:04d}", tmp_path) for i in range(2)], builds)
+    watcher.run_cycle()
+    deadline = time.monotonic() + 10
+    while (len(builds.submitted) < 2 or watcher.busy) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(builds.submitted) == [("repo-0000", "release", "v1.0.0"), ("repo-0001", "release", "v1.0.0")]
+    # The pair, then each repo on its own
+    assert fake.requests["graphql 502"] == 3
+    assert fake.requests["releases/latest 200"] == 2
+    assert [s["latest_commit"] for s in watcher.states] == [fake.repos[f"bench/repo-{i:04d}"].sha for i in range(2)]
+
+def test_rest_and_graphql_pick_the_same_tag(github, tmp_path):
+    fake = github(repos=1)
+    repo = fake.repos["bench/repo-0000"]
+    repo.tags_only = True
+    # Newest commit is the v1.8.5 backport, first by name is v1.9.1, highest version is v1.10.0
+    repo.tag, repo.release_date = "v1.10.0", "2026-01-01T00:00:00Z"
+    repo.other_tags = [("v1.9.1", "2025-11-01T00:00:00Z"), ("v1.8.5", "2026-02-01T00:00:00Z"),
+                       ("v1.10.0-rc1", "2025-12-01T00:00:00Z")]
+
+    (release, _), = poll_all([config("repo-0000")])
+    validators = monitor.ValidatorCache(str(tmp_path / "validators.json"))
+    rest = monitor.check_release("bench", "repo-0000", validators, logging.getLogger("test"))
+    assert release == rest == ("v1.10.0", "unknown", "tag")
+
+def test_latest_tag_ordering():
+    assert monitor.latest_tag(["v1.9.1", "v1.10.0", "v1.10.0-rc1"]) == "v1.10.0"
+    assert monitor.latest_tag(["1.0.0-rc2", "1.0.0-rc10"]) == "1.0.0-rc10"
+    assert monitor.latest_tag([]) is None
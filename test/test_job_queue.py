@@ -0,0 +1,120 @@
+import pytest
+
+import job_queue
+from job_queue import JobQueue
+
+CONFIG = {"owner": "Owner", "repo": "node_exporter"}
+
+def statuses(queue):
+    rows = queue.connect().execute("SELECT value, status FROM jobs ORDER BY id").fetchall()
+    return [(row["value"], row["status"]) for row in rows]
+
+def test_commit_supersedes_queued_commits(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    assert queue.enqueue("commit", "a", CONFIG)
+    assert queue.enqueue("commit", "b", CONFIG)
+    assert statuses(queue) == [("a", "superseded"), ("b", "queued")]
+
+def test_release_does_not_supersede_commits(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    assert queue.enqueue("commit", "a", CONFIG)
+    assert queue.enqueue("release", "v1.0.0", CONFIG)
+    assert statuses(queue) == [("a", "queued"), ("v1.0.0", "queued")]
+
+def test_commit_debounce_is_off_by_default(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("commit", "a", CONFIG)
+    assert queue.claim("worker")["value"] == "a"
+
+def test_head_back_to_built_commit_supersedes_stale_build(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("commit", "a", CONFIG)
+    job = queue.claim("worker")
+    queue.complete(job["id"], "worker", True)
+    assert queue.enqueue("commit", "b", CONFIG)
+    # Reverted to a, which is packaged already: nothing new to queue, b is stale
+    assert queue.enqueue("commit", "a", CONFIG) is None
+    assert statuses(queue) == [("a", "succeeded"), ("b", "superseded")]
+
+def test_superseded_commit_can_be_queued_again(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("commit", "a", CONFIG)
+    queue.enqueue("commit", "b", CONFIG)
+    assert queue.enqueue("commit", "a", CONFIG)
+    assert statuses(queue) == [("a", "superseded"), ("b", "superseded"), ("a", "queued")]
+    # Re-detecting a queued commit still queues nothing
+    assert queue.enqueue("commit", "a", CONFIG) is None
+
+class Clock:
+    def __init__(self, now=1_800_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, "time", clock)
+    return clock
+
+def test_superseded_commit_is_never_claimed(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    other = dict(CONFIG, repo="dcgm-exporter")
+    queue.enqueue("commit", "a", CONFIG)
+    queue.enqueue("commit", "x", other)
+    running = queue.claim("worker")
+    assert running["value"] == "a"
+    queue.enqueue("commit", "b", CONFIG)
+    queue.enqueue("commit", "c", CONFIG)
+    # The running build and the other repo's commit are left alone
+    assert statuses(queue) == [("a", "running"), ("x", "queued"), ("b", "superseded"), ("c", "queued")]
+    queue.complete(running["id"], "worker", True)
+    assert [queue.claim("worker")["value"] for _ in range(2)] == ["x", "c"]
+    assert queue.claim("worker") is None
+
+def test_debounce_holds_commit_builds_back(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    config = dict(CONFIG, commit_debounce=300)
+    queue.enqueue("commit", "a", config)
+    clock.now += 200
+    # Each push restarts the quiet period
+    queue.enqueue("commit", "b", config)
+    clock.now += 299
+    assert queue.claim("worker") is None
+    assert queue.stats()["oldest_queued_wait"] == 0
+    clock.now += 1
+    assert queue.claim("worker")["value"] == "b"
+    assert statuses(queue) == [("a", "superseded"), ("b", "running")]
+
+def test_releases_are_not_debounced(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("release", "v1.0.0", dict(CONFIG, commit_debounce=300))
+    assert queue.claim("worker")["value"] == "v1.0.0"
+
+def test_failed_build_waits_for_its_retry(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.enqueue("release", "v1.0.0", CONFIG)
+    job = queue.claim("worker")
+    assert queue.complete(job["id"], "worker", False, error="make failed") == "queued"
+    assert queue.claim("worker") is None
+    clock.now += job_queue.RETRY_BASE
+    assert queue.claim("worker")["attempts"] == 2
+
+def test_releases_are_claimed_before_commits(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    node = CONFIG
+    dcgm = dict(CONFIG, owner="NVIDIA", repo="dcgm-exporter")
+    queue.enqueue("commit", "a", node)
+    clock.now += 1
+    queue.enqueue("commit", "b", dcgm)
+    clock.now += 1
+    queue.enqueue("tag", "v0.9.0", dcgm)
+    clock.now += 1
+    queue.enqueue("release", "v1.0.0", node)
+    claimed = [queue.claim(f"worker-{i}") for i in range(4)]
+    # Oldest release or tag first; one build per exporter at a time
+    assert [job and job["value"] for job in claimed] == ["v0.9.0", "v1.0.0", None, None]
+    for i, job in enumerate(claimed[:2]):
+        queue.complete(job["id"], f"worker-{i}", True)
+    assert [queue.claim("worker")["value"] for _ in range(2)] == ["a", "b"]
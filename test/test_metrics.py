@@ -0,0 +1,73 @@
+import re
+
+import metrics
+from metrics import Registry, watch_staging
+
+# One sample line of the text exposition format
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{([a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+def parse(text):
+    """{family: {"type", "help", "samples": [(name, labels, value)]}}, checking the format on the way."""
+    assert text.endswith("\n")
+    families = {}
+    current = None
+    for line in text.rstrip("\n").split("\n"):
+        if line.startswith("# HELP "):
+            name, _, help = line[7:].partition(" ")
+            assert name not in families, f"{name} exported twice"
+            current = families[name] = {"help": help, "type": None, "samples": []}
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[7:].partition(" ")
+            assert current is families[name] and kind in ("counter", "gauge", "histogram")
+            current["type"] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"bad sample line {line!r}"
+            name, value = match.group(1), match.group(4)
+            float(value)
+            suffixes = ("_bucket", "_sum", "_count") if current["type"] == "histogram" else ("",)
+            assert any(name == f"{family}{suffix}" for family in families for suffix in suffixes)
+            current["samples"].append((name, match.group(2) or "", float(value)))
+    return families
+
+def test_staged_packages_and_bytes_are_separate_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", Registry())
+    (tmp_path / "a_1.0_amd64.deb").write_bytes(b"x" * 100)
+    (tmp_path / "b_1.0_amd64.deb").write_bytes(b"x" * 23)
+    (tmp_path / "notes.txt").write_text("not a package")
+    watch_staging(str(tmp_path))
+
+    families = parse(metrics.REGISTRY.render())
+    assert families["repo_watcher_staged_packages"]["type"] == "gauge"
+    assert families["repo_watcher_staged_packages"]["samples"] == [("repo_watcher_staged_packages", "", 2.0)]
+    assert families["repo_watcher_staged_bytes"]["samples"] == [("repo_watcher_staged_bytes", "", 123.0)]
+    assert "repo_watcher_staged" not in families
+
+def test_exposition_format():
+    registry = Registry()
+    counter = registry.counter("test_requests_total", "Requests by code", ["api", "code"])
+    counter.inc("rest", 200)
+    counter.inc("rest", 200)
+    counter.inc('gra"ph\\ql', 502)
+    histogram = registry.histogram("test_duration_seconds", "Duration", ["repo"], buckets=(0.1, 1))
+    histogram.observe(0.05, "a/b")
+    histogram.observe(5, "a/b")
+    registry.callback("test_broken", "Raises at scrape time", [], lambda: 1 / 0)
+
+    families = parse(registry.render())
+    assert families["test_requests_total"]["samples"] == [
+        ("test_requests_total", '{api="gra\\"ph\\\\ql",code="502"}', 1.0),
+        ("test_requests_total", '{api="rest",code="200"}', 2.0),
+    ]
+    assert families["test_duration_seconds"]["samples"] == [
+        ("test_duration_seconds_bucket", '{repo="a/b",le="0.1"}', 1.0),
+        ("test_duration_seconds_bucket", '{repo="a/b",le="1"}', 1.0),
+        ("test_duration_seconds_bucket", '{repo="a/b",le="+Inf"}', 2.0),
+        ("test_duration_seconds_sum", '{repo="a/b"}', 5.05),
+        ("test_duration_seconds_count", '{repo="a/b"}', 2.0),
+    ]
+    # A failing callback still renders its header, without samples
+    assert families["test_broken"]["samples"] == []
+
+def test_default_registry_renders():
+    parse(metrics.REGISTRY.render())
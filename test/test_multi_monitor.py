@@ -0,0 +1,138 @@
+import json
+import time
+import logging
+import threading
+
+import pytest
+
+pytest.importorskip("ansible_runner")
+
+import monitor
+import multi_monitor
+from scheduler import PollScheduler
+from webhook import WebhookReceiver
+
+REPO = "owner/repo"
+
+class Checks:
+    """check_release stand-in; block_first makes the first check hang until release() is called."""
+
+    def __init__(self, block_first=False):
+        self.calls = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        if not block_first:
+            self.gate.set()
+
+    def release_check(self, owner, repo, validators, logger):
+        self.calls += 1
+        if self.calls == 1:
+            self.entered.set()
+            self.gate.wait(10)
+        return None, None, None
+
+    def release(self):
+        self.gate.set()
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    scheduler = PollScheduler(status_file=str(tmp_path / "scheduler_status.json"))
+    checks = Checks(block_first=True)
+    monkeypatch.setattr(monitor, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(monitor, "get_repo_logger", lambda config: logging.getLogger("test-watcher"))
+    monkeypatch.setattr(monitor, "load_state", lambda config: {})
+    monkeypatch.setattr(monitor, "check_release", checks.release_check)
+    monkeypatch.setattr(monitor, "check_commit", lambda *args: (None, None))
+    monkeypatch.setattr(monitor, "handle_check_result", lambda *args: "unchanged")
+    monkeypatch.setattr(multi_monitor, "get_repo_logger", lambda config: logging.getLogger("test-watcher"))
+    monkeypatch.setattr(multi_monitor, "load_config", lambda path: json.loads(open(path).read()))
+    monkeypatch.setattr(multi_monitor, "STOP_TIMEOUT", 0.2)
+
+    fleet = multi_monitor.Fleet(builds=None, webhooks=WebhookReceiver(secret="secret", store=object()))
+    fleet.scheduler, fleet.checks = scheduler, checks
+    yield fleet
+    checks.release()
+    fleet.reconcile([])
+
+def write_config(tmp_path, name="repo.json", **overrides):
+    config = {"owner": "owner", "repo": "repo", "check_interval": 0.05, "reconcile_interval": 0.05,
+              "state_file": str(tmp_path / "repo_state.json"), "branch": "main"}
+    config.update(overrides)
+    path = tmp_path / name
+    path.write_text(json.dumps(config))
+    return path
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_add_and_remove(fleet, tmp_path):
+    path = write_config(tmp_path)
+    fleet.reconcile([path])
+    assert fleet.checks.entered.wait(5)
+    watcher = fleet.watchers["owner/repo"]
+    assert REPO in fleet.scheduler.repos
+    assert REPO in fleet.webhooks.handlers
+
+    fleet.checks.release()
+    fleet.reconcile([])
+    assert not watcher["thread"].is_alive()
+    assert fleet.watchers == {}
+    assert REPO not in fleet.scheduler.repos
+    assert REPO not in fleet.webhooks.handlers
+
+def test_update_in_place_keeps_the_thread(fleet, tmp_path):
+    path = write_config(tmp_path)
+    fleet.reconcile([path])
+    watcher = fleet.watchers["owner/repo"]
+    config = watcher["config"]
+
+    write_config(tmp_path, branch="release-1.x", check_interval=60)
+    fleet.reconcile([path])
+    assert fleet.watchers["owner/repo"]["thread"] is watcher["thread"]
+    # The watcher reads the same dict, so it sees the new branch on its next poll
+    assert config["branch"] == "release-1.x"
+    assert config["check_interval"] == 60
+
+    # An unchanged file changes nothing
+    fleet.reconcile([path])
+    assert fleet.watchers["owner/repo"]["thread"] is watcher["thread"]
+
+def test_readd_while_the_old_watcher_is_still_checking(fleet, tmp_path):
+    path = write_config(tmp_path)
+    fleet.reconcile([path])
+    assert fleet.checks.entered.wait(5)
+    old = fleet.watchers["owner/repo"]
+
+    # The old watcher is stuck in a check longer than STOP_TIMEOUT
+    fleet.reconcile([])
+    assert old["thread"].is_alive()
+    fleet.reconcile([path])
+    new = fleet.watchers["owner/repo"]
+    assert new["thread"] is not old["thread"]
+
+    # Its cleanup must leave the new watcher's entries alone
+    fleet.checks.release()
+    old["thread"].join(5)
+    assert not old["thread"].is_alive()
+    # Whichever order the two threads ran in, the new watcher ends up registered
+    wait_for(lambda: REPO in fleet.scheduler.repos)
+    assert fleet.scheduler.repos[REPO].owner is new["control"]
+    assert REPO in fleet.webhooks.handlers
+    assert fleet.scheduler.next_delay(REPO) > 0
+    assert new["thread"].is_alive()
+
+    fleet.reconcile([])
+    assert REPO not in fleet.scheduler.repos
+    assert REPO not in fleet.webhooks.handlers
+
+def test_unreadable_config_keeps_its_watcher(fleet, tmp_path):
+    path = write_config(tmp_path)
+    fleet.reconcile([path])
+    thread = fleet.watchers["owner/repo"]["thread"]
+    path.write_text("{ half written")
+    fleet.reconcile([path])
+    assert fleet.watchers["owner/repo"]["thread"] is thread
+    assert thread.is_alive()
@@ -0,0 +1,107 @@
+import logging
+
+import pytest
+import requests
+
+# monitor.py runs the pipeline through ansible_runner
+pytest.importorskip("ansible_runner")
+
+import monitor
+from monitor import COMPARE_FILE_LIMIT, changed_paths, commit_needs_build, handle_check_result, relevant_paths
+from state_store import StateStore
+
+LOGGER = logging.getLogger("test-filters")
+CONFIG = {"owner": "NVIDIA", "repo": "dcgm-exporter", "branch": "main",
+          "exclude_paths": ["*.md", "docs/*", ".github/*", "*_test.go"]}
+
+@pytest.fixture
+def compare(monkeypatch):
+    """Answers the compare API with compare.response (a dict, or an exception to raise); records the URLs."""
+    def fake(url, cache, parse):
+        fake.urls.append(url)
+        if isinstance(fake.response, Exception):
+            raise fake.response
+        return parse(fake.response)
+    fake.urls = []
+    fake.response = None
+    monkeypatch.setattr(monitor, "conditional_get", fake)
+    return fake
+
+def files(*names):
+    return [{"filename": name} for name in names]
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+def test_exclude_paths():
+    paths = ["README.md", "docs/metrics.md", "docs/img/arch.png", ".github/workflows/ci.yml",
+             "pkg/collector_test.go", "pkg/collector.go", "Makefile", "deployment/README.MD"]
+    # * crosses directories, matching is case sensitive
+    assert relevant_paths(CONFIG, paths) == ["pkg/collector.go", "Makefile", "deployment/README.MD"]
+
+def test_include_paths():
+    config = dict(CONFIG, include_paths=["pkg/*", "go.mod"])
+    assert relevant_paths(config, ["pkg/collector.go", "pkg/collector_test.go", "go.mod", "Makefile"]) == \
+        ["pkg/collector.go", "go.mod"]
+
+def test_changed_paths_include_renames(compare):
+    compare.response = {"status": "ahead", "files": files("a.go") + [{"filename": "docs/new.md",
+                                                                       "previous_filename": "cmd/old.go"}]}
+    assert changed_paths("o", "r", "base", "head", LOGGER) == ["a.go", "cmd/old.go", "docs/new.md"]
+    assert compare.urls[0].endswith("/repos/o/r/compare/base...head")
+
+def test_changed_paths_refuses_a_truncated_list(compare):
+    names = [f"docs/page-{i}.md" for i in range(COMPARE_FILE_LIMIT)]
+    compare.response = {"status": "ahead", "files": files(*names[:-1])}
+    assert len(changed_paths("o", "r", "a", "b", LOGGER)) == COMPARE_FILE_LIMIT - 1
+    compare.response = {"status": "ahead", "files": files(*names)}
+    assert changed_paths("o", "r", "a", "b", LOGGER) is None
+
+def test_changed_paths_refuses_force_pushes(compare):
+    compare.response = {"status": "diverged", "files": files("docs/a.md")}
+    assert changed_paths("o", "r", "a", "b", LOGGER) is None
+
+def test_only_excluded_changes_skip_the_build(compare):
+    compare.response = {"status": "ahead", "files": files("README.md", "docs/a.md")}
+    assert commit_needs_build(CONFIG, "a" * 40, "b" * 40, LOGGER) is False
+    compare.response = {"status": "ahead", "files": files("README.md", "pkg/collector.go")}
+    assert commit_needs_build(CONFIG, "a" * 40, "b" * 40, LOGGER) is True
+
+def test_truncated_compare_builds(compare):
+    # Every listed file is excluded, but the list is cut off: the rest could matter
+    compare.response = {"status": "ahead", "files": files(*(f"docs/p{i}.md" for i in range(COMPARE_FILE_LIMIT)))}
+    assert commit_needs_build(CONFIG, "a" * 40, "b" * 40, LOGGER) is True
+
+@pytest.mark.parametrize("error", [http_error(404), http_error(500), requests.exceptions.ConnectionError("reset"),
+                                   requests.exceptions.Timeout("slow")])
+def test_failed_compare_builds(compare, error):
+    compare.response = error
+    assert commit_needs_build(CONFIG, "a" * 40, "b" * 40, LOGGER) is True
+
+def test_no_compare_without_filters_or_base(compare):
+    assert commit_needs_build({"owner": "o", "repo": "r"}, "a" * 40, "b" * 40, LOGGER) is True
+    assert commit_needs_build(CONFIG, "", "b" * 40, LOGGER) is True
+    assert compare.urls == []
+
+def test_skipped_commit_still_advances_the_cursor(compare, tmp_path, monkeypatch):
+    store = StateStore(str(tmp_path / "state.db"))
+    monkeypatch.setattr(monitor, "get_state_store", lambda: store)
+
+    class Builds:
+        def __init__(self):
+            self.submitted = []
+
+        def submit(self, event_type, value, config):
+            self.submitted.append(value)
+            return len(self.submitted)
+
+    builds = Builds()
+    state = {"latest_release": "v1.0.0", "latest_commit": "a" * 40}
+    compare.response = {"status": "ahead", "files": files("docs/a.md")}
+    outcome = handle_check_result(CONFIG, state, ("v1.0.0", None, "release"), ("b" * 40, None), builds, LOGGER)
+    assert outcome == "changed"
+    assert builds.submitted == []
+    assert state["latest_commit"] == "b" * 40
+    assert store.events()[0]["job_id"] is None
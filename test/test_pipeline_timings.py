@@ -0,0 +1,91 @@
+import pytest
+
+from pipeline_timings import (REGRESSION_MIN_SECONDS, TaskTimer, overhead, regressions, setup_overhead,
+                              slowest_tasks)
+from state_store import StateStore
+from tools.benchmark import STUB_TASKS, StubRunner
+
+def event(kind, uuid, created, task="Build binary", role="exporter-build", **data):
+    return {"event": kind, "created": created, "event_data": {"task_uuid": uuid, "task": task, "role": role, **data}}
+
+def test_timer_follows_stub_runner_events():
+    timer = TaskTimer()
+    result = StubRunner(duration=0.4, jitter=0).run(extravars={"exporter_name": "node-exporter"},
+                                                    event_handler=timer.handle)
+    assert result.rc == 0
+    tasks = timer.results()
+    assert [(t["role"], t["task"], t["status"]) for t in tasks] == [(role, task, "ok") for role, task, _ in STUB_TASKS]
+    for task, (_, _, share) in zip(tasks, STUB_TASKS):
+        assert task["duration"] == pytest.approx(0.4 * share, abs=0.05)
+    setup, total = setup_overhead(tasks)
+    assert setup == tasks[0]["duration"]  # Gathering Facts
+    assert total == pytest.approx(0.4, abs=0.05)
+
+def test_timer_aggregates_hosts_and_failures():
+    timer = TaskTimer()
+    timer.handle(event("playbook_on_task_start", "t1", "2026-01-01T00:00:00"))
+    timer.handle(event("runner_on_failed", "t1", "2026-01-01T00:00:05"))
+    # A later ok on another host neither hides the failure nor ends the task early
+    timer.handle(event("runner_on_ok", "t1", "2026-01-01T00:00:03"))
+    timer.handle(event("playbook_on_task_start", "t2", "2026-01-01T00:00:06", task="include_role"))
+    timer.handle(event("playbook_on_task_start", "t3", "2026-01-01T00:00:08", task="Copy"))
+    # runner_on_* carries the real end in event_data
+    timer.handle(event("runner_on_skipped", "t3", "2026-01-01T00:00:30", task="Copy", end="2026-01-01T00:00:09"))
+    # Results of tasks the timer never saw start are ignored
+    timer.handle(event("runner_on_ok", "unknown", "2026-01-01T00:00:10"))
+
+    tasks = timer.results()
+    assert [(t["task"], t["status"], t["duration"]) for t in tasks] == [
+        ("Build binary", "failed", 5.0),
+        ("include_role", "no result", 2.0),
+        ("Copy", "skipped", 1.0),
+    ]
+
+def record_run(store, job_id, start, durations, exporter="node-exporter"):
+    """A build whose tasks run back to back for durations {task: seconds}."""
+    tasks, at = [], start
+    for task, seconds in durations.items():
+        tasks.append({"role": "exporter-build", "task": task, "status": "ok", "start": at, "end": at + seconds,
+                      "duration": seconds})
+        at += seconds
+    store.record_build(job_id, 1, f"prometheus/{exporter}", "commit", "a" * 40, "succeeded", start,
+                       exporter=exporter, tasks=tasks)
+
+@pytest.fixture
+def store(tmp_path):
+    return StateStore(str(tmp_path / "state.db"))
+
+def test_regressions_compare_against_the_median(store):
+    for job_id, build in enumerate([20, 22, 19, 21, 60], start=1):
+        record_run(store, job_id, 1_800_000_000 + job_id * 1000,
+                   {"Build binary": build, "Clone repository": 2, "Build .deb package": 1 + (job_id == 5) * 3})
+    found = regressions(store.task_timings(exporter="node-exporter"))
+    # Build .deb package is 4x slower, but only by 3s
+    assert found == [("node-exporter", 5, "exporter-build", "Build binary", 60, 20.5)]
+
+def test_small_or_proportionate_slowdowns_are_not_regressions(store):
+    for job_id, build in enumerate([20, 20, 29], start=1):
+        record_run(store, job_id, 1_800_000_000 + job_id * 1000, {"Build binary": build})
+    assert 29 - 20 >= REGRESSION_MIN_SECONDS
+    assert regressions(store.task_timings()) == []
+
+def test_regressions_use_the_latest_run_of_each_exporter(store):
+    record_run(store, 1, 1_800_000_000, {"Build binary": 20})
+    record_run(store, 2, 1_800_001_000, {"Build binary": 20}, exporter="dcgm-exporter")
+    record_run(store, 3, 1_800_002_000, {"Build binary": 100})
+    # dcgm-exporter has a single run, nothing to compare with
+    assert [r[:2] for r in regressions(store.task_timings())] == [("node-exporter", 3)]
+
+def test_reports_over_stub_runs(store):
+    for job_id in (1, 2):
+        timer = TaskTimer()
+        StubRunner(duration=0.1, jitter=0).run(extravars={"exporter_name": "node-exporter"}, event_handler=timer.handle)
+        store.record_build(job_id, 1, "prometheus/node_exporter", "commit", "a" * 40, "succeeded",
+                           timer.results()[0]["start"], exporter="node-exporter", tasks=timer.results())
+    rows = store.task_timings(exporter="node-exporter")
+    assert len(rows) == 2 * len(STUB_TASKS)
+    slowest = slowest_tasks(rows, top=1)[0]
+    assert slowest[:4] == ("node-exporter", "exporter-build", "Build binary", 2)
+    ((exporter, mode, runs, setup, total),) = overhead(rows)
+    assert (exporter, mode, runs) == ("node-exporter", "cold", 2)
+    assert 0 < setup < total
@@ -0,0 +1,144 @@
+import os
+import errno
+
+import pytest
+
+import promote
+from promote import plan, transfer, transfer_all
+
+PAYLOAD = os.urandom(256 * 1024) + b"tail"
+
+@pytest.fixture
+def src(tmp_path):
+    (tmp_path / "staging").mkdir()
+    (tmp_path / "pool").mkdir()
+    path = tmp_path / "staging" / "node-exporter_1.8.2-1_amd64.deb"
+    path.write_bytes(PAYLOAD)
+    os.chmod(path, 0o640)
+    os.utime(path, ns=(1700000000_000000000, 1700000000_123456789))
+    return str(path)
+
+def dest_for(src):
+    return os.path.join(os.path.dirname(os.path.dirname(src)), "pool", os.path.basename(src))
+
+def no_link(monkeypatch):
+    """Make os.link fail like it does across filesystems."""
+    def link(a, b):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    monkeypatch.setattr(promote.os, "link", link)
+
+def assert_identical(src, dest):
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    st_src, st_dest = os.stat(src), os.stat(dest)
+    assert st_dest.st_mode == st_src.st_mode
+    assert st_dest.st_mtime_ns == st_src.st_mtime_ns
+    assert [name for name in os.listdir(os.path.dirname(dest)) if name.endswith(".tmp")] == []
+
+def test_same_filesystem_hardlinks(src):
+    dest = dest_for(src)
+    assert transfer(src, dest) == ("hardlink", 0)
+    assert os.path.samefile(src, dest)
+    assert transfer(src, dest) == ("up to date", 0)
+
+def test_cross_device_reflinks(src, monkeypatch):
+    no_link(monkeypatch)
+    clones = []
+
+    def reflink(src_fd, dest_fd):
+        # Stands in for FICLONE, which needs btrfs or xfs
+        clones.append(src_fd)
+        os.write(dest_fd, os.pread(src_fd, len(PAYLOAD) + 1, 0))
+        return True
+    monkeypatch.setattr(promote, "_reflink", reflink)
+    dest = dest_for(src)
+    assert transfer(src, dest) == ("reflink", 0)
+    assert len(clones) == 1
+    assert not os.path.samefile(src, dest)
+    assert_identical(src, dest)
+
+def test_cross_device_copies_without_reflink(src, monkeypatch):
+    no_link(monkeypatch)
+    monkeypatch.setattr(promote, "_reflink", lambda src_fd, dest_fd: False)
+    dest = dest_for(src)
+    assert transfer(src, dest) == ("copy", len(PAYLOAD))
+    assert_identical(src, dest)
+
+def test_reflink_errors_fall_back_to_copy(src, monkeypatch):
+    no_link(monkeypatch)
+
+    def ioctl(fd, request, arg):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    monkeypatch.setattr(promote.fcntl, "ioctl", ioctl)
+    assert transfer(src, dest_for(src)) == ("copy", len(PAYLOAD))
+    assert_identical(src, dest_for(src))
+
+def test_copy_file_range_exdev_falls_back_to_read_write(src, monkeypatch):
+    no_link(monkeypatch)
+    monkeypatch.setattr(promote, "_reflink", lambda src_fd, dest_fd: False)
+    calls = []
+
+    def copy_file_range(src_fd, dest_fd, count):
+        calls.append(count)
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    monkeypatch.setattr(promote.os, "copy_file_range", copy_file_range, raising=False)
+    monkeypatch.setattr(promote, "CHUNK_SIZE", 64 * 1024)
+    assert transfer(src, dest_for(src)) == ("copy", len(PAYLOAD))
+    # Tried once, then read/write for every chunk
+    assert len(calls) == 1
+    assert_identical(src, dest_for(src))
+
+def test_publish_is_atomic(src, monkeypatch):
+    dest = dest_for(src)
+    with open(dest, "wb") as f:
+        f.write(b"previous build")
+    no_link(monkeypatch)
+    monkeypatch.setattr(promote, "_reflink", lambda src_fd, dest_fd: False)
+    renames = []
+    replace = os.replace
+
+    def checking_replace(a, b):
+        # dest still holds the old file until the complete new one is renamed over it
+        with open(b, "rb") as f:
+            assert f.read() == b"previous build"
+        with open(a, "rb") as f:
+            assert f.read() == PAYLOAD
+        renames.append((os.path.basename(a), b))
+        replace(a, b)
+    monkeypatch.setattr(promote.os, "replace", checking_replace)
+    transfer(src, dest)
+    assert len(renames) == 1 and renames[0][0].endswith(".tmp") and renames[0][1] == dest
+
+def test_failed_copy_leaves_the_old_file(src, monkeypatch):
+    dest = dest_for(src)
+    with open(dest, "wb") as f:
+        f.write(b"previous build")
+    no_link(monkeypatch)
+    monkeypatch.setattr(promote, "_reflink", lambda src_fd, dest_fd: False)
+    monkeypatch.setattr(promote, "_copy_range", lambda src_fd, dest_fd, size: size // 2)
+    results = transfer_all([(src, dest)])
+    assert isinstance(results[dest], OSError) and "short copy" in str(results[dest])
+    with open(dest, "rb") as f:
+        assert f.read() == b"previous build"
+    assert [name for name in os.listdir(os.path.dirname(dest)) if name.endswith(".tmp")] == []
+
+def test_plan(src, monkeypatch):
+    dest = dest_for(src)
+    assert plan(src, dest) == ("hardlink", 0)
+    transfer(src, dest)
+    assert plan(src, dest) == ("up to date", 0)
+    os.remove(dest)
+
+    # The pool on another device: the whole file is counted as copied
+    stat = os.stat
+    pool = os.path.dirname(dest)
+
+    def other_device(path, *args, **kwargs):
+        st = stat(path, *args, **kwargs)
+        if str(path).startswith(pool):
+            return os.stat_result(tuple(st)[:2] + (st.st_dev + 1,) + tuple(st)[3:])
+        return st
+    monkeypatch.setattr(promote.os, "stat", other_device)
+    assert plan(src, dest) == ("reflink/copy", len(PAYLOAD))
+    # A pool dir that does not exist yet is probed through its parent
+    assert plan(src, os.path.join(pool, "new", os.path.basename(src)))[0] == "reflink/copy"
@@ -0,0 +1,76 @@
+import os
+import tarfile
+
+import pytest
+
+import release_assets
+from release_assets import AssetError, download, fetch_prebuilt
+from tools.fake_github import FakeGitHub, serve
+
+ASSET_SIZE = 256 * 1024
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    fake = FakeGitHub(repos=1, change_rate=0, tags_only=0, latency=0, seed=1, asset_size=ASSET_SIZE)
+    server = serve(fake)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(release_assets, "API_URL", url)
+    monkeypatch.setattr(release_assets, "ASSET_DIR", str(tmp_path / "assets"))
+    # No backoff between attempts
+    monkeypatch.setattr(release_assets.time, "sleep", lambda seconds: None)
+    fake.url = url
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+CONFIG = {"owner": "bench", "repo": "repo-0000",
+          "release_assets": {"pattern": "repo-0000-*.linux-amd64.tar.gz", "checksums": "sha256sums.txt"}}
+
+def tarball(fake, tag="v1.0.0"):
+    repo = fake.repos["bench/repo-0000"]
+    return next((name, data) for name, data in fake.release_assets(repo, tag).items() if name.endswith(".tar.gz"))
+
+def test_fetch_prebuilt_extracts_verified_binary(github, tmp_path):
+    binary = fetch_prebuilt(CONFIG, "v1.0.0", str(tmp_path / "prebuilt"))
+    assert binary == str(tmp_path / "prebuilt" / "repo-0000")
+    with open(binary, "rb") as f:
+        assert f.read().startswith(b"#!/bin/sh\n# v1.0.0\n")
+    assert os.access(binary, os.X_OK)
+    name, _ = tarball(github)
+    # Only the verified tarball is kept, no .part or sums file
+    assert os.listdir(tmp_path / "assets" / "repo-0000") == [name]
+
+def test_truncated_download_is_resumed(github, tmp_path):
+    name, data = tarball(github)
+    dest = str(tmp_path / "download" / name)
+    os.makedirs(os.path.dirname(dest))
+    # An earlier download died halfway
+    with open(f"{dest}.part", "wb") as f:
+        f.write(data[:len(data) // 2])
+    download(f"{github.url}/_assets/bench/repo-0000/v1.0.0/{name}", dest, len(data))
+    with open(dest, "rb") as f:
+        assert f.read() == data
+    assert github.requests == {"assets 200": 1}
+
+def test_downloads_cut_off_halfway_are_completed(github, tmp_path):
+    github.asset_failure = 0.5
+    binary = fetch_prebuilt(CONFIG, "v1.0.0", str(tmp_path / "prebuilt"))
+    with tarfile.open(os.path.join(release_assets.ASSET_DIR, "repo-0000", tarball(github)[0])) as tar:
+        member = next(m for m in tar if m.name.endswith("/repo-0000"))
+        assert os.path.getsize(binary) == member.size
+
+def test_checksum_mismatch_is_rejected(github, tmp_path):
+    name, data = tarball(github)
+    corrupt = os.path.join(release_assets.ASSET_DIR, "repo-0000", name)
+    os.makedirs(os.path.dirname(corrupt))
+    # A complete .part with the wrong content: nothing left to download, the checksum has to catch it
+    with open(f"{corrupt}.part", "wb") as f:
+        f.write(b"x" * len(data))
+    with pytest.raises(AssetError, match="sha256"):
+        fetch_prebuilt(CONFIG, "v1.0.0", str(tmp_path / "prebuilt"))
+    assert not os.path.exists(corrupt)
+
+def test_unknown_asset_pattern_is_an_error(github, tmp_path):
+    config = dict(CONFIG, release_assets={"pattern": "*.zip"})
+    with pytest.raises(AssetError, match="0 assets"):
+        fetch_prebuilt(config, "v1.0.0", str(tmp_path / "prebuilt"))
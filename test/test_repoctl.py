@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+import pytest
+
+from state_store import StateStore
+from test_catalog import make_deb
+
+REPOCTL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli", "repoctl.py")
+
+@pytest.fixture
+def repoctl(tmp_path):
+    """Runs cli/repoctl.py with a config whose dirs are all under tmp_path; returns its stdout."""
+    config = {
+        "staging_dir": str(tmp_path / "staging"),
+        "repo_dir": str(tmp_path / "www" / "pool"),
+        "log_file": str(tmp_path / "log" / "repoctl.log"),
+    }
+    for key in ("staging_dir", "repo_dir"):
+        os.makedirs(config[key])
+    config_file = tmp_path / "cli-config.json"
+    config_file.write_text(json.dumps(config))
+
+    def run(*args):
+        result = subprocess.run([sys.executable, REPOCTL, *args], capture_output=True, text=True, timeout=60,
+                                env=dict(os.environ, REPOCTL_CONFIG=str(config_file)))
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+    run.dirs = config
+    return run
+
+def test_builds_status_filter(repoctl, tmp_path):
+    store = StateStore(str(tmp_path / "state" / "state.db"))
+    started = time.time() - 60
+    store.record_build(1, 1, "nvidia/dcgm-exporter", "release", "4.2.0", "succeeded", started)
+    store.record_build(2, 1, "nvidia/dcgm-exporter", "commit", "a" * 40, "failed", started, error="make failed")
+
+    out = repoctl("builds", "--status", "failed")
+    builds = [line for line in out.splitlines() if line.startswith(" - ")]
+    assert len(builds) == 1 and "job 2 " in builds[0] and "make failed" in builds[0]
+    assert "NOT published" not in out
+
+    out = repoctl("builds", "--status", "succeeded")
+    assert [line for line in out.splitlines() if line.startswith(" - ")][0].count("4.2.0") == 1
+
+def test_legacy_status_flag(repoctl):
+    assert "NOT published" in repoctl("--status", "missing_1.0.0.deb")
+
+def test_list_filters_and_sort(repoctl):
+    for package, version in [("dcgm-exporter", "4.2.0-1"), ("dcgm-exporter", "4.10.0-1"), ("node-exporter", "1.8.2-1")]:
+        make_deb(repoctl.dirs["staging_dir"], package, version)
+
+    def listed(*args):
+        return [line.split()[1] for line in repoctl("list", *args).splitlines() if line.startswith(" - ")]
+    assert listed() == ["dcgm-exporter_4.10.0-1_amd64.deb", "dcgm-exporter_4.2.0-1_amd64.deb",
+                        "node-exporter_1.8.2-1_amd64.deb"]
+    assert listed("--package", "dcgm*", "--sort", "version") == ["dcgm-exporter_4.2.0-1_amd64.deb",
+                                                                 "dcgm-exporter_4.10.0-1_amd64.deb"]
+    assert listed("--package", "dcgm*", "--sort", "version", "--reverse")[0] == "dcgm-exporter_4.10.0-1_amd64.deb"
+    assert listed("--version", "1.*") == ["node-exporter_1.8.2-1_amd64.deb"]
+
+def test_publish_check_plan(repoctl):
+    staging, pool = repoctl.dirs["staging_dir"], repoctl.dirs["repo_dir"]
+    for version in ("4.2.0-1", "4.10.0-1"):
+        make_deb(staging, "dcgm-exporter", version)
+
+    out = repoctl("publish", "--check", "--package", "dcgm*")
+    assert out.count("(hardlink, 0 bytes to copy)") == 2
+    assert "[CHECK] 2 package(s), 0 bytes would be copied" in out
+    assert os.listdir(pool) == []
+
+    out = repoctl("publish", "--yes", "--latest", "--package", "dcgm*")
+    assert "[OK] Published dcgm-exporter_4.10.0-1_amd64.deb" in out
+    assert os.path.samefile(os.path.join(staging, "dcgm-exporter_4.10.0-1_amd64.deb"),
+                            os.path.join(pool, "dcgm-exporter_4.10.0-1_amd64.deb"))
+    out = repoctl("publish", "--check", "dcgm-exporter_4.10.0-1_amd64.deb")
+    assert "(up to date, 0 bytes to copy)" in out
@@ -0,0 +1,112 @@
+import time
+import types
+
+import pytest
+
+import scheduler
+from scheduler import JITTER, MAX_BACKOFF, MIN_INTERVAL, RATE_LIMIT_RESERVE, PollScheduler
+
+class Clock:
+    def __init__(self, now=1_800_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler, "time", types.SimpleNamespace(time=clock, sleep=time.sleep, strptime=time.strptime))
+    # Middle of every random range: no jitter, phase at half the interval
+    monkeypatch.setattr(scheduler.random, "uniform", lambda a, b: (a + b) / 2)
+    return clock
+
+@pytest.fixture
+def sched(tmp_path, clock):
+    return PollScheduler(status_file=str(tmp_path / "scheduler_status.json"))
+
+def headers(clock, remaining, reset_in, limit=5000, **extra):
+    return {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(clock.now + reset_in)), **extra}
+
+def test_register_and_unregister(sched):
+    assert sched.register("a/b", 120) == 60
+    assert sched.next_delay("a/b") == 120
+    sched.unregister("a/b")
+    with pytest.raises(KeyError):
+        sched.next_delay("a/b")
+
+def test_unregister_ignores_a_stale_owner(sched):
+    old, new = object(), object()
+    sched.register("a/b", 120, owner=old)
+    sched.register("a/b", 120, owner=new)
+    sched.unregister("a/b", owner=old)
+    assert sched.next_delay("a/b") == 120
+    sched.unregister("a/b", owner=new)
+    assert "a/b" not in sched.repos
+
+def test_reregister_keeps_the_learned_interval(sched):
+    sched.register("a/b", 120)
+    sched.record_result("a/b", "changed")
+    assert sched.next_delay("a/b") == 60
+    sched.register("a/b", 120)
+    assert sched.next_delay("a/b") == 60
+    # A new base interval still bounds it
+    sched.register("a/b", 600)
+    assert sched.next_delay("a/b") == 150
+
+def test_interval_adapts_to_changes(sched):
+    sched.register("a/b", 120)
+    for _ in range(5):
+        sched.record_result("a/b", "changed")
+    assert sched.next_delay("a/b") == MIN_INTERVAL
+    for _ in range(100):
+        sched.record_result("a/b", "unchanged")
+    assert sched.next_delay("a/b") == 120 * 8
+
+def test_interval_stretches_when_quota_runs_low(sched, clock):
+    for i in range(10):
+        sched.register(f"o/r{i}", 60)
+    # 10 repos x 2 calls / 60s: 1200 calls per hour
+    sched.update_rate_limit(headers(clock, RATE_LIMIT_RESERVE + 5000, 3600))
+    assert sched.next_delay("o/r0") == 60
+    sched.update_rate_limit(headers(clock, RATE_LIMIT_RESERVE + 600, 3600))
+    assert sched.next_delay("o/r0") == pytest.approx(120)
+    # Another resource's quota does not matter
+    sched.update_rate_limit(headers(clock, 0, 3600, **{"X-RateLimit-Resource": "graphql"}))
+    assert sched.next_delay("o/r0") == pytest.approx(120)
+
+def test_exhausted_quota_waits_for_the_reset(sched, clock):
+    sched.register("a/b", 120)
+    # A 403 for the primary rate limit: nothing left until the reset
+    sched.update_rate_limit(headers(clock, 0, 900))
+    assert sched.next_delay("a/b") == 900 + 60
+    # After the reset the old limits no longer apply
+    clock.now += 901
+    assert sched.next_delay("a/b") == 120
+
+def test_secondary_rate_limit_blocks_every_repo(sched, clock):
+    sched.register("a/b", 120)
+    sched.register("c/d", 120)
+    sched.update_rate_limit(headers(clock, 4000, 3600, **{"Retry-After": "600"}))
+    assert sched.next_delay("a/b") == 600
+    assert sched.next_delay("c/d") == 600
+    clock.now += 600
+    assert sched.next_delay("a/b") == 120
+
+def test_errors_back_off_exponentially(sched):
+    sched.register("a/b", 120)
+    delays = []
+    for _ in range(6):
+        sched.record_result("a/b", "error")
+        delays.append(sched.next_delay("a/b"))
+    assert delays == [240, 480, 960, 1920, MAX_BACKOFF, MAX_BACKOFF]
+    sched.record_result("a/b", "unchanged")
+    assert sched.next_delay("a/b") == pytest.approx(132)
+
+def test_jitter_stays_within_bounds(sched, monkeypatch):
+    sched.register("a/b", 100)
+    monkeypatch.setattr(scheduler.random, "uniform", lambda a, b: b)
+    assert sched.next_delay("a/b") == pytest.approx(100 * (1 + JITTER))
+    monkeypatch.setattr(scheduler.random, "uniform", lambda a, b: a)
+    assert sched.next_delay("a/b") == pytest.approx(100 * (1 - JITTER))
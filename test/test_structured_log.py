@@ -0,0 +1,27 @@
+import logging
+
+from structured_log import RepeatFilter
+
+def make_record(msg, level=logging.INFO, event=None, created=0.0):
+    record = logging.LogRecord("repo", level, __file__, 1, msg, None, None)
+    record.created = created
+    if event:
+        record.event = event
+    return record
+
+def test_unchanged_poll_is_collapsed_within_window():
+    repeats = RepeatFilter(window=60)
+    assert repeats.filter(make_record("No new release", event="unchanged", created=0))
+    assert not repeats.filter(make_record("No new release", event="unchanged", created=10))
+    assert not repeats.filter(make_record("No new release", event="unchanged", created=20))
+    record = make_record("No new release", event="unchanged", created=61)
+    assert repeats.filter(record)
+    assert record.repeated == 2
+
+def test_other_messages_always_pass():
+    repeats = RepeatFilter(window=60)
+    for created in (0, 1, 2):
+        assert repeats.filter(make_record("Pipeline finished successfully", created=created))
+        assert repeats.filter(make_record("Pipeline failed!", level=logging.ERROR, created=created))
+        # Even a tagged record is never hidden at WARNING and above
+        assert repeats.filter(make_record("No new release", level=logging.WARNING, event="unchanged", created=created))
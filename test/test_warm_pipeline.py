@@ -0,0 +1,56 @@
+import os
+import glob
+import time
+import types
+
+import pytest
+
+from warm_pipeline import WarmPipeline
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTRAVARS = {"exporter_name": "node-exporter", "service_user": "james", "service_group": "james"}
+
+def test_pipeline_takes_no_dates_from_cached_facts():
+    # Warm runs gather facts at most once a day, a date fact would be stale
+    for path in glob.glob(os.path.join(REPO_ROOT, "pipeline", "**", "*"), recursive=True):
+        if path.endswith((".yml", ".j2")):
+            with open(path) as f:
+                assert "ansible_date_time" not in f.read(), path
+
+def test_fingerprint_follows_setup_inputs(tmp_path):
+    tasks = tmp_path / "roles" / "common" / "tasks" / "main.yml"
+    tasks.parent.mkdir(parents=True)
+    tasks.write_text("---\n")
+    warm = WarmPipeline(str(tmp_path))
+    assert not warm.is_warm("node-exporter", EXTRAVARS)
+    warm.record("node-exporter", EXTRAVARS, True)
+    assert warm.is_warm("node-exporter", EXTRAVARS)
+    assert not warm.is_warm("node-exporter", dict(EXTRAVARS, service_user="other"))
+    tasks.write_text("--- # changed\n")
+    assert not warm.is_warm("node-exporter", EXTRAVARS)
+    warm.record("node-exporter", EXTRAVARS, True)
+    warm.record("node-exporter", EXTRAVARS, False)
+    assert not warm.is_warm("node-exporter", EXTRAVARS)
+
+def test_warm_runs_get_the_current_build_date(tmp_path, monkeypatch):
+    pytest.importorskip("ansible_runner")
+    import monitor
+    runs = []
+
+    def run(**kwargs):
+        runs.append(kwargs)
+        return types.SimpleNamespace(rc=0, status="successful", events=[])
+    monkeypatch.setattr(monitor.ansible_runner, "run", run)
+    monkeypatch.setattr(monitor, "warm_state", WarmPipeline(str(tmp_path / "pipeline")))
+    monkeypatch.setattr(monitor, "enforce_budgets", lambda exporter: None)
+    config = {"owner": "prometheus", "repo": "node_exporter", "repo_url": "https://github.com/prometheus/node_exporter",
+              "git_mirror": False, "artifact_cache": False}
+    for _ in range(2):
+        assert monitor.trigger_pipeline("commit", "a" * 40, config, build_root=str(tmp_path / "build"),
+                                        private_data_dir=str(tmp_path / "run"), staging_dir=str(tmp_path / "staging"))
+    cold, warm = runs
+    assert not cold["extravars"]["setup_warm"] and warm["extravars"]["setup_warm"]
+    # Facts come from the persistent cache, the date does not
+    assert warm["fact_cache_type"] == "jsonfile" and warm["envvars"]["ANSIBLE_GATHERING"] == "smart"
+    assert warm["extravars"]["build_date"] == time.strftime("%Y-%m-%d")
+    assert warm["extravars"]["build_time"].startswith(time.strftime("%Y-%m-%dT", time.gmtime()))
@@ -0,0 +1,87 @@
+import json
+import time
+import urllib.request
+
+import pytest
+
+from state_store import StateStore
+from webhook import WebhookReceiver, sample_payload, send
+
+SECRET = "test-secret"
+REPO = "owner/repo"
+
+@pytest.fixture
+def receiver(tmp_path):
+    receiver = WebhookReceiver(secret=SECRET, store=StateStore(str(tmp_path / "state.db")))
+    server = receiver.start(0, addr="127.0.0.1")
+    receiver.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield receiver
+    server.shutdown()
+    server.server_close()
+
+def register(receiver, outcomes):
+    """Handler returning the next of outcomes (raising it if it is an exception), recording each call."""
+    calls = []
+
+    def handler(event, payload):
+        calls.append((event, payload))
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    receiver.register(REPO, handler)
+    return calls
+
+def wait_for(calls, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(calls) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return len(calls)
+
+def known(store, delivery):
+    return store.connect().execute("SELECT 1 FROM deliveries WHERE id = ?", (delivery,)).fetchone() is not None
+
+def post(url, headers, body):
+    request = urllib.request.Request(url, data=body, method="POST", headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def test_good_signature_is_accepted(receiver):
+    calls = register(receiver, ["changed"])
+    status, message = send(receiver.url, SECRET, "push", sample_payload("push", REPO, "a" * 40))
+    assert (status, message) == (202, "accepted")
+    assert wait_for(calls, 1) == 1
+    assert calls[0][0] == "push" and calls[0][1]["after"] == "a" * 40
+
+def test_bad_or_missing_signature_is_rejected(receiver):
+    calls = register(receiver, ["changed"])
+    assert send(receiver.url, "wrong-secret", "push", sample_payload("push", REPO, "a" * 40))[0] == 401
+    body = json.dumps(sample_payload("push", REPO, "a" * 40)).encode()
+    assert post(receiver.url, {"X-GitHub-Event": "push", "X-GitHub-Delivery": "d1"}, body) == 401
+    time.sleep(0.1)
+    assert calls == []
+
+def test_duplicate_delivery_is_rejected(receiver):
+    calls = register(receiver, ["changed", "changed"])
+    payload = sample_payload("release", REPO, "v1.0.0")
+    assert send(receiver.url, SECRET, "release", payload, delivery="d1") == (202, "accepted")
+    assert wait_for(calls, 1) == 1
+    assert send(receiver.url, SECRET, "release", payload, delivery="d1") == (200, "duplicate delivery")
+    time.sleep(0.1)
+    assert len(calls) == 1
+
+@pytest.mark.parametrize("failure", [RuntimeError("API down"), "error"])
+def test_failed_delivery_can_be_retried(receiver, failure):
+    calls = register(receiver, [failure, "changed"])
+    payload = sample_payload("push", REPO, "b" * 40)
+    assert send(receiver.url, SECRET, "push", payload, delivery="d2") == (202, "accepted")
+    assert wait_for(calls, 1) == 1
+    # The handler runs after the reply, wait until it has forgotten the delivery
+    deadline = time.monotonic() + 5
+    while known(receiver.store, "d2") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert send(receiver.url, SECRET, "push", payload, delivery="d2") == (202, "accepted")
+    assert wait_for(calls, 2) == 2
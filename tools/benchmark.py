@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the watchers and the build path.
+
+For every scenario (number of repos) this starts tools/fake_github.py,
+then runs the real watcher code (REST threads, --async or --graphql)
+against it in a child process, with ansible_runner replaced by a stub
+that sleeps instead of building. Nothing outside a temporary directory is
+touched and no GitHub quota is used.
+
+Per scenario it reports API calls per poll cycle, detection latency
+(change on the fake server -> build queued), trigger latency (change ->
+pipeline started), poll duration, builds, CPU and RSS of the watcher
+process. Results are written as JSON; --baseline compares against an
+earlier result file and exits 1 on a regression.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import platform
+import threading
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_GITHUB = os.path.join(REPO_ROOT, "tools", "fake_github.py")
+MODES = ("threads", "async", "graphql")
+DEFAULT_SCENARIOS = (10, 100, 1000)
+STARTUP_TIMEOUT = 30
+
+# Share of a stub build each fake task takes
+STUB_TASKS = (
+    ("", "Gathering Facts", 0.05),
+    ("common", "Clone repository", 0.15),
+    ("exporter-build", "Build binary", 0.6),
+    ("package-builder", "Build .deb package", 0.2),
+)
+
+# (metric path, label) where higher is worse, checked by --baseline
+COMPARED = (
+    (("api", "calls_per_cycle"), "API calls per cycle"),
+    (("detection_latency", "p95"), "detection latency p95 (s)"),
+    (("trigger_latency", "p95"), "trigger latency p95 (s)"),
+    (("poll_duration_mean", ), "mean poll duration (s)"),
+    (("process", "cpu_percent"), "CPU %"),
+    (("process", "rss_peak_mb"), "peak RSS (MiB)"),
+)
+
+# ───────── Stub ansible_runner ─────────
+
+class StubResult:
+    def __init__(self, rc, events):
+        self.rc = rc
+        self.status = "successful" if rc == 0 else "failed"
+        self.events = events
+
+class StubRunner:
+    """
+    Stands in for the ansible_runner module. run() sleeps for a build's
+    worth of time, feeding task start/ok events to the event_handler.
+    """
+
+    def __init__(self, duration=1.0, jitter=0.2, failure_rate=0.0):
+        self.duration = duration
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.triggered = []
+
+    def run(self, private_data_dir=None, extravars=None, event_handler=None, **kwargs):
+        extravars = extravars or {}
+        with self.lock:
+            self.triggered.append((extravars.get("exporter_name"), extravars.get("git_ref"), time.time()))
+        total = max(0.0, random.gauss(self.duration, self.duration * self.jitter))
+        events = []
+        for i, (role, task, share) in enumerate(STUB_TASKS):
+            uuid = f"{extravars.get('exporter_name')}-{i}"
+            for kind in ("playbook_on_task_start", "runner_on_ok"):
+                if kind == "runner_on_ok":
+                    time.sleep(total * share)
+                event = {"event": kind, "created": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
+                         "event_data": {"task_uuid": uuid, "task": task, "role": role}}
+                events.append(event)
+                if event_handler:
+                    event_handler(event)
+        return StubResult(1 if random.random() < self.failure_rate else 0, events)
+
+# ───────── Watcher side (child process) ─────────
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "max": None}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))], 3)
+    return {"count": len(values), "p50": pick(0.5), "p95": pick(0.95), "max": round(values[-1], 3)}
+
+def _fetch_state(server):
+    with urllib.request.urlopen(f"{server}/_bench/state", timeout=30) as r:
+        return json.load(r)
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+def run_watchers(server, repos, mode, duration, interval, build_workers, stub, workdir):
+    """Run the watchers of one scenario against the fake server; returns its results."""
+    os.environ["GITHUB_API_URL"] = server
+    os.environ["GITHUB_GRAPHQL_URL"] = f"{server}/graphql"
+    # GraphQL refuses anonymous requests, the fake server accepts any token
+    os.environ.setdefault("GITHUB_TOKEN", "benchmark")
+    sys.modules["ansible_runner"] = stub
+    sys.path.insert(0, REPO_ROOT)
+
+    import scheduler
+    import state_store
+    import build_executor
+    import monitor
+    from job_queue import JobQueue
+    from metrics import POLLS, POLL_DURATION
+    from structured_log import setup_logging
+
+    # Keep every path of the watcher inside the work directory
+    scheduler.MIN_INTERVAL = min(scheduler.MIN_INTERVAL, interval / 4)
+    scheduler._scheduler = scheduler.PollScheduler(status_file=os.path.join(workdir, "scheduler_status.json"))
+    store = state_store._store = state_store.StateStore(os.path.join(workdir, "state", "state.db"))
+    build_executor.BUILD_ROOT = os.path.join(workdir, "build")
+    build_executor.RUNS_DIR = os.path.join(workdir, "runs")
+    monitor.STAGING_DIR = os.path.join(workdir, "staging")
+    setup_logging(main_log=os.path.join(workdir, "log", "repo-watcher.log"), console=False)
+
+    initial = _fetch_state(server)["initial"]
+    configs = []
+    for i in range(repos):
+        name = f"repo-{i:04d}"
+        state_file = os.path.join(workdir, "state", f"{name}_state.json")
+        # Start from the server's current state so only new changes trigger builds
+        with open(state_file, "w") as f:
+            json.dump(initial[f"bench/{name}"], f)
+        configs.append({"owner": "bench", "repo": name, "check_interval": interval, "branch": "main",
+                        "state_file": state_file, "log_file": os.path.join(workdir, "log", f"{name}.log"),
+                        "repo_url": f"{server}/bench/{name}", "git_mirror": False, "artifact_cache": False,
+                        "warm_pipeline": False,
+                        # Trigger latency is measured without the commit quiet period
+                        "commit_debounce": 0})
+    os.makedirs(os.path.join(workdir, "log"), exist_ok=True)
+
+    builds = build_executor.BuildExecutor(monitor.trigger_pipeline, workers=build_workers,
+                                          queue=JobQueue(os.path.join(workdir, "state", "jobs.db")), store=store)
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.time()
+    if mode == "threads":
+        for config in configs:
+            threading.Thread(target=monitor.monitor_single_repo, args=(config, builds), daemon=True).start()
+    elif mode == "async":
+        from async_monitor import run_async
+        threading.Thread(target=run_async, args=(configs, builds), daemon=True).start()
+    else:
+        from graphql_poller import BatchedWatcher
+        threading.Thread(target=BatchedWatcher(configs, builds).run, daemon=True).start()
+
+    time.sleep(duration)
+    ended = time.time()
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    threads = threading.active_count()
+    state = _fetch_state(server)
+
+    # Changes older than one base interval had a fair chance to be seen
+    changes = {(c["repo"], c["value"]): c["time"] for c in state["changes"] if c["time"] <= ended - interval}
+    detected = []
+    for event in store.events(limit=1_000_000):
+        changed = changes.get((event["repo"], event["value"]))
+        if changed is not None:
+            detected.append(event["detected"] - changed)
+    triggered = []
+    with stub.lock:
+        for exporter, value, when in stub.triggered:
+            changed = changes.get((f"bench/{exporter}", value))
+            if changed is not None:
+                triggered.append(when - changed)
+
+    requests = state["requests"]
+    calls = sum(n for key, n in requests.items() if not key.startswith("unknown"))
+    checks = sum(POLLS.values.values())
+    cycles = checks / repos if checks else 0
+    poll_count = sum(entry[2] for entry in POLL_DURATION.values.values())
+    poll_sum = sum(entry[1] for entry in POLL_DURATION.values.values())
+    cpu = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    build_stats = builds.stats()
+
+    return {
+        "repos": repos,
+        "mode": mode,
+        "duration": round(ended - started, 1),
+        "api": {
+            "calls": calls,
+            "calls_per_cycle": round(calls / cycles, 2) if cycles else None,
+            "cycles": round(cycles, 2),
+            "not_modified": sum(n for key, n in requests.items() if key.endswith(" 304")),
+            "rate_limited": sum(n for key, n in requests.items() if key.endswith(" 403")),
+            "by_endpoint": requests,
+        },
+        "changes": {"made": len(changes), "detected": len(detected)},
+        "detection_latency": _percentiles(detected),
+        "trigger_latency": _percentiles(triggered),
+        "poll_duration_mean": round(poll_sum / poll_count, 4) if poll_count else None,
+        "builds": {"started": len(stub.triggered), "completed": build_stats["completed"],
+                   "failed": build_stats["failed"], "queued": build_stats["queue_depth"],
+                   "avg_wait": build_stats["avg_wait"], "max_wait": build_stats["max_wait"]},
+        "process": {
+            "cpu_seconds": round(cpu, 2),
+            "cpu_percent": round(100 * cpu / (ended - started), 1),
+            "rss_peak_mb": round(usage_end.ru_maxrss / 1024, 1),
+            "rss_end_mb": round(_rss_mb(), 1),
+            "threads": threads,
+        },
+    }
+
+def child_main(args):
+    # Keep anything the watchers print out of the way for good:
+    # their threads keep running until os._exit()
+    sys.stdout = open(os.devnull, "w")
+    # Repo loggers log every poll at INFO and propagate, only pass warnings on
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setLevel(logging.WARNING)
+    logging.getLogger().addHandler(handler)
+    workdir = tempfile.mkdtemp(prefix="repo-watcher-bench-")
+    try:
+        os.makedirs(os.path.join(workdir, "state"))
+        stub = StubRunner(args.build_duration, failure_rate=args.failure_rate)
+        result = run_watchers(args.server, args.run_one, args.mode, args.duration, args.interval,
+                              args.build_workers, stub, workdir)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        sys.stderr.flush()
+        # Watcher and build threads never return, do not wait for them
+        os._exit(0)
+
+# ───────── Orchestration ─────────
+
+def _raise_fd_limit():
+    # A watcher thread per repo keeps a log file and a connection open
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def run_scenario(repos, args):
+    server_cmd = [sys.executable, FAKE_GITHUB, "--repos", str(repos), "--change-rate", str(args.change_rate),
+                  "--release-ratio", str(args.release_ratio), "--tags-only", str(args.tags_only),
+                  "--latency", str(args.latency), "--rate-limit", str(args.rate_limit)]
+    if not args.etags:
+        server_cmd.append("--no-etags")
+    if args.seed is not None:
+        server_cmd += ["--seed", str(args.seed)]
+    server = subprocess.Popen(server_cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        url = server.stdout.readline().strip()
+        if not url:
+            raise RuntimeError("fake GitHub server did not start")
+        with tempfile.NamedTemporaryFile(suffix=".json") as result_file:
+            child = [sys.executable, os.path.abspath(__file__), "--run-one", str(repos), "--server", url,
+                     "--result-file", result_file.name, "--mode", args.mode, "--duration", str(args.duration),
+                     "--interval", str(args.interval), "--build-workers", str(args.build_workers),
+                     "--build-duration", str(args.build_duration), "--failure-rate", str(args.failure_rate)]
+            subprocess.run(child, check=True, timeout=args.duration + 120 + STARTUP_TIMEOUT)
+            with open(result_file.name) as f:
+                return json.load(f)
+    finally:
+        server.terminate()
+        server.wait()
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "-C", REPO_ROOT, "rev-parse", "--short", "HEAD"], text=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip() or None
+    except OSError:
+        return None
+
+def _lookup(result, path):
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+def compare(results, baseline, tolerance):
+    """Print metric changes against a baseline result file; returns the regressions."""
+    old = {(s["repos"], s["mode"]): s for s in baseline.get("scenarios", [])}
+    regressions = []
+    for scenario in results["scenarios"]:
+        before = old.get((scenario["repos"], scenario["mode"]))
+        if before is None:
+            print(f"[INFO] {scenario['repos']} repos ({scenario['mode']}): not in the baseline")
+            continue
+        print(f"[INFO] {scenario['repos']} repos ({scenario['mode']}) against {baseline.get('commit') or 'baseline'}:")
+        for path, label in COMPARED:
+            new_value, old_value = _lookup(scenario, path), _lookup(before, path)
+            if new_value is None or old_value is None:
+                continue
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            worse = change > tolerance
+            if worse:
+                regressions.append((scenario["repos"], label, old_value, new_value))
+            print(f" {'!' if worse else '-'} {label:<28} {old_value:>10} -> {new_value:<10} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the watchers against a fake GitHub API")
+    parser.add_argument("--repos", type=int, nargs="+", default=list(DEFAULT_SCENARIOS), help="Scenarios to run, by repo count")
+    parser.add_argument("--mode", choices=MODES, default="threads", help="Watcher engine to benchmark")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run each scenario")
+    parser.add_argument("--interval", type=float, default=10, help="check_interval of every fake repo")
+    parser.add_argument("--change-rate", type=float, default=60, help="New commits per repo per hour")
+    parser.add_argument("--release-ratio", type=float, default=0.1, help="Share of new commits that are also a release")
+    parser.add_argument("--tags-only", type=float, default=0.2, help="Share of repos with tags but no releases")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean API response latency in seconds")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="API requests per hour before 403s")
+    parser.add_argument("--no-etags", dest="etags", action="store_false", help="Fake server never answers 304")
+    parser.add_argument("--build-workers", type=int, default=4, help="Build workers of the watcher")
+    parser.add_argument("--build-duration", type=float, default=1.0, help="Mean seconds a stub build takes")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of stub builds that fail")
+    parser.add_argument("--seed", type=int, help="Seed for repeatable change patterns")
+    parser.add_argument("--output", "-o", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier results to compare against, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    # Internal: one scenario in a fresh process
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    _raise_fd_limit()
+    if args.run_one:
+        child_main(args)
+
+    results = {
+        "generated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": _git_commit(),
+        "host": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("repos", "output", "baseline", "run_one", "server", "result_file")},
+        "scenarios": [],
+    }
+    for repos in args.repos:
+        print(f"[INFO] Running {repos} repos ({args.mode}) for {args.duration:.0f}s...")
+        scenario = run_scenario(repos, args)
+        results["scenarios"].append(scenario)
+        print(f"[OK] {repos} repos: {scenario['api']['calls_per_cycle']} API calls/cycle, "
+              f"detection p95 {scenario['detection_latency']['p95']}s, trigger p95 {scenario['trigger_latency']['p95']}s, "
+              f"CPU {scenario['process']['cpu_percent']}%, peak RSS {scenario['process']['rss_peak_mb']} MiB")
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"[OK] Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[ERROR] {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("[OK] No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
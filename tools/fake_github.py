@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the GitHub API, used by tools/benchmark.py.
+
+Serves N fake repos (bench/repo-0000 ...) on the REST endpoints the
+watchers call (releases/latest, tags, commits) and on /graphql, with:
+  - a new commit on every repo at a configurable rate, some of them releases
+  - ETags and 304 answers to conditional requests
+  - X-RateLimit-* headers and a 403 once the quota is spent
+  - configurable response latency
+  - release assets (a linux-amd64 tarball and sha256sums.txt per release)
+    with Range support and optional cut-off downloads
+  - optionally a 502 for GraphQL queries over a number of repos, like
+    GitHub's answer to a query too expensive to finish
+
+GET /_bench/state returns the request counts and every change made, with
+the time it was made, so detection latency can be measured.
+"""
+
+import io
+import re
+import sys
+import json
+import time
+import random
+import tarfile
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OWNER = "bench"
+CHANGE_TICK = 0.25
+GRAPHQL_REPO = re.compile(r'(r\d+): repository\(owner: "([^"]*)", name: "([^"]*)"\)')
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _sha(*parts):
+    return hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()
+
+class FakeRepo:
+    def __init__(self, name, tags_only):
+        now = time.time()
+        self.name = name
+        self.tags_only = tags_only
+        self.commits = 0
+        self.releases = 1
+        self.sha = _sha(name, 0)
+        self.commit_date = _iso(now)
+        self.tag = "v1.0.0"
+        self.release_date = _iso(now)
+        # (name, commit date) of tags besides the current one, e.g. backports
+        self.other_tags = []
+
+    def tags(self):
+        return [(self.tag, self.release_date)] + self.other_tags
+
+    def change(self, release):
+        self.commits += 1
+        self.sha = _sha(self.name, self.commits)
+        self.commit_date = _iso(time.time())
+        if release:
+            self.releases += 1
+            self.tag = f"v1.{self.releases - 1}.0"
+            self.release_date = self.commit_date
+
+class FakeGitHub:
+    """State shared by the request handlers and the change generator."""
+
+    def __init__(self, repos=10, change_rate=60, release_ratio=0.1, tags_only=0.2, latency=0.05,
+                 rate_limit=5000, rate_window=3600, etags=True, seed=None, asset_size=1024 ** 2, asset_failure=0.0,
+                 graphql_max_repos=None):
+        self.rng = random.Random(seed)
+        self.repos = {f"{OWNER}/repo-{i:04d}": None for i in range(repos)}
+        for name in self.repos:
+            self.repos[name] = FakeRepo(name, self.rng.random() < tags_only)
+        # changes per repo per hour -> probability per tick
+        self.change_probability = change_rate / 3600 * CHANGE_TICK
+        self.release_ratio = release_ratio
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.etags = etags
+        self.asset_size = asset_size
+        self.asset_failure = asset_failure
+        self.graphql_max_repos = graphql_max_repos
+        self.assets = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.spent = {"core": 0, "graphql": 0}
+        self.windows = {"core": 0, "graphql": 0}
+        self.requests = {}
+        self.changes = []
+
+    # ───────── Change generator ─────────
+
+    def run_changes(self):
+        while True:
+            time.sleep(CHANGE_TICK)
+            with self.lock:
+                for repo in self.repos.values():
+                    if self.rng.random() >= self.change_probability:
+                        continue
+                    release = self.rng.random() < self.release_ratio
+                    repo.change(release)
+                    now = time.time()
+                    self.changes.append({"repo": repo.name, "type": "commit", "value": repo.sha, "time": now})
+                    if release:
+                        self.changes.append({"repo": repo.name, "type": "tag" if repo.tags_only else "release",
+                                             "value": repo.tag, "time": now})
+
+    # ───────── Accounting ─────────
+
+    def count(self, endpoint, status):
+        key = f"{endpoint} {status}"
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def charge(self, resource):
+        """(rate-limit headers, allowed) for one request against a quota."""
+        now = time.time()
+        window = int((now - self.started) // self.rate_window)
+        reset = int(self.started + (window + 1) * self.rate_window)
+        with self.lock:
+            if self.windows[resource] != window:
+                self.spent[resource] = 0
+                self.windows[resource] = window
+            allowed = self.spent[resource] < self.rate_limit
+            if allowed:
+                self.spent[resource] += 1
+            remaining = self.rate_limit - self.spent[resource]
+        headers = {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": str(remaining),
+                   "X-RateLimit-Reset": str(reset), "X-RateLimit-Resource": resource}
+        return headers, allowed
+
+    def refund(self, resource):
+        # Conditional requests answered with 304 do not count against the quota
+        with self.lock:
+            self.spent[resource] = max(0, self.spent[resource] - 1)
+
+    def state(self):
+        with self.lock:
+            return {"repos": len(self.repos), "requests": dict(self.requests), "changes": list(self.changes),
+                    "initial": {name: {"latest_release": "v1.0.0", "latest_commit": _sha(name, 0)}
+                                for name in self.repos}}
+
+    def release_assets(self, repo, tag):
+        """{name: bytes} of a release: a tarball with the binary, and its sums file."""
+        key = (repo.name, tag)
+        with self.lock:
+            if key not in self.assets:
+                short = repo.name.split("/")[1]
+                folder = f"{short}-{tag.lstrip('v')}.linux-amd64"
+                # Incompressible, so the tarball is about asset_size
+                binary = b"#!/bin/sh\n# " + tag.encode() + b"\nexit 0\n" + random.Random(f"{short}:{tag}").randbytes(self.asset_size)
+                data = io.BytesIO()
+                with tarfile.open(fileobj=data, mode="w:gz") as tar:
+                    for name, content in ((short, binary), ("LICENSE", b"Apache-2.0\n")):
+                        info = tarfile.TarInfo(f"{folder}/{name}")
+                        info.size, info.mode, info.mtime = len(content), 0o755, 0
+                        tar.addfile(info, io.BytesIO(content))
+                tarball = data.getvalue()
+                sums = f"{hashlib.sha256(tarball).hexdigest()}  {folder}.tar.gz\n".encode()
+                self.assets[key] = {f"{folder}.tar.gz": tarball, "sha256sums.txt": sums}
+            return self.assets[key]
+
+    def pause(self):
+        if self.latency:
+            # Exponential around the mean, like real API latency with its long tail
+            time.sleep(self.rng.expovariate(1 / self.latency))
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            # Watchers drop keep-alive connections when they stop or give up on a slow request
+            self.close_connection = True
+
+    def send_json(self, status, body, headers=None, endpoint=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        headers = dict(headers or {})
+        if status == 200 and endpoint and self.fake.etags:
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+                self.fake.refund(headers.get("X-RateLimit-Resource", "core"))
+        if endpoint:
+            self.fake.count(endpoint, status)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/_bench/state":
+            self.send_json(200, self.fake.state())
+            return
+        if url.path.startswith("/_assets/"):
+            self.send_asset(url.path)
+            return
+        self.fake.pause()
+        match = re.fullmatch(r"/repos/([^/]+)/([^/]+)/(releases/latest|releases/tags/[^/]+|tags|commits)", url.path)
+        repo = self.fake.repos.get(f"{match.group(1)}/{match.group(2)}".lower()) if match else None
+        if repo is None:
+            self.send_json(404, {"message": "Not Found"}, endpoint="unknown")
+            return
+        endpoint = match.group(3)
+        if endpoint.startswith("releases/tags/"):
+            tag, endpoint = endpoint[len("releases/tags/"):], "releases/tags"
+        headers, allowed = self.fake.charge("core")
+        if not allowed:
+            self.send_json(403, {"message": "API rate limit exceeded"}, headers, endpoint)
+            return
+        with self.fake.lock:
+            if endpoint == "releases/latest":
+                body = None if repo.tags_only else {"tag_name": repo.tag, "published_at": repo.release_date}
+            elif endpoint == "releases/tags":
+                body = None if repo.tags_only or tag != repo.tag else {"tag_name": repo.tag,
+                                                                      "published_at": repo.release_date}
+            elif endpoint == "tags":
+                # GitHub lists tags by name, not by date
+                body = [{"name": name} for name, _ in sorted(repo.tags(), reverse=True)]
+            else:
+                per_page = int(parse_qs(url.query).get("per_page", ["30"])[0])
+                body = [{"sha": repo.sha, "commit": {"committer": {"date": repo.commit_date}}}][:per_page]
+        if body is None:
+            self.send_json(404, {"message": "Not Found"}, headers, endpoint)
+        elif endpoint == "releases/tags":
+            base = f"http://{self.headers['Host']}/_assets/{repo.name}/{tag}"
+            body["assets"] = [{"name": name, "size": len(data), "browser_download_url": f"{base}/{name}"}
+                              for name, data in self.fake.release_assets(repo, tag).items()]
+            self.send_json(200, body, headers, endpoint)
+        else:
+            self.send_json(200, body, headers, endpoint)
+
+    def send_asset(self, path):
+        # Downloads do not count against the API rate limit
+        parts = path.split("/")
+        repo = self.fake.repos.get(f"{parts[2]}/{parts[3]}".lower()) if len(parts) == 6 else None
+        data = self.fake.release_assets(repo, parts[4]).get(parts[5]) if repo else None
+        if data is None:
+            self.send_json(404, {"message": "Not Found"})
+            return
+        self.fake.count("assets", 200)
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        with self.fake.lock:
+            cut = self.fake.rng.random() < self.fake.asset_failure
+        if cut:
+            # Drop the connection halfway, the client has to resume
+            self.wfile.write(data[start:start + (len(data) - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if urlsplit(self.path).path != "/graphql":
+            self.send_json(404, {"message": "Not Found"})
+            return
+        self.fake.pause()
+        aliases = GRAPHQL_REPO.findall(payload.get("query", ""))
+        if self.fake.graphql_max_repos is not None and len(aliases) > self.fake.graphql_max_repos:
+            self.send_json(502, {"message": "Server Error"}, endpoint="graphql")
+            return
+        headers, allowed = self.fake.charge("graphql")
+        if not allowed:
+            self.send_json(403, {"message": "API rate limit exceeded"}, headers, "graphql")
+            return
+        data = {}
+        with self.fake.lock:
+            for alias, owner, name in aliases:
+                repo = self.fake.repos.get(f"{owner}/{name}".lower())
+                if repo is None:
+                    data[alias] = None
+                    continue
+                data[alias] = {
+                    "latestRelease": None if repo.tags_only else {"tagName": repo.tag, "publishedAt": repo.release_date},
+                    # Newest commit first, whatever orderBy asked for: callers must not rely on the order
+                    "refs": {"nodes": [{"name": name} for name, _ in sorted(repo.tags(), key=lambda t: t[1],
+                                                                            reverse=True)]},
+                    "ref": {"target": {"oid": repo.sha, "committedDate": repo.commit_date}},
+                }
+        rate = {"cost": 1, "limit": self.fake.rate_limit, "remaining": int(headers["X-RateLimit-Remaining"]),
+                "resetAt": _iso(int(headers["X-RateLimit-Reset"]))}
+        data["rateLimit"] = rate
+        # GraphQL has no conditional requests, every answer is a full 200
+        self.fake.count("graphql", 200)
+        body = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(fake, port=0, addr="127.0.0.1"):
+    """Start the server and the change generator on daemon threads; returns the server."""
+    handler = type("Handler", (_Handler, ), {"fake": fake})
+    server = ThreadingHTTPServer((addr, port), handler)
+    server.daemon_threads = True
+    # Enough backlog for a thousand watchers starting at once
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, name="fake-github", daemon=True).start()
+    threading.Thread(target=fake.run_changes, name="fake-github-changes", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake GitHub API for offline benchmarks")
+    parser.add_argument("--repos", type=int, default=10, help="Number of fake repos")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on, 0 picks a free one")
+    parser.add_argument("--change-rate", type=float, default=60, help="New commits per repo per hour")
+    parser.add_argument("--release-ratio", type=float, default=0.1, help="Share of new commits that are also a release")
+    parser.add_argument("--tags-only", type=float, default=0.2, help="Share of repos without releases, only tags")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean response latency in seconds")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Requests per rate-limit window")
+    parser.add_argument("--rate-window", type=int, default=3600, help="Seconds until the rate limit resets")
+    parser.add_argument("--no-etags", dest="etags", action="store_false", help="Never answer with 304")
+    parser.add_argument("--seed", type=int, help="Seed for repeatable change patterns")
+    parser.add_argument("--asset-size", type=int, default=1024 ** 2, help="Bytes of the fake binary in each release tarball")
+    parser.add_argument("--asset-failure", type=float, default=0.0, help="Share of asset downloads cut off halfway")
+    parser.add_argument("--graphql-max-repos", type=int, help="Answer GraphQL queries over more repos with a 502")
+    args = parser.parse_args()
+
+    fake = FakeGitHub(repos=args.repos, change_rate=args.change_rate, release_ratio=args.release_ratio,
+                      tags_only=args.tags_only, latency=args.latency, rate_limit=args.rate_limit,
+                      rate_window=args.rate_window, etags=args.etags, seed=args.seed,
+                      asset_size=args.asset_size, asset_failure=args.asset_failure,
+                      graphql_max_repos=args.graphql_max_repos)
+    server = serve(fake, args.port)
+    # The benchmark reads the URL from the first line
+    print(f"http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -5,6 +5,7 @@ import argparse
 STATE_DIR = "/opt/repo-watcher/state"
 LOG_DIR = "/opt/repo-watcher/log"
 REPOCTL_LOG_FILE = os.path.join(LOG_DIR, "repoctl.log")
+STATE_DB = os.path.join(STATE_DIR, "state.db")
 
 def reset_state(confirm=True):
     """
@@ -12,14 +13,16 @@ def reset_state(confirm=True):
     
     This deletes:
     1. All .json files in the state directory
-    2. All .log files in the log directory
-    3. The repoctl.log file specifically
+    2. The state store (cursors, event and build history)
+    3. All .log files in the log directory, rotated ones included
+    4. The repoctl.log file specifically
     """
     # Collect state files
     state_files = glob.glob(os.path.join(STATE_DIR, "*.json"))
+    state_files += [path for path in (STATE_DB, f"{STATE_DB}-wal", f"{STATE_DB}-shm") if os.path.exists(path)]
     
     # Collect log files
-    log_files = glob.glob(os.path.join(LOG_DIR, "*.log"))
+    log_files = glob.glob(os.path.join(LOG_DIR, "*.log")) + glob.glob(os.path.join(LOG_DIR, "*.log.[0-9]*"))
     
     # Create a dictionary of files to delete
     files_to_delete = {
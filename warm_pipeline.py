@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+# Facts older than this are gathered again, also in warm mode
+FACT_CACHE_TIMEOUT = 86400
+# Task files with the setup steps a warm build skips, relative to the pipeline dir
+SETUP_FILES = ("roles/common/tasks/main.yml", "roles/{exporter}/tasks/main.yml",
+               "roles/package-builder/tasks/main.yml", "inventory/group_vars/all.yml")
+# Host state those steps change or depend on: installed packages, users and groups
+HOST_FILES = ("/var/lib/dpkg/status", "/etc/passwd", "/etc/group")
+SETUP_VARS = ("exporter_name", "service_user", "service_group")
+
+class WarmPipeline:
+    """
+    What a warm build reuses from the builds before it: a persistent
+    jsonfile fact cache, and per exporter the fingerprint of the setup
+    inputs after its last successful build.
+
+    A build whose fingerprint still matches runs with setup_warm=true, and
+    the roles skip the apt installs, the service user and the service
+    directories. A failed build forgets the fingerprint, so the next one
+    runs the setup again. Cached facts can be a day old, so the roles take
+    the build date from the build_date/build_time extravars instead.
+    """
+
+    def __init__(self, pipeline_dir):
+        self.pipeline_dir = pipeline_dir
+        self.dir = os.path.join(pipeline_dir, "warm")
+        self.fact_cache = os.path.join(self.dir, "facts")
+        self.path = os.path.join(self.dir, "fingerprints.json")
+        self.lock = threading.Lock()
+
+    def fingerprint(self, exporter, extravars):
+        h = hashlib.sha256()
+        for name in SETUP_FILES:
+            name = name.format(exporter=exporter)
+            h.update(name.encode())
+            try:
+                with open(os.path.join(self.pipeline_dir, name), "rb") as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+            except FileNotFoundError:
+                h.update(b"missing")
+        for path in HOST_FILES:
+            try:
+                st = os.stat(path)
+                h.update(f"{path}:{st.st_mtime_ns}:{st.st_size}".encode())
+            except FileNotFoundError:
+                h.update(f"{path}:missing".encode())
+        h.update(json.dumps({k: extravars.get(k) for k in SETUP_VARS}, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable setup fingerprints {self.path}: {e}")
+            return {}
+
+    def is_warm(self, exporter, extravars):
+        """Whether the setup of exporter is unchanged since its last successful build."""
+        with self.lock:
+            return self._load().get(exporter) == self.fingerprint(exporter, extravars)
+
+    def record(self, exporter, extravars, success):
+        """After a build: remember the setup as done, or forget it after a failure."""
+        with self.lock:
+            fingerprints = self._load()
+            if success:
+                fingerprints[exporter] = self.fingerprint(exporter, extravars)
+            elif fingerprints.pop(exporter, None) is None:
+                return
+            os.makedirs(self.dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(fingerprints, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def runner_options(self):
+        """ansible_runner.run() arguments for a fact cache that outlives the run's private_data_dir."""
+        os.makedirs(self.fact_cache, exist_ok=True)
+        return {
+            # ansible_runner joins this to the run's artifact dir, an absolute path stays as it is
+            "fact_cache": self.fact_cache,
+            "fact_cache_type": "jsonfile",
+            "envvars": {"ANSIBLE_GATHERING": "smart", "ANSIBLE_CACHE_PLUGIN_TIMEOUT": str(FACT_CACHE_TIMEOUT)},
+        }
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import os
+import hmac
+import json
+import uuid
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from state_store import get_state_store
+from metrics import WEBHOOKS
+
+try:
+    from github_config import WEBHOOK_SECRET
+except ImportError:
+    WEBHOOK_SECRET = os.environ.get("GITHUB_WEBHOOK_SECRET", "")
+
+EVENTS = ("push", "release", "create")
+# With webhooks, polling only catches missed deliveries
+RECONCILE_INTERVAL = 1800
+# GitHub caps payloads at 25 MB
+MAX_BODY = 25 * 1024 ** 2
+
+def sign(secret, body):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(secret, body, signature):
+    """Constant-time check of an X-Hub-Signature-256 header."""
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign(secret, body), signature)
+
+class WebhookReceiver:
+    """
+    Accepts GitHub push, release and create (tag) deliveries and hands them
+    to the watcher of the repo they are about.
+
+    Deliveries are checked against the shared secret and deduplicated by
+    X-GitHub-Delivery in the state store, so a redelivery never queues a
+    second build. A delivery whose handling fails is forgotten again, so a
+    redelivery retries it. GitHub gets its answer before the delivery is
+    processed.
+    """
+
+    def __init__(self, secret=WEBHOOK_SECRET, store=None, reconcile_interval=RECONCILE_INTERVAL):
+        if not secret:
+            raise ValueError("a webhook secret is required (GITHUB_WEBHOOK_SECRET or github_config.WEBHOOK_SECRET)")
+        self.secret = secret
+        self.store = store or get_state_store()
+        self.reconcile_interval = reconcile_interval
+        self.lock = threading.Lock()
+        self.handlers = {}
+
+    def register(self, repo, handler):
+        """handler(event, payload) is called for every new delivery about repo (owner/repo)."""
+        with self.lock:
+            self.handlers[repo.lower()] = handler
+
+    def unregister(self, repo, handler=None):
+        """Drop the handler of repo. With handler, only if it is still the registered one."""
+        with self.lock:
+            if handler is None or self.handlers.get(repo.lower()) is handler:
+                self.handlers.pop(repo.lower(), None)
+
+    def poll_interval(self, config):
+        """Poll interval of a repo that also gets webhooks."""
+        return max(config["check_interval"], config.get("reconcile_interval", self.reconcile_interval))
+
+    def receive(self, headers, body):
+        """
+        Check one delivery. Returns (HTTP status, message, work), where work
+        is None or a callable that processes the delivery.
+        """
+        event = headers.get("X-GitHub-Event", "")
+        if not verify_signature(self.secret, body, headers.get("X-Hub-Signature-256")):
+            logging.warning(f"[Webhook] Rejected {event or 'unknown'} delivery with a bad signature")
+            WEBHOOKS.inc(event or "unknown", "bad_signature")
+            return 401, "bad signature", None
+        if event == "ping":
+            return 200, "pong", None
+        if event not in EVENTS:
+            WEBHOOKS.inc(event or "unknown", "ignored")
+            return 202, f"ignoring {event} events", None
+
+        try:
+            payload = json.loads(body)
+            repo = payload["repository"]["full_name"].lower()
+        except (ValueError, KeyError, TypeError):
+            WEBHOOKS.inc(event, "invalid")
+            return 400, "invalid payload", None
+        with self.lock:
+            handler = self.handlers.get(repo)
+        if handler is None:
+            WEBHOOKS.inc(event, "ignored")
+            return 202, f"{repo} is not watched", None
+
+        delivery = headers.get("X-GitHub-Delivery")
+        if delivery and not self.store.record_delivery(delivery, event, repo):
+            WEBHOOKS.inc(event, "duplicate")
+            return 200, "duplicate delivery", None
+
+        def work():
+            try:
+                outcome = handler(event, payload)
+            except Exception as e:
+                logging.error(f"[Webhook] [{repo}] Handling {event} delivery {delivery} failed: {e}")
+                outcome = "error"
+            if outcome == "error" and delivery:
+                self.store.forget_delivery(delivery)
+            WEBHOOKS.inc(event, outcome)
+        return 202, "accepted", work
+
+    def start(self, port, addr="0.0.0.0"):
+        """Serve deliveries on POST (any path) from a daemon thread."""
+        handler = type("Handler", (_Handler, ), {"receiver": self})
+        server = ThreadingHTTPServer((addr, port), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="webhooks", daemon=True).start()
+        logging.info(f"Receiving GitHub webhooks on http://{addr}:{port}/")
+        return server
+
+class _Handler(BaseHTTPRequestHandler):
+    receiver = None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.reply(413, "payload too large")
+            return
+        status, message, work = self.receiver.receive(self.headers, self.rfile.read(length))
+        self.reply(status, message)
+        if work:
+            work()
+
+    def reply(self, status, message):
+        body = (message + "\n").encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+# ───────── Test deliveries ─────────
+
+def sample_payload(event, repo, value, branch="main"):
+    """Smallest payload the watcher reads for each event type."""
+    repository = {"full_name": repo}
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    if event == "push":
+        return {"ref": f"refs/heads/{branch}", "after": value, "deleted": False,
+                "head_commit": {"id": value, "timestamp": now}, "repository": repository}
+    if event == "release":
+        return {"action": "published", "repository": repository,
+                "release": {"tag_name": value, "published_at": now, "draft": False, "prerelease": False}}
+    return {"ref": value, "ref_type": "tag", "repository": repository}
+
+def send(url, secret, event, payload, delivery=None):
+    """POST a locally signed delivery, the way GitHub would. Returns (status, message)."""
+    body = json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "X-GitHub-Event": event,
+        "X-GitHub-Delivery": delivery or str(uuid.uuid4()),
+        "X-Hub-Signature-256": sign(secret, body),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=10) as r:
+            return r.status, r.read().decode().strip()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode().strip()
+
+# ───────── CLI ENTRY POINT ─────────
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a signed test delivery to a running webhook receiver")
+    parser.add_argument("event", choices=EVENTS, help="Event to simulate")
+    parser.add_argument("repo", help="owner/repo the delivery is about")
+    parser.add_argument("value", help="Commit sha (push), release tag (release) or tag name (create)")
+    parser.add_argument("--url", default="http://127.0.0.1:9106/", help="Webhook receiver URL")
+    parser.add_argument("--branch", default="main", help="Branch of a push")
+    parser.add_argument("--delivery", help="Delivery id, reuse one to test deduplication")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET, help="Shared secret to sign with")
+    args = parser.parse_args()
+
+    status, message = send(args.url, args.secret, args.event,
+                           sample_payload(args.event, args.repo, args.value, args.branch), args.delivery)
+    print(f"[{'OK' if status < 300 else 'ERROR'}] {status} {message}")